@@ -0,0 +1,103 @@
+"""
+Links computation from the results table, with the per-flow map (the default)
+and with window functions (`GetLinksFromResults(window_functions=True)`):
+
+    python benchmarks/links_window.py --flows 10000000
+
+The memory usage is read from `system.query_log`, if it is enabled on the server.
+"""
+import argparse
+import logging
+import time
+from uuid import uuid4
+
+from pych_client import ClickHouseClient
+from pych_client.exceptions import ClickHouseException
+
+from diamond_miner.queries import (
+    CreateTables,
+    DropTables,
+    GetLinksFromResults,
+    results_table,
+)
+
+INSERT_SYNTHETIC_RESULTS = """
+INSERT INTO {table} (
+    probe_protocol, probe_src_addr, probe_dst_addr, probe_src_port, probe_dst_port,
+    probe_ttl, reply_src_addr, reply_protocol, reply_icmp_type, round
+)
+SELECT
+    1 AS probe_protocol,
+    toIPv6('::ffff:10.0.0.1') AS probe_src_addr,
+    toIPv6(IPv4NumToString(toUInt32(16777216 + intDiv(number, {ttls})))) AS probe_dst_addr,
+    24000 AS probe_src_port,
+    33434 AS probe_dst_port,
+    number % {ttls} + 1 AS probe_ttl,
+    toIPv6(IPv4NumToString(toUInt32(184549376 + cityHash64(number) % 65536))) AS reply_src_addr,
+    1 AS reply_protocol,
+    11 AS reply_icmp_type,
+    1 AS round
+FROM numbers({rows})
+-- Drop some replies to generate partial links.
+WHERE cityHash64(number, 1) % 10 != 0
+"""
+
+
+def run(
+    client: ClickHouseClient, measurement_id: str, query: GetLinksFromResults
+) -> tuple[int, float, int | None]:
+    comment = str(uuid4())
+    start = time.perf_counter()
+    rows = client.json(
+        f"SELECT count() AS links FROM ({query.statement(measurement_id)})",
+        settings={"log_comment": comment},
+    )
+    elapsed = time.perf_counter() - start
+    try:
+        client.text("SYSTEM FLUSH LOGS")
+        memory = client.json(
+            f"""
+            SELECT memory_usage
+            FROM system.query_log
+            WHERE log_comment = '{comment}' AND type = 'QueryFinish'
+            """
+        )[0]["memory_usage"]
+    except (ClickHouseException, IndexError):
+        memory = None
+    return rows[0]["links"], elapsed, memory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8123")
+    parser.add_argument("--flows", type=int, default=10_000_000)
+    parser.add_argument("--ttls", type=int, default=30)
+    args = parser.parse_args()
+
+    measurement_id = "benchmark_links_window"
+    with ClickHouseClient(args.url) as client:
+        DropTables().execute(client, measurement_id)
+        CreateTables().execute(client, measurement_id)
+        client.text(
+            INSERT_SYNTHETIC_RESULTS.format(
+                table=results_table(measurement_id),
+                ttls=args.ttls,
+                rows=args.flows * args.ttls,
+            )
+        )
+        for window_functions in (False, True):
+            query = GetLinksFromResults(
+                ignore_invalid_prefixes=False, window_functions=window_functions
+            )
+            links, elapsed, memory = run(client, measurement_id, query)
+            memory_str = f"{memory / 2**20:.0f}MiB" if memory is not None else "n/a"
+            print(
+                f"window_functions={window_functions} links={links} "
+                f"time={elapsed:.3f}s ({args.flows / elapsed:,.0f} flows/s) memory={memory_str}"
+            )
+        DropTables().execute(client, measurement_id)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
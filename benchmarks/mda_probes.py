@@ -0,0 +1,54 @@
+"""
+Number of probes computed by the Diamond-Miner algorithm, with and without the
+`dminer_lite` heuristic, for each round of a measurement:
+
+    python benchmarks/mda_probes.py --measurement-id test_nsdi_example --rounds 3
+"""
+import argparse
+import logging
+import time
+
+from pych_client import ClickHouseClient
+
+from diamond_miner.queries import GetMDAProbes
+
+
+def total_probes(rows: list[dict]) -> int:
+    return sum(sum(row["cumulative_probes"]) for row in rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8123")
+    parser.add_argument("--measurement-id", default="test_nsdi_example")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    print("round  lite_probes  full_probes  lite_time_s  full_time_s")
+    with ClickHouseClient(args.url) as client:
+        for round_ in range(1, args.rounds + 1):
+            results = {}
+            for dminer_lite in (True, False):
+                start = time.perf_counter()
+                rows = GetMDAProbes(round_leq=round_, dminer_lite=dminer_lite).execute(
+                    client, args.measurement_id
+                )
+                results[dminer_lite] = (
+                    total_probes(rows),
+                    time.perf_counter() - start,
+                )
+                logging.info(
+                    "round=%s dminer_lite=%s probes=%s time_s=%.3f",
+                    round_,
+                    dminer_lite,
+                    *results[dminer_lite],
+                )
+            print(
+                f"{round_:>5}  {results[True][0]:>11}  {results[False][0]:>11}"
+                f"  {results[True][1]:>11.3f}  {results[False][1]:>11.3f}"
+            )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
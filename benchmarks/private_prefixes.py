@@ -0,0 +1,66 @@
+"""
+Insertion throughput in the results table, with the private addresses classified
+with range comparisons (the default) or with the `ip_trie` dictionary:
+
+    python benchmarks/private_prefixes.py --rows 100000000
+"""
+import argparse
+import logging
+import time
+
+from pych_client import ClickHouseClient
+
+from diamond_miner.queries import CreateTables, DropTables, results_table
+
+INSERT_SYNTHETIC_RESULTS = """
+INSERT INTO {table} (probe_protocol, probe_dst_addr, probe_ttl, reply_src_addr, round)
+SELECT
+    1 AS probe_protocol,
+    toIPv6(IPv4NumToString(toUInt32(cityHash64(number, 1) % 4294967296))) AS probe_dst_addr,
+    number % 32 AS probe_ttl,
+    toIPv6(IPv4NumToString(toUInt32(cityHash64(number, 2) % 4294967296))) AS reply_src_addr,
+    1 AS round
+FROM numbers({rows})
+"""
+
+
+def insert_time(client: ClickHouseClient, measurement_id: str, rows: int) -> float:
+    start = time.perf_counter()
+    client.text(
+        INSERT_SYNTHETIC_RESULTS.format(table=results_table(measurement_id), rows=rows)
+    )
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8123")
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    args = parser.parse_args()
+
+    with ClickHouseClient(args.url) as client:
+        results = {}
+        for from_dictionary in (False, True):
+            measurement_id = f"benchmark_private_prefixes_{int(from_dictionary)}"
+            DropTables().execute(client, measurement_id)
+            CreateTables(private_prefixes_from_dictionary=from_dictionary).execute(
+                client, measurement_id
+            )
+            results[from_dictionary] = insert_time(client, measurement_id, args.rows)
+            logging.info(
+                "private_prefixes_from_dictionary=%s rows=%s time_s=%.3f",
+                from_dictionary,
+                args.rows,
+                results[from_dictionary],
+            )
+            DropTables().execute(client, measurement_id)
+
+    print(f"rows={args.rows}")
+    for from_dictionary, label in ((False, "ranges:    "), (True, "dictionary:")):
+        rate = args.rows / results[from_dictionary]
+        print(f"{label} {results[from_dictionary]:.3f}s ({rate:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,94 @@
+"""
+Point lookups on the links table, with and without data-skipping indexes.
+
+Two links tables are filled with the same synthetic links, one created with
+`skip_indexes=True`, and the time to find the links of a given address is
+compared:
+
+    python benchmarks/skip_indexes.py --rows 1000000000
+"""
+import argparse
+import logging
+import time
+from statistics import median
+
+from pych_client import ClickHouseClient
+
+from diamond_miner.queries import CreateLinksTable, DropTables, GetLinks, links_table
+
+# The addresses are drawn from a /8 so that an address appears in a few links only.
+INSERT_SYNTHETIC_LINKS = """
+INSERT INTO {table}
+SELECT
+    1 AS probe_protocol,
+    toIPv6('::ffff:10.0.0.1') AS probe_src_addr,
+    toIPv6(IPv4NumToString(toUInt32(intDiv(number, 256) * 256))) AS probe_dst_prefix,
+    toIPv6(IPv4NumToString(toUInt32(number))) AS probe_dst_addr,
+    24000 AS probe_src_port,
+    33434 AS probe_dst_port,
+    1 AS near_round,
+    1 AS far_round,
+    number % 32 AS near_ttl,
+    number % 32 + 1 AS far_ttl,
+    toIPv6(IPv4NumToString(toUInt32(184549376 + cityHash64(number, 1) % 16777216))) AS near_addr,
+    toIPv6(IPv4NumToString(toUInt32(184549376 + cityHash64(number, 2) % 16777216))) AS far_addr
+FROM numbers({rows})
+"""
+
+
+def lookup_time(
+    client: ClickHouseClient, measurement_id: str, addrs: list[str]
+) -> float:
+    # A different address is looked up each time, since recent ClickHouse versions
+    # cache the granules matching a condition (`use_query_condition_cache`).
+    times = []
+    for addr in addrs:
+        start = time.perf_counter()
+        GetLinks(near_or_far_addr=addr).execute(client, measurement_id)
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8123")
+    parser.add_argument("--rows", type=int, default=1_000_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with ClickHouseClient(args.url) as client:
+        results = {}
+        for skip_indexes in (False, True):
+            measurement_id = f"benchmark_skip_indexes_{int(skip_indexes)}"
+            DropTables().execute(client, measurement_id)
+            CreateLinksTable(skip_indexes=skip_indexes).execute(client, measurement_id)
+            client.text(
+                INSERT_SYNTHETIC_LINKS.format(
+                    table=links_table(measurement_id), rows=args.rows
+                )
+            )
+            client.text(f"OPTIMIZE TABLE {links_table(measurement_id)} FINAL")
+            addrs = [
+                row["near_addr"]
+                for row in client.json(
+                    f"SELECT near_addr FROM {links_table(measurement_id)} LIMIT {args.repeat}"
+                )
+            ]
+            results[skip_indexes] = lookup_time(client, measurement_id, addrs)
+            logging.info(
+                "skip_indexes=%s rows=%s median_time_s=%.3f",
+                skip_indexes,
+                args.rows,
+                results[skip_indexes],
+            )
+            DropTables().execute(client, measurement_id)
+
+    print(f"rows={args.rows}")
+    print(f"without indexes: {results[False]:.3f}s")
+    print(f"with indexes:    {results[True]:.3f}s")
+    print(f"speedup:         {results[False] / results[True]:.1f}x")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
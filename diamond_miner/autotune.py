@@ -0,0 +1,144 @@
+"""
+Choose the parallelism and memory parameters from the resources available to the process
+(cgroup CPU and memory limits, and `RLIMIT_NOFILE`).
+
+The parameters are computed once per process and used as defaults by
+`probe_generator_parallel`, `Query.execute_concurrent` and `insert_mda_probe_counts`.
+Set the `DIAMOND_MINER_AUTOTUNE_CALIBRATE` environment variable to `1` to measure
+the memory usage of a probe instead of using an estimate (see `autotune`).
+"""
+import os
+import random
+import tracemalloc
+from dataclasses import dataclass
+from functools import cache
+
+from diamond_miner.logger import logger
+from diamond_miner.utilities import available_cpus, available_memory, open_files_limit
+
+DEFAULT_BYTES_PER_PROBE = 200
+"""Estimated memory usage of a probe tuple held in memory by the parallel generator."""
+
+MEMORY_FRACTION = 0.5
+"""Fraction of the available memory that can be used to hold the probes in memory."""
+
+RESERVED_OPEN_FILES = 256
+"""Number of file descriptors reserved for the other uses (sockets, logs, ...)."""
+
+CALIBRATE_ENV = "DIAMOND_MINER_AUTOTUNE_CALIBRATE"
+"""Environment variable used as the default value of `autotune(calibrate=...)`."""
+
+
+@dataclass(frozen=True)
+class Tuning:
+    n_workers: int
+    "Number of processes used by `probe_generator_parallel`."
+    concurrent_requests: int
+    "Maximum number of queries executed concurrently by `Query.execute_concurrent`."
+    max_open_files: int
+    "Maximum number of files opened at the same time by `probe_generator_parallel`."
+    max_probes_in_memory: int
+    "Maximum number of probes held in memory by each worker before shuffling and writing them."
+
+
+def tune(
+    cpus: int,
+    memory: int | None,
+    open_files: int | None,
+    bytes_per_probe: int = DEFAULT_BYTES_PER_PROBE,
+) -> Tuning:
+    """
+    Compute the parameters for the given resources.
+
+    Args:
+        cpus: Number of CPUs available.
+        memory: Memory available, in bytes (`None` if unknown).
+        open_files: Maximum number of open files (`None` if unknown or unlimited).
+        bytes_per_probe: Memory usage of a probe, in bytes.
+
+    Examples:
+        >>> tune(cpus=128, memory=None, open_files=None)
+        Tuning(n_workers=16, concurrent_requests=16, max_open_files=8192, max_probes_in_memory=1000000)
+        >>> tune(cpus=2, memory=2 * 2**30, open_files=1024)
+        Tuning(n_workers=1, concurrent_requests=1, max_open_files=768, max_probes_in_memory=1000000)
+        >>> tune(cpus=16, memory=512 * 2**20, open_files=65536)
+        Tuning(n_workers=2, concurrent_requests=2, max_open_files=8192, max_probes_in_memory=671088)
+    """
+    # The ClickHouse server usually runs on the same host and
+    # needs most of the CPUs to execute the queries.
+    n_workers = max(cpus // 8, 1)
+    concurrent_requests = max(cpus // 8, 1)
+
+    max_open_files = 8192
+    if open_files is not None:
+        max_open_files = max(min(max_open_files, open_files - RESERVED_OPEN_FILES), 1)
+
+    max_probes_in_memory = 1_000_000
+    if memory is not None:
+        per_worker = int(memory * MEMORY_FRACTION / n_workers / bytes_per_probe)
+        max_probes_in_memory = max(min(max_probes_in_memory, per_worker), 10_000)
+
+    return Tuning(
+        n_workers=n_workers,
+        concurrent_requests=concurrent_requests,
+        max_open_files=max_open_files,
+        max_probes_in_memory=max_probes_in_memory,
+    )
+
+
+def calibrate_bytes_per_probe(n_probes: int = 10_000) -> int:
+    """
+    Measure the memory usage of a probe tuple, as held in memory by the parallel generator.
+
+    >>> 50 < calibrate_bytes_per_probe() < 1000
+    True
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        probes = [
+            (
+                random.getrandbits(128),
+                24000 + random.getrandbits(16),
+                33434,
+                random.randint(1, 32),
+                "icmp",
+            )
+            for _ in range(n_probes)
+        ]
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del probes
+    return max((after - before) // n_probes, 1)
+
+
+def autotune(calibrate: bool | None = None) -> Tuning:
+    """
+    Compute the parameters from the resources available to the current process.
+    The result is cached.
+
+    Args:
+        calibrate: If true, measure the memory usage of a probe instead of using an estimate.
+            Defaults to true if the `DIAMOND_MINER_AUTOTUNE_CALIBRATE` environment variable is `1`,
+            so that the calibration also applies to the default parameters of the other functions.
+    """
+    if calibrate is None:
+        calibrate = os.environ.get(CALIBRATE_ENV, "0").lower() in ("1", "true", "yes")
+    return tune_process(calibrate)
+
+
+@cache
+def tune_process(calibrate: bool) -> Tuning:
+    """Same as `autotune`, with an explicit `calibrate` parameter (the cache key)."""
+    bytes_per_probe = (
+        calibrate_bytes_per_probe() if calibrate else DEFAULT_BYTES_PER_PROBE
+    )
+    tuning = tune(
+        cpus=available_cpus(),
+        memory=available_memory(),
+        open_files=open_files_limit(),
+        bytes_per_probe=bytes_per_probe,
+    )
+    logger.info("autotune bytes_per_probe=%s tuning=%s", bytes_per_probe, tuning)
+    return tuning
@@ -0,0 +1,262 @@
+"""
+Fit the probes of a round into a probe budget.
+
+The number of probes requested by the Diamond-Miner algorithm is not bounded,
+while a round must usually fit in a fixed time window at a fixed probing rate,
+that is in a budget of `rate * window` probes.
+`allocate_budget` chooses the probes to send among the ones requested
+(the rows of `GetProbesDiff`), and reports the probes that are dropped:
+
+```python
+from diamond_miner.budget import allocate_budget, discovery_rates
+from diamond_miner.queries import GetProbesDiff
+
+rows = GetProbesDiff(round_eq=round_).execute(client, measurement_id)
+rates = discovery_rates(client, measurement_id, round_ - 1)
+allocation = allocate_budget(rows, budget=100_000 * 3600, rates=rates)
+```
+
+`diamond_miner.planning.plan_round` computes the allocation of a round with the same limits
+as the generators, which then generate the allocated probes only, and the number of probes
+sent must be recorded once they are sent:
+
+```python
+from diamond_miner.insert import insert_allocation
+from diamond_miner.planning import plan_round
+
+plan = plan_round(client, measurement_id, round_, budget=100_000 * 3600, rates=rates)
+probe_generator_parallel(filepath, client, measurement_id, round_, allocation=plan.allocation)
+# ... send the probes ...
+insert_allocation(client, measurement_id, round_, plan.allocation)
+```
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from math import inf
+from typing import TYPE_CHECKING
+
+from diamond_miner.logger import logger
+from diamond_miner.queries import GetDiscoveryRates
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
+
+Key = tuple[int, str]
+"""A `(probe_protocol, probe_dst_prefix)` pair."""
+
+
+@dataclass(frozen=True)
+class Allocation:
+    rows: list[dict]
+    "Rows of `GetProbesDiff` restricted to the allocated probes."
+    requested: int
+    "Number of probes requested."
+    allocated: int
+    "Number of probes allocated."
+    dropped: dict[Key, int]
+    "Number of requested probes that are not allocated, for each prefix with dropped probes."
+    partial_rows: list[dict]
+    """
+    Rows of `GetProbesDiff` restricted to the TTLs whose probes are not all allocated,
+    with the cumulative number of probes allocated (which equals the number of probes
+    already sent for the TTLs without any allocated probe).
+    They must be written to the probes table with `diamond_miner.insert.insert_allocation`,
+    so that the dropped probes are requested again at the next round.
+    """
+
+
+def water_fill(requests: Sequence[int], capacity: int) -> list[int]:
+    """
+    Share `capacity` between `requests` as evenly as possible:
+    no request gets more than it asks for, and the requests that are not fully satisfied
+    get the same amount, up to one (the first ones get the remainder).
+
+    Examples:
+        >>> water_fill([5, 1, 3], 6)
+        [3, 1, 2]
+        >>> water_fill([5, 1, 3], 10)
+        [5, 1, 3]
+        >>> water_fill([5, 1, 3], 0)
+        [0, 0, 0]
+    """
+    allocation = [0] * len(requests)
+    order = sorted(range(len(requests)), key=lambda i: requests[i])
+    remaining = capacity
+    for position, i in enumerate(order):
+        if requests[i] > remaining // (len(order) - position):
+            unsatisfied = sorted(order[position:])
+            level, extra = divmod(remaining, len(unsatisfied))
+            for j, k in enumerate(unsatisfied):
+                allocation[k] = level + (j < extra)
+            break
+        allocation[i] = requests[i]
+        remaining -= requests[i]
+    return allocation
+
+
+def allocate_budget(
+    rows: Iterable[dict],
+    *,
+    budget: int | None = None,
+    max_probes_per_prefix: int | None = None,
+    rates: Mapping[Key, float] | None = None,
+    max_flows_v4: int | None = None,
+    max_flows_v6: int | None = None,
+) -> Allocation:
+    """
+    Choose the probes to send given a total budget and a per-prefix cap.
+
+    The probes that cannot be generated because of the port offset limit of the generators
+    (the flows after `max_flows_v4` or `max_flows_v6`) are first removed,
+    so that they do not count in the budget.
+    The probes of a prefix are then capped to `max_probes_per_prefix`, and the prefixes
+    are served by decreasing discovery rate until the budget is exhausted.
+    The prefixes without a known rate (for example the prefixes that were not probed
+    at the previous round) are served first.
+    Inside a prefix, the probes are shared between the TTLs with `water_fill`,
+    so that a partially served prefix makes progress at all of its TTLs.
+
+    This is a simplification: the discovery rate is measured per prefix, at the previous round,
+    so it is an average over the TTLs of the prefix rather than the marginal rate of each
+    additional probe at each TTL, which would require the links discovered per TTL
+    and a per-TTL allocation.
+
+    Args:
+        rows: Rows of `GetProbesDiff`.
+        budget: Maximum number of probes to send (unlimited if not specified).
+        max_probes_per_prefix: Maximum number of probes to send to a single prefix (unlimited if not specified).
+        rates: Links discovered per probe sent, for each `(probe_protocol, probe_dst_prefix)` (see `discovery_rates`).
+        max_flows_v4: Maximum number of flows per IPv4 prefix and TTL (unlimited if not specified),
+            `prefix_size + max_port_offset` for the generators.
+        max_flows_v6: Maximum number of flows per IPv6 prefix and TTL (unlimited if not specified).
+
+    Examples:
+        >>> rows = [
+        ...     {"probe_protocol": 1, "probe_dst_prefix": "::ffff:8.8.8.0", "probes_per_ttl": [[1, 16, 6], [2, 11, 6]]},
+        ...     {"probe_protocol": 1, "probe_dst_prefix": "::ffff:8.8.9.0", "probes_per_ttl": [[1, 11, 6], [2, 11, 6]]},
+        ... ]
+        >>> allocation = allocate_budget(rows, budget=12, rates={(1, "::ffff:8.8.8.0"): 0.1, (1, "::ffff:8.8.9.0"): 0.5})
+        >>> allocation.requested, allocation.allocated, allocation.dropped
+        (25, 12, {(1, '::ffff:8.8.8.0'): 13})
+        >>> [(row["probe_dst_prefix"], row["probes_per_ttl"]) for row in allocation.rows]
+        [('::ffff:8.8.9.0', [[1, 11, 6], [2, 11, 6]]), ('::ffff:8.8.8.0', [[1, 7, 6], [2, 7, 6]])]
+        >>> [(row["probe_dst_prefix"], row["probes_per_ttl"]) for row in allocation.partial_rows]
+        [('::ffff:8.8.8.0', [[1, 7, 6], [2, 7, 6]])]
+        >>> allocation = allocate_budget(rows, max_probes_per_prefix=8)
+        >>> allocation.allocated, allocation.dropped
+        (16, {(1, '::ffff:8.8.8.0'): 7, (1, '::ffff:8.8.9.0'): 2})
+
+        At most 10 flows can be generated per prefix and TTL, so 16 probes are requested instead of 25:
+        >>> allocation = allocate_budget(rows, budget=12, max_flows_v4=10)
+        >>> allocation.requested, allocation.allocated, allocation.dropped
+        (16, 12, {(1, '::ffff:8.8.9.0'): 4})
+    """
+    rates = rates or {}
+    prefixes = []
+    for row in rows:
+        key = (row["probe_protocol"], row["probe_dst_prefix"])
+        max_flows = (
+            max_flows_v4
+            if row["probe_dst_prefix"].startswith("::ffff:")
+            else max_flows_v6
+        )
+        if max_flows is not None:
+            row = {
+                **row,
+                "probes_per_ttl": [
+                    [ttl, min(total, max_flows), sent]
+                    for ttl, total, sent in row["probes_per_ttl"]
+                ],
+            }
+        requests = [max(total - sent, 0) for _, total, sent in row["probes_per_ttl"]]
+        allocated = requests
+        if max_probes_per_prefix is not None:
+            allocated = water_fill(requests, max_probes_per_prefix)
+        prefixes.append((key, row, requests, allocated))
+
+    if budget is not None:
+        prefixes.sort(key=lambda prefix: (-rates.get(prefix[0], inf), prefix[0]))
+        remaining = budget
+        for i, (key, row, requests, allocated) in enumerate(prefixes):
+            if sum(allocated) > remaining:
+                allocated = water_fill(allocated, remaining)
+                prefixes[i] = (key, row, requests, allocated)
+            remaining -= sum(allocated)
+
+    allocation_rows, partial_rows, dropped = [], [], {}
+    n_requested, n_allocated = 0, 0
+    for key, row, requests, allocated in prefixes:
+        n_requested += sum(requests)
+        n_allocated += sum(allocated)
+        probes_per_ttl = [
+            [ttl, sent + n, sent]
+            for (ttl, _, sent), n in zip(row["probes_per_ttl"], allocated)
+        ]
+        if sum(allocated) > 0:
+            allocation_rows.append(
+                {
+                    **row,
+                    "probes_per_ttl": [
+                        x for x, n in zip(probes_per_ttl, allocated) if n > 0
+                    ],
+                }
+            )
+        if sum(allocated) < sum(requests):
+            dropped[key] = sum(requests) - sum(allocated)
+            partial_rows.append(
+                {
+                    **row,
+                    "probes_per_ttl": [
+                        x
+                        for x, n, r in zip(probes_per_ttl, allocated, requests)
+                        if n < r
+                    ],
+                }
+            )
+
+    logger.info(
+        "budget requested=%s allocated=%s dropped=%s dropped_prefixes=%s",
+        n_requested,
+        n_allocated,
+        n_requested - n_allocated,
+        len(dropped),
+    )
+    return Allocation(
+        rows=allocation_rows,
+        requested=n_requested,
+        allocated=n_allocated,
+        dropped=dropped,
+        partial_rows=partial_rows,
+    )
+
+
+def discovery_rates(
+    client: ClickHouseClient,
+    measurement_id: str,
+    previous_round: int,
+    *,
+    filter_partial: bool = True,
+    filter_virtual: bool = True,
+) -> dict[Key, float]:
+    """
+    Return the number of new links discovered per probe actually sent at `previous_round`,
+    for each prefix probed at this round (see `GetDiscoveryRates`).
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> discovery_rates(client, "test_nsdi_example", 1)
+        {(1, '::ffff:200.0.0.0'): 0.25}
+    """
+    query = GetDiscoveryRates(
+        incremental_round=previous_round,
+        filter_inter_round=True,
+        filter_partial=filter_partial,
+        filter_virtual=filter_virtual,
+    )
+    return {
+        (row["probe_protocol"], row["probe_dst_prefix"]): row["new_links"]
+        / row["probes"]
+        for row in query.execute_iter(client, measurement_id)
+    }
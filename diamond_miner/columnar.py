@@ -0,0 +1,130 @@
+"""
+Decode ClickHouse results into NumPy arrays.
+
+The results are fetched in the `RowBinaryWithNamesAndTypes` format:
+when all the columns have a fixed width, the rows are fixed-size records
+that are decoded at once with a structured `numpy.dtype`, without creating
+a Python object per value.
+
+IPv6 columns are returned as `(n, 2)` arrays of `uint64`, with the
+most significant half first.
+
+This module requires NumPy (`pip install diamond-miner[numpy]`).
+"""
+import numpy as np
+
+Columns = dict[str, np.ndarray]
+
+ROW_BINARY_FORMAT = "RowBinaryWithNamesAndTypes"
+"""ClickHouse format used to fetch the results."""
+
+DTYPES = {
+    "Bool": np.dtype("?"),
+    "UInt8": np.dtype("u1"),
+    "UInt16": np.dtype("<u2"),
+    "UInt32": np.dtype("<u4"),
+    "UInt64": np.dtype("<u8"),
+    "Int8": np.dtype("i1"),
+    "Int16": np.dtype("<i2"),
+    "Int32": np.dtype("<i4"),
+    "Int64": np.dtype("<i8"),
+    "Float32": np.dtype("<f4"),
+    "Float64": np.dtype("<f8"),
+    "Date": np.dtype("<u2"),
+    "DateTime": np.dtype("<u4"),
+    "IPv4": np.dtype("<u4"),
+    # IPv6 addresses are stored in network byte order.
+    "IPv6": np.dtype((">u8", (2,))),
+}
+"""Wire dtype of the supported ClickHouse types."""
+
+CONVERSIONS = {
+    "Date": np.dtype("datetime64[D]"),
+    "DateTime": np.dtype("datetime64[s]"),
+    "IPv6": np.dtype("u8"),
+}
+"""Native dtype of the columns that are converted after decoding."""
+
+
+def read_varint(data: bytes | memoryview, offset: int) -> tuple[int, int]:
+    """
+    Read an unsigned LEB128 integer, and return it with the offset of the next byte.
+
+    >>> read_varint(b"\\xac\\x02", 0)
+    (300, 2)
+    """
+    value, shift = 0, 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def read_string(data: bytes | memoryview, offset: int) -> tuple[str, int]:
+    size, offset = read_varint(data, offset)
+    end = offset + size
+    return bytes(data[offset:end]).decode(), end
+
+
+def row_dtype(names: list[str], types: list[str]) -> np.dtype:
+    """
+    Structured dtype of a row.
+
+    >>> row_dtype(["addr", "ttl"], ["IPv6", "UInt8"]).itemsize
+    17
+    >>> row_dtype(["labels"], ["Array(UInt32)"])
+    Traceback (most recent call last):
+        ...
+    ValueError: unsupported type for column labels: Array(UInt32)
+    """
+    for name, type_ in zip(names, types):
+        if type_ not in DTYPES:
+            raise ValueError(f"unsupported type for column {name}: {type_}")
+    return np.dtype([(name, DTYPES[type_]) for name, type_ in zip(names, types)])
+
+
+def decode_row_binary(data: bytes) -> Columns:
+    """
+    Decode a `RowBinaryWithNamesAndTypes` response into one array per column.
+
+    >>> data = b"\\x02\\x04addr\\x03ttl\\x04IPv6\\x05UInt8"
+    >>> data += bytes(10) + b"\\xff\\xff\\x08\\x08\\x08\\x08" + b"\\x03"
+    >>> columns = decode_row_binary(data)
+    >>> columns["addr"].tolist()
+    [[0, 281470816487432]]
+    >>> columns["ttl"].tolist()
+    [3]
+    >>> decode_row_binary(b"")
+    {}
+    """
+    if not data:
+        return {}
+    view = memoryview(data)
+    n_columns, offset = read_varint(view, 0)
+    names, types = [], []
+    for _ in range(n_columns):
+        name, offset = read_string(view, offset)
+        names.append(name)
+    for _ in range(n_columns):
+        type_, offset = read_string(view, offset)
+        types.append(type_)
+    rows = np.frombuffer(view[offset:], dtype=row_dtype(names, types))
+    return {
+        name: rows[name].astype(
+            CONVERSIONS.get(type_, rows[name].dtype.newbyteorder("="))
+        )
+        for name, type_ in zip(names, types)
+    }
+
+
+def concatenate(batches: list[Columns]) -> Columns:
+    """Concatenate batches of columns."""
+    batches = [batch for batch in batches if batch]
+    if not batches:
+        return {}
+    return {
+        name: np.concatenate([batch[name] for batch in batches]) for name in batches[0]
+    }
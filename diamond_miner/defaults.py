@@ -16,6 +16,9 @@ DEFAULT_PREFIX_SIZE_V4 = 2 ** (32 - DEFAULT_PREFIX_LEN_V4)
 DEFAULT_PREFIX_SIZE_V6 = 2 ** (128 - DEFAULT_PREFIX_LEN_V6)
 """Default prefix size (number of addresses) for IPv6."""
 
+DEFAULT_MAX_PORT_OFFSET = 4095
+"""Default maximum source port offset (with respect to the minimum source port) of the generated probes."""
+
 DEFAULT_PROBE_SRC_PORT = 24000
 """Default probe source port. Encoded in the ICMP checksum field for ICMP probes."""
 DEFAULT_PROBE_DST_PORT = 33434
@@ -24,6 +27,26 @@ DEFAULT_PROBE_DST_PORT = 33434
 UNIVERSE_SUBSET = IPv6Network("::/0")
 """Set of all possible IP addresses."""
 
+PRIVATE_PREFIXES = (
+    "0.0.0.0/8",
+    "10.0.0.0/8",
+    "100.64.0.0/10",
+    "127.0.0.0/8",
+    "172.16.0.0/12",
+    "192.0.0.0/24",
+    "192.0.2.0/24",
+    "192.88.99.0/24",
+    "192.168.0.0/16",
+    "198.18.0.0/15",
+    "198.51.100.0/24",
+    "203.0.113.0/24",
+    "224.0.0.0/4",
+    "233.252.0.0/24",
+    "240.0.0.0/4",
+    "fd00::/8",
+)
+"""Reserved IP prefixes, see https://en.wikipedia.org/wiki/Reserved_IP_addresses."""
+
 PROTOCOLS: dict[int | str, int | str] = {
     1: "icmp",
     17: "udp",
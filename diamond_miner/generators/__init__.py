@@ -1,10 +1,47 @@
-from diamond_miner.generators.database import probe_generator_from_database
-from diamond_miner.generators.parallel import probe_generator_parallel
-from diamond_miner.generators.standalone import probe_generator, probe_generator_by_flow
+"""
+Probe generators.
+
+The submodules are imported on first access, so that `probe_generator`
+can be used without importing the ClickHouse client and `concurrent.futures`.
+"""
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:  # pragma: no cover
+    from diamond_miner.generators.database import (
+        probe_generator_from_database,
+        probe_generator_from_rows,
+    )
+    from diamond_miner.generators.parallel import probe_generator_parallel
+    from diamond_miner.generators.standalone import (
+        probe_generator,
+        probe_generator_by_flow,
+    )
 
 __all__ = (
     "probe_generator",
     "probe_generator_by_flow",
     "probe_generator_from_database",
+    "probe_generator_from_rows",
     "probe_generator_parallel",
 )
+
+LAZY_ATTRIBUTES = {
+    "probe_generator": "standalone",
+    "probe_generator_by_flow": "standalone",
+    "probe_generator_from_database": "database",
+    "probe_generator_from_rows": "database",
+    "probe_generator_parallel": "parallel",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if module := LAZY_ATTRIBUTES.get(name):
+        value = getattr(import_module(f"{__name__}.{module}"), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
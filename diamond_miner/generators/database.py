@@ -1,9 +1,13 @@
+from __future__ import annotations
+
+import time
 from collections.abc import Iterable, Iterator
 from ipaddress import IPv6Address
+from typing import TYPE_CHECKING
 
-from pych_client import ClickHouseClient
-
+from diamond_miner.budget import Allocation
 from diamond_miner.defaults import (
+    DEFAULT_MAX_PORT_OFFSET,
     DEFAULT_PREFIX_SIZE_V4,
     DEFAULT_PREFIX_SIZE_V6,
     DEFAULT_PROBE_DST_PORT,
@@ -13,10 +17,13 @@ from diamond_miner.defaults import (
 )
 from diamond_miner.logger import logger
 from diamond_miner.mappers import SequentialFlowMapper
+from diamond_miner.metrics import metrics
 from diamond_miner.queries import GetProbesDiff
 from diamond_miner.typing import FlowMapper, IPNetwork, Probe
 
-max_probes = 0
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
+
 
 def probe_generator_from_database(
     client: ClickHouseClient,
@@ -30,9 +37,36 @@ def probe_generator_from_database(
     probe_ttl_geq: int | None = None,
     probe_ttl_leq: int | None = None,
     subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
+    cap_max_ttl: bool = False,
+    max_port_offset: int | None = DEFAULT_MAX_PORT_OFFSET,
+    allocation: Allocation | None = None,
 ) -> Iterator[Probe]:
     """
-    TODO: Doctest, note that this doesn't randomize probes.
+    Generate the probes of a round from the probes table.
+    Note that the probes are not randomized.
+
+    With a probe budget, the probes to send are chosen beforehand by
+    `diamond_miner.planning.plan_round`, and only the probes of `allocation` are generated.
+    This function does not write to the database: the number of probes sent must be recorded
+    with `diamond_miner.insert.insert_allocation` once they are sent,
+    so that the dropped probes are requested again at the next round.
+
+    Args:
+        client: ClickHouse client.
+        measurement_id: Measurement id.
+        round_: Number of the round for which to generate the probes.
+        mapper_v4: The flow mapper for IPv4 probes.
+        mapper_v6: The flow mapper for IPv6 probes.
+        probe_src_port: The minimum source port of the probes (can be incremented by the flow mapper).
+        probe_dst_port: The destination port of the probes (constant).
+        probe_ttl_geq: If specified, generate only the probes with a TTL greater or equal to this value.
+        probe_ttl_leq: If specified, generate only the probes with a TTL less or equal to this value.
+        subsets: Subsets of the probes table to read.
+        cap_max_ttl: Skip the TTLs above the maximum useful TTL of each prefix (see `GetProbesDiff.cap_max_ttl`).
+        max_port_offset: Do not generate the probes whose source port would exceed
+            `probe_src_port + max_port_offset` (unlimited if `None`).
+        allocation: If specified, generate the probes of this allocation (see `diamond_miner.planning.RoundPlan`)
+            instead of reading the probes table.
 
     Examples:
         >>> from ipaddress import ip_address
@@ -45,29 +79,100 @@ def probe_generator_from_database(
         8
         >>> (str(ip_address(probes[0][0])), *probes[0][1:])
         ('::ffff:8.8.1.0', 24000, 33434, 1, 'icmp')
+
+        With a budget, the probes are shared between the prefixes and the TTLs:
+        >>> from diamond_miner.planning import plan_round
+        >>> plan = plan_round(client, "test_probe_gen", 1, budget=6)
+        >>> probes = list(probe_generator_from_database(client, "test_probe_gen", 1, allocation=plan.allocation))
+        >>> sorted((str(ip_address(probe[0])), probe[3]) for probe in probes)
+        [('::ffff:8.8.0.0', 1), ('::ffff:8.8.0.0', 2), ('::ffff:8.8.0.1', 1), ('::ffff:8.8.0.1', 2), ('::ffff:8.8.1.0', 1), ('::ffff:8.8.1.0', 2)]
+
+        With `cap_max_ttl=True`, the TTLs above the TTL at which the destination replied are skipped:
+        >>> probes = list(probe_generator_from_database(client, "test_max_ttl", 2, cap_max_ttl=True))
+        >>> sorted({probe[3] for probe in probes if str(ip_address(probe[0])).startswith("::ffff:200.")})
+        [1, 2, 3, 4]
+        >>> sorted({probe[3] for probe in probes if str(ip_address(probe[0])).startswith("::ffff:201.")})
+        [1, 2, 3]
     """
-    global max_probes
-    if max_probes == 0:
-        max_probes = 4095 # XXX make this a parameter
-        logger.info("capping the number of probes to send at %d", max_probes)
+    rows: Iterable[dict]
+    if allocation is not None:
+        metrics.counter(
+            "probes_dropped_total", generator="probe_generator_from_database"
+        ).inc(allocation.requested - allocation.allocated)
+        rows = allocation.rows
+    else:
+        rows = GetProbesDiff(
+            round_eq=round_,
+            probe_ttl_geq=probe_ttl_geq,
+            probe_ttl_leq=probe_ttl_leq,
+            cap_max_ttl=cap_max_ttl,
+        ).execute_iter(client, measurement_id, subsets=subsets)
+    yield from probe_generator_from_rows(
+        rows,
+        mapper_v4=mapper_v4,
+        mapper_v6=mapper_v6,
+        probe_src_port=probe_src_port,
+        probe_dst_port=probe_dst_port,
+        max_port_offset=max_port_offset,
+        generator="probe_generator_from_database",
+    )
+
 
-    rows = GetProbesDiff(
-        round_eq=round_, probe_ttl_geq=probe_ttl_geq, probe_ttl_leq=probe_ttl_leq
-    ).execute_iter(client, measurement_id, subsets=subsets)
-    for row in rows:
-        dst_prefix_int = int(IPv6Address(row["probe_dst_prefix"]))
-        mapper = (
-            mapper_v4 if row["probe_dst_prefix"].startswith("::ffff:") else mapper_v6
-        )
-        protocol_str = PROTOCOLS[row["probe_protocol"]]
+def probe_generator_from_rows(
+    rows: Iterable[dict],
+    *,
+    mapper_v4: FlowMapper = SequentialFlowMapper(DEFAULT_PREFIX_SIZE_V4),
+    mapper_v6: FlowMapper = SequentialFlowMapper(DEFAULT_PREFIX_SIZE_V6),
+    probe_src_port: int = DEFAULT_PROBE_SRC_PORT,
+    probe_dst_port: int = DEFAULT_PROBE_DST_PORT,
+    max_port_offset: int | None = DEFAULT_MAX_PORT_OFFSET,
+    generator: str = "probe_generator_from_rows",
+) -> Iterator[Probe]:
+    """
+    Generate the probes specified by rows of `GetProbesDiff`,
+    for example the rows returned by `diamond_miner.budget.allocate_budget`.
+    The throughput is recorded in the `probes_total` and `probes_per_second` metrics,
+    with the `generator` label.
+
+    Examples:
+        >>> from ipaddress import ip_address
+        >>> rows = [{"probe_protocol": 1, "probe_dst_prefix": "::ffff:8.8.8.0", "probes_per_ttl": [[1, 2, 0]]}]
+        >>> [(str(ip_address(probe[0])), *probe[1:]) for probe in probe_generator_from_rows(rows)]
+        [('::ffff:8.8.8.0', 24000, 33434, 1, 'icmp'), ('::ffff:8.8.8.1', 24000, 33434, 1, 'icmp')]
+        >>> rows = [{"probe_protocol": 1, "probe_dst_prefix": "::ffff:8.8.8.0", "probes_per_ttl": [[1, 258, 255]]}]
+        >>> [(str(ip_address(probe[0])), *probe[1:]) for probe in probe_generator_from_rows(rows, max_port_offset=0)]
+        [('::ffff:8.8.8.255', 24000, 33434, 1, 'icmp')]
+    """
+    # The probes are counted per TTL, from the number of flows to send.
+    start_ns, n_probes = time.perf_counter_ns(), 0
+    try:
+        for row in rows:
+            dst_prefix_int = int(IPv6Address(row["probe_dst_prefix"]))
+            mapper = (
+                mapper_v4
+                if row["probe_dst_prefix"].startswith("::ffff:")
+                else mapper_v6
+            )
+            protocol_str = PROTOCOLS[row["probe_protocol"]]
 
-        for ttl, total_probes, already_sent in row["probes_per_ttl"]:
-            for flow_id in range(already_sent, total_probes):
-                addr_offset, port_offset = mapper.offset(flow_id, dst_prefix_int)
-                dst_addr = dst_prefix_int + addr_offset
-                src_port = probe_src_port + port_offset
-                # Note that port_offset is actually the number of probes sent after having already sent 256 probes.
-                if port_offset > max_probes:
-                    logger.warning("not probing %s after having already sent %d probes", row, max_probes+256)
-                    break
-                yield dst_addr, src_port, probe_dst_port, ttl, protocol_str  # type: ignore
+            for ttl, total_probes, already_sent in row["probes_per_ttl"]:
+                n_probes += max(total_probes - already_sent, 0)
+                for flow_id in range(already_sent, total_probes):
+                    addr_offset, port_offset = mapper.offset(flow_id, dst_prefix_int)
+                    # The port offset is the number of probes sent to each address of the prefix,
+                    # after having exhausted the addresses of the prefix.
+                    if max_port_offset is not None and port_offset > max_port_offset:
+                        logger.warning(
+                            "not sending %s probes to %s at TTL %s: port offset exceeds %s",
+                            total_probes - flow_id,
+                            row["probe_dst_prefix"],
+                            ttl,
+                            max_port_offset,
+                        )
+                        n_probes -= total_probes - flow_id
+                        break
+                    dst_addr = dst_prefix_int + addr_offset
+                    src_port = probe_src_port + port_offset
+                    yield dst_addr, src_port, probe_dst_port, ttl, protocol_str  # type: ignore
+    finally:
+        metrics.observe_throughput("probes", n_probes, start_ns, generator=generator)
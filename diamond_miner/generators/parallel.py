@@ -1,26 +1,36 @@
 import random
 import shutil
+import time
+from bisect import bisect_right
 from concurrent.futures import ProcessPoolExecutor, as_completed
+from ipaddress import IPv6Address
 from pathlib import Path
 from tempfile import TemporaryDirectory
 
 from pych_client import ClickHouseClient
 from zstandard import ZstdCompressor
 
+from diamond_miner.autotune import autotune
+from diamond_miner.budget import Allocation
 from diamond_miner.defaults import (
+    DEFAULT_MAX_PORT_OFFSET,
     DEFAULT_PREFIX_SIZE_V4,
     DEFAULT_PREFIX_SIZE_V6,
     DEFAULT_PROBE_DST_PORT,
     DEFAULT_PROBE_SRC_PORT,
 )
 from diamond_miner.format import format_probe
-from diamond_miner.generators.database import probe_generator_from_database
+from diamond_miner.generators.database import (
+    probe_generator_from_database,
+    probe_generator_from_rows,
+)
 from diamond_miner.logger import logger
 from diamond_miner.mappers import SequentialFlowMapper
+from diamond_miner.metrics import metrics
 from diamond_miner.queries import GetProbesDiff
 from diamond_miner.subsets import subsets_for
+from diamond_miner.tracing import Span, Tracer
 from diamond_miner.typing import FlowMapper, IPNetwork, Probe
-from diamond_miner.utilities import available_cpus
 
 
 def probe_generator_parallel(
@@ -35,14 +45,25 @@ def probe_generator_parallel(
     probe_dst_port: int = DEFAULT_PROBE_DST_PORT,
     probe_ttl_geq: int | None = None,
     probe_ttl_leq: int | None = None,
-    max_open_files: int = 8192,
-    n_workers: int = max(available_cpus() // 8, 1),
+    cap_max_ttl: bool = False,
+    max_open_files: int | None = None,
+    max_probes_in_memory: int | None = None,
+    n_workers: int | None = None,
+    trace_filepath: Path | None = None,
+    max_port_offset: int | None = DEFAULT_MAX_PORT_OFFSET,
+    allocation: Allocation | None = None,
 ) -> int:
     """
     Compute the probes to send given the previously discovered links.
     This function shuffle the probes on-disk:
     [External-memory shuffling in linear time?](https://lemire.me/blog/2010/03/15/external-memory-shuffling-in-linear-time/)
 
+    With a probe budget, the probes to send are chosen beforehand by `diamond_miner.planning.plan_round`,
+    and each worker receives the rows of `allocation` in its subset instead of querying the database.
+    This function does not write to the database: the number of probes sent must be recorded
+    with `diamond_miner.insert.insert_allocation` once they are sent,
+    so that the dropped probes are requested again at the next round.
+
     Args:
         filepath: Output file (Zstd-compressed CSV file); will be overwritten.
         client: ClickHouse client.
@@ -52,22 +73,56 @@ def probe_generator_parallel(
         mapper_v6: The flow mapper for IPv6 probes.
         probe_src_port: The minimum source port of the probes (can be incremented by the flow mapper).
         probe_dst_port: The destination port of the probes (constant).
-
+        probe_ttl_geq: If specified, generate only the probes with a TTL greater or equal to this value.
+        probe_ttl_leq: If specified, generate only the probes with a TTL less or equal to this value.
+        cap_max_ttl: Skip the TTLs above the maximum useful TTL of each prefix (see `GetProbesDiff.cap_max_ttl`).
+        max_open_files: Maximum number of files opened at the same time.
+        max_probes_in_memory: Maximum number of probes held in memory by each worker.
+            The larger, the better the randomization, but the more the memory usage.
+        n_workers: Number of worker processes.
+        trace_filepath: If specified, write the spans recorded in the parent and in the
+            worker processes to this file, in the Chrome tracing format (see `diamond_miner.tracing`).
+        max_port_offset: Do not generate the probes whose source port would exceed
+            `probe_src_port + max_port_offset` (unlimited if `None`).
+        allocation: If specified, generate the probes of this allocation (see `diamond_miner.planning.RoundPlan`)
+            instead of reading the probes table.
     """
+    tuning = autotune()
+    max_open_files = max_open_files or tuning.max_open_files
+    max_probes_in_memory = max_probes_in_memory or tuning.max_probes_in_memory
+    n_workers = n_workers or tuning.n_workers
+
+    start_ns = time.perf_counter_ns()
+    tracer = Tracer(process_name="probe_generator_parallel")
+
+    probes_query = GetProbesDiff(
+        round_eq=round_,
+        probe_ttl_geq=probe_ttl_geq,
+        probe_ttl_leq=probe_ttl_leq,
+        cap_max_ttl=cap_max_ttl,
+    )
+
     # TODO: These subsets are sub-optimal, `CountProbesPerPrefix` should count
     # the actual number of probes to be sent, not the total number of probes sent.
-    subsets = subsets_for(
-        GetProbesDiff(
-            round_eq=round_, probe_ttl_geq=probe_ttl_geq, probe_ttl_leq=probe_ttl_leq
-        ),
-        client,
-        measurement_id,
-    )
+    with tracer.span("subsets") as span:
+        subsets = subsets_for(probes_query, client, measurement_id)
+        span["n_subsets"] = len(subsets)
 
     if not subsets:
+        if trace_filepath:
+            tracer.write_chrome_trace(trace_filepath)
         return 0
 
-    n_files_per_subset = max_open_files // len(subsets)
+    rows_by_subset: list[list[dict] | None] = [None] * len(subsets)
+    if allocation is not None:
+        with tracer.span("budget") as span:
+            rows_by_subset = split_rows(allocation.rows, subsets)  # type: ignore
+            span["n_dropped"] = allocation.requested - allocation.allocated
+        metrics.counter(
+            "probes_dropped_total", generator="probe_generator_parallel"
+        ).inc(allocation.requested - allocation.allocated)
+
+    n_files_per_subset = max(max_open_files // len(subsets), 1)
 
     logger.info(
         "mda_probes n_workers=%s n_subsets=%s n_files_per_subset=%s",
@@ -77,7 +132,9 @@ def probe_generator_parallel(
     )
 
     with TemporaryDirectory(dir=filepath.parent) as temp_dir:
-        with ProcessPoolExecutor(n_workers) as executor:
+        with tracer.span("workers", n_workers=n_workers), ProcessPoolExecutor(
+            n_workers
+        ) as executor:
             futures = [
                 executor.submit(
                     worker,
@@ -91,22 +148,38 @@ def probe_generator_parallel(
                     probe_dst_port,
                     probe_ttl_geq,
                     probe_ttl_leq,
+                    cap_max_ttl,
                     subset,
                     n_files_per_subset,
+                    max_probes_in_memory,
+                    max_port_offset,
+                    rows_by_subset[i],
                 )
                 for i, subset in enumerate(subsets)
             ]
-            n_probes = sum(future.result() for future in as_completed(futures))
+            n_probes = 0
+            for future in as_completed(futures):
+                n_subset_probes, spans = future.result()
+                n_probes += n_subset_probes
+                tracer.extend(spans, process_name="worker")
 
         files = list(Path(temp_dir).glob("subset_*.csv.zst"))
         random.shuffle(files)
 
         logger.info("mda_probes status=merging n_files=%s", len(files))
-        with filepath.open("wb") as out:
+        with tracer.span("merge", n_files=len(files)), filepath.open("wb") as out:
             for f in files:
                 with f.open("rb") as inp:
                     shutil.copyfileobj(inp, out)
 
+    metrics.observe_throughput(
+        "probes", n_probes, start_ns, generator="probe_generator_parallel"
+    )
+    metrics.counter("probe_bytes_total", generator="probe_generator_parallel").inc(
+        filepath.stat().st_size
+    )
+    if trace_filepath:
+        tracer.write_chrome_trace(trace_filepath)
     return n_probes
 
 
@@ -121,12 +194,18 @@ def worker(
     probe_dst_port: int,
     probe_ttl_geq: int | None,
     probe_ttl_leq: int | None,
+    cap_max_ttl: bool,
     subset: IPNetwork,
     n_files: int,
-) -> int:
+    max_probes_in_memory: int,
+    max_port_offset: int | None,
+    rows: list[dict] | None,
+) -> tuple[int, list[Span]]:
     """
     Execute the :class:`diamond_miner.queries.GetNextRound` query
-    on the specified subset, and write the probes to the specified file.
+    on the specified subset, or use the specified rows,
+    and write the probes to the specified file.
+    Returns the number of probes and the spans recorded in the worker.
     """
     # TODO: random.shuffle is slow...
     # A potentially simpler and better way would be to shuffle
@@ -137,49 +216,99 @@ def worker(
     # The larger `max_probes_in_memory`, the better the performance
     # (less calls to `probes.clear()`)
     # and the randomization but the more the memory usage.
-    max_probes_in_memory = 1_000_000
-
-    outputs: list[tuple] = []
-    for i in range(n_files):
-        ctx = ZstdCompressor(level=1)
-        file = prefix.with_suffix(f".{i}.csv.zst").open("wb")
-        stream = ctx.stream_writer(file)
-        outputs.append((ctx, file, stream))
-
-    probes_by_file: list[list[Probe]] = [[] for _ in range(n_files)]
-    n_probes = 0
-
-    for probe in probe_generator_from_database(
-        client=ClickHouseClient(**client_config),
-        measurement_id=measurement_id,
-        round_=round_,
-        mapper_v4=mapper_v4,
-        mapper_v6=mapper_v6,
-        probe_src_port=probe_src_port,
-        probe_dst_port=probe_dst_port,
-        probe_ttl_geq=probe_ttl_geq,
-        probe_ttl_leq=probe_ttl_leq,
-        subsets=(subset,),
-    ):
-        # probe[:-2] => (probe_dst_addr, probe_src_port, probe_dst_port)
-        probes_by_file[hash(probe[:-2]) % n_files].append(probe)
-        n_probes += 1
-        if n_probes % max_probes_in_memory == 0:
-            flush(probes_by_file, outputs)
 
-    flush(probes_by_file, outputs)
+    tracer = Tracer()
+    with tracer.span("worker", subset=str(subset)) as worker_span:
+        outputs: list[tuple] = []
+        for i in range(n_files):
+            ctx = ZstdCompressor(level=1)
+            file = prefix.with_suffix(f".{i}.csv.zst").open("wb")
+            stream = ctx.stream_writer(file)
+            outputs.append((ctx, file, stream))
 
-    for ctx, file, stream in outputs:
-        stream.close()
-        file.close()
+        probes_by_file: list[list[Probe]] = [[] for _ in range(n_files)]
+        n_probes = 0
 
-    return n_probes
+        if rows is None:
+            probes = probe_generator_from_database(
+                client=ClickHouseClient(**client_config),
+                measurement_id=measurement_id,
+                round_=round_,
+                mapper_v4=mapper_v4,
+                mapper_v6=mapper_v6,
+                probe_src_port=probe_src_port,
+                probe_dst_port=probe_dst_port,
+                probe_ttl_geq=probe_ttl_geq,
+                probe_ttl_leq=probe_ttl_leq,
+                subsets=(subset,),
+                cap_max_ttl=cap_max_ttl,
+                max_port_offset=max_port_offset,
+            )
+        else:
+            probes = probe_generator_from_rows(
+                rows,
+                mapper_v4=mapper_v4,
+                mapper_v6=mapper_v6,
+                probe_src_port=probe_src_port,
+                probe_dst_port=probe_dst_port,
+                max_port_offset=max_port_offset,
+            )
+
+        # The query is executed lazily: its span ends with the first probe.
+        with tracer.span("query"):
+            probe = next(probes, None)
+
+        # The expansion span includes the flushes, which are recorded as nested spans.
+        with tracer.span("expansion"):
+            while probe is not None:
+                # probe[:-2] => (probe_dst_addr, probe_src_port, probe_dst_port)
+                probes_by_file[hash(probe[:-2]) % n_files].append(probe)
+                n_probes += 1
+                if n_probes % max_probes_in_memory == 0:
+                    flush(probes_by_file, outputs, tracer)
+                probe = next(probes, None)
+
+        flush(probes_by_file, outputs, tracer)
+
+        with tracer.span("close"):
+            for ctx, file, stream in outputs:
+                stream.close()
+                file.close()
 
+        worker_span["n_probes"] = n_probes
 
-def flush(probes_by_file: list[list[Probe]], outputs: list[tuple]) -> None:
-    for file_id, probes in enumerate(probes_by_file):
-        _, _, stream = outputs[file_id]
-        random.shuffle(probes)
-        for probe in probes:
-            stream.write(format_probe(*probe).encode("ascii") + b"\n")
-        probes.clear()
+    return n_probes, tracer.spans
+
+
+def flush(
+    probes_by_file: list[list[Probe]], outputs: list[tuple], tracer: Tracer
+) -> None:
+    with tracer.span("shuffle"):
+        for probes in probes_by_file:
+            random.shuffle(probes)
+    with tracer.span("compress"):
+        for file_id, probes in enumerate(probes_by_file):
+            _, _, stream = outputs[file_id]
+            for probe in probes:
+                stream.write(format_probe(*probe).encode("ascii") + b"\n")
+            probes.clear()
+
+
+def split_rows(rows: list[dict], subsets: list[IPNetwork]) -> list[list[dict]]:
+    """
+    Split rows of `GetProbesDiff` between disjoint subsets.
+
+    >>> from ipaddress import ip_network
+    >>> rows = [{"probe_dst_prefix": "::ffff:8.8.8.0"}, {"probe_dst_prefix": "::ffff:1.1.1.0"}]
+    >>> split_rows(rows, [ip_network("::ffff:0.0.0.0/101"), ip_network("::ffff:8.0.0.0/101")])
+    [[{'probe_dst_prefix': '::ffff:1.1.1.0'}], [{'probe_dst_prefix': '::ffff:8.8.8.0'}]]
+    """
+    order = sorted(range(len(subsets)), key=lambda i: subsets[i].network_address)
+    starts = [int(subsets[i].network_address) for i in order]
+    rows_by_subset: list[list[dict]] = [[] for _ in subsets]
+    for row in rows:
+        addr = IPv6Address(row["probe_dst_prefix"])
+        i = order[bisect_right(starts, int(addr)) - 1]
+        assert addr in subsets[i], f"{addr} is not in any subset"
+        rows_by_subset[i].append(row)
+    return rows_by_subset
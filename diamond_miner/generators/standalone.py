@@ -1,3 +1,4 @@
+import time
 from collections.abc import Iterable, Iterator, Sequence
 from ipaddress import IPv4Network, IPv6Network, ip_network
 
@@ -11,6 +12,7 @@ from diamond_miner.defaults import (
 )
 from diamond_miner.grid import ParameterGrid
 from diamond_miner.mappers import SequentialFlowMapper
+from diamond_miner.metrics import metrics
 from diamond_miner.typing import FlowMapper, Probe
 
 
@@ -172,12 +174,23 @@ def probe_generator(
         ):
             prefixes_.append((af, subprefix, subprefix_size, protocol))
 
-    grid = ParameterGrid(prefixes_, ttls, flow_ids).shuffled(seed=seed)
+    grid = ParameterGrid(prefixes_, ttls, flow_ids)
 
-    for (af, subprefix, subprefix_size, protocol), ttl, flow_id in grid:
-        mapper = mapper_v4 if af == 4 else mapper_v6
-        addr_offset, port_offset = mapper.offset(flow_id, subprefix)
-        yield subprefix + addr_offset, probe_src_port + port_offset, probe_dst_port, ttl, protocol
+    # The probes are counted once they have all been generated,
+    # to keep the loop free of any bookkeeping.
+    start_ns, n_probes = time.perf_counter_ns(), 0
+    try:
+        for (af, subprefix, subprefix_size, protocol), ttl, flow_id in grid.shuffled(
+            seed=seed
+        ):
+            mapper = mapper_v4 if af == 4 else mapper_v6
+            addr_offset, port_offset = mapper.offset(flow_id, subprefix)
+            yield subprefix + addr_offset, probe_src_port + port_offset, probe_dst_port, ttl, protocol
+        n_probes = len(grid)
+    finally:
+        metrics.observe_throughput(
+            "probes", n_probes, start_ns, generator="probe_generator"
+        )
 
 
 def probe_generator_by_flow(
@@ -208,17 +221,25 @@ def probe_generator_by_flow(
     Args:
         prefixes: TODO
     """
-    prefixes_: list[tuple[int, int, int, str, Iterable[int]]] = []
+    prefixes_: list[tuple[int, int, int, str, Sequence[int]]] = []
     for prefix, protocol, ttls in prefixes:
+        ttls_ = list(ttls)
         for af, subprefix, subprefix_size in split_prefix(
             prefix, prefix_len_v4, prefix_len_v6
         ):
-            prefixes_.append((af, subprefix, subprefix_size, protocol, ttls))
+            prefixes_.append((af, subprefix, subprefix_size, protocol, ttls_))
 
     grid = ParameterGrid(prefixes_, flow_ids).shuffled(seed=seed)
 
-    for (af, subprefix, subprefix_size, protocol, ttls), flow_id in grid:
-        mapper = mapper_v4 if af == 4 else mapper_v6
-        for ttl in ttls:
-            addr_offset, port_offset = mapper.offset(flow_id, subprefix)
-            yield subprefix + addr_offset, probe_src_port + port_offset, probe_dst_port, ttl, protocol
+    start_ns, n_probes = time.perf_counter_ns(), 0
+    try:
+        for (af, subprefix, subprefix_size, protocol, ttls), flow_id in grid:
+            mapper = mapper_v4 if af == 4 else mapper_v6
+            n_probes += len(ttls)
+            for ttl in ttls:
+                addr_offset, port_offset = mapper.offset(flow_id, subprefix)
+                yield subprefix + addr_offset, probe_src_port + port_offset, probe_dst_port, ttl, protocol
+    finally:
+        metrics.observe_throughput(
+            "probes", n_probes, start_ns, generator="probe_generator_by_flow"
+        )
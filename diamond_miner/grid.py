@@ -2,8 +2,6 @@ from collections.abc import Iterator, Sequence
 from random import randint
 from typing import Any
 
-from pygfc import Permutation
-
 
 # The Cython version is approx. 2x faster on a M1 CPU.
 class ParameterGrid:
@@ -34,6 +32,9 @@ class ParameterGrid:
     def shuffled(
         self, rounds: int = 6, seed: int | None = None
     ) -> Iterator[Sequence[Any]]:
+        # pygfc is imported on first use, as the other heavy modules.
+        from pygfc import Permutation
+
         seed = seed or randint(0, 2**64 - 1)
         perm = Permutation(len(self), rounds, seed)
         return (self[index] for index in perm)
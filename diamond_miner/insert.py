@@ -1,8 +1,10 @@
+from __future__ import annotations
+
 from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-from pych_client import ClickHouseClient
-
+from diamond_miner.budget import Allocation
 from diamond_miner.defaults import (
     DEFAULT_FAILURE_RATE,
     DEFAULT_PREFIX_LEN_V4,
@@ -12,11 +14,15 @@ from diamond_miner.defaults import (
 )
 from diamond_miner.format import format_ipv6
 from diamond_miner.generators.standalone import split_prefix
+from diamond_miner.metrics import metrics
+from diamond_miner.queries.insert_convergence import InsertConvergence
 from diamond_miner.queries.insert_mda_probes import InsertMDAProbes
 from diamond_miner.queries.query import Query, probes_table
 from diamond_miner.subsets import subsets_for
 from diamond_miner.typing import IPNetwork
-from diamond_miner.utilities import available_cpus
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
 
 
 @dataclass(frozen=True)
@@ -66,18 +72,74 @@ def insert_probe_counts(
         [[2, 6], [3, 6], [4, 6]]
     """
 
+    n_rows = metrics.counter("inserted_rows_total", operation="insert_probe_counts")
+
     def gen() -> Iterator[bytes]:
         for prefix, protocol, ttls, n_probes in prefixes:
             protocol = PROTOCOLS[protocol]  # type: ignore
             for af, subprefix, subprefix_size in split_prefix(
                 prefix, prefix_len_v4, prefix_len_v6
             ):
-                yield "\n".join(
+                rows = [
                     f'[{protocol},"{format_ipv6(subprefix)}",{ttl},{n_probes},{round_}]'
                     for ttl in ttls
-                ).encode()
+                ]
+                n_rows.inc(len(rows))
+                yield "\n".join(rows).encode()
+
+    with metrics.histogram(
+        "insert_duration_seconds", operation="insert_probe_counts"
+    ).time():
+        InsertProbes().execute(client, measurement_id, data=gen())
+
+
+def insert_allocation(
+    client: ClickHouseClient,
+    measurement_id: str,
+    round_: int,
+    allocation: Allocation,
+) -> None:
+    """
+    Record the number of probes sent at a round whose probes did not fit in the budget.
 
-    InsertProbes().execute(client, measurement_id, data=gen())
+    For each TTL where fewer probes are allocated than requested, a second row is inserted
+    into the probes table with the cumulative number of probes allocated.
+    `GetProbesDiff` takes the smallest of the two rows as the number of probes already sent
+    at the next round, so that the dropped probes are requested again.
+
+    Args:
+        client: ClickHouse client.
+        measurement_id: Measurement id.
+        round_: Round number of the allocation.
+        allocation: Allocation returned by `diamond_miner.budget.allocate_budget`.
+
+    Examples:
+        >>> from diamond_miner.budget import allocate_budget
+        >>> from diamond_miner.queries import GetProbesDiff
+        >>> from diamond_miner.test import client, create_tables
+        >>> create_tables(client, "test_insert_allocation")
+        >>> insert_probe_counts(client, "test_insert_allocation", 1, [("8.8.8.0/24", "icmp", [1, 2], 6)])
+        >>> rows = GetProbesDiff(round_eq=1).execute(client, "test_insert_allocation")
+        >>> insert_allocation(client, "test_insert_allocation", 1, allocate_budget(rows, budget=4))
+        >>> [row["probes_per_ttl"] for row in GetProbesDiff(round_eq=1, sent=True).execute(client, "test_insert_allocation")]
+        [[[1, 2, 0], [2, 2, 0]]]
+    """
+    n_rows = metrics.counter("inserted_rows_total", operation="insert_allocation")
+
+    def gen() -> Iterator[bytes]:
+        for row in allocation.partial_rows:
+            rows = [
+                f'[{row["probe_protocol"]},"{row["probe_dst_prefix"]}",{ttl},{total},{round_}]'
+                for ttl, total, _ in row["probes_per_ttl"]
+            ]
+            n_rows.inc(len(rows))
+            yield "\n".join(rows).encode()
+
+    if allocation.partial_rows:
+        with metrics.histogram(
+            "insert_duration_seconds", operation="insert_allocation"
+        ).time():
+            InsertProbes().execute(client, measurement_id, data=gen())
 
 
 def insert_mda_probe_counts(
@@ -86,7 +148,13 @@ def insert_mda_probe_counts(
     previous_round: int,
     adaptive_eps: bool = False,
     target_epsilon: float = DEFAULT_FAILURE_RATE,
-    concurrent_requests: int = max(available_cpus() // 8, 1),
+    concurrent_requests: int | None = None,
+    filter_partial: bool = True,
+    filter_virtual: bool = True,
+    star_ttls_threshold: int | None = None,
+    star_ttls_thresholds: tuple[tuple[str, int], ...] = (),
+    exclude_loops: bool = False,
+    freeze_converged: bool = False,
 ) -> None:
     """
     Run the Diamond-Miner algorithm and insert the resulting probes into the probes table.
@@ -97,18 +165,51 @@ def insert_mda_probe_counts(
         previous_round: Round on which to run the Diamond-Miner algorithm.
         adaptive_eps: Set to `True` to handle nested load-balancers.
         target_epsilon: Target failure rate of the MDA algorithm.
-        concurrent_requests: Maximum number of requests to execute concurrently.
+        concurrent_requests: Maximum number of requests to execute concurrently (chosen by `diamond_miner.autotune` if not specified).
+        filter_partial: Set to `False` to take into account the partial links.
+        filter_virtual: Set to `False` to take into account the virtual links.
+        star_ttls_threshold: Do not send new probes to the TTLs where at least this number of flows
+            have been observed without any reply (see `GetMDAProbes.star_ttls_threshold`).
+        star_ttls_thresholds: Per-prefix overrides of `star_ttls_threshold`, as `(network, threshold)` pairs.
+        exclude_loops: Set to `True` to not send probes inside the loops found by `InsertPrefixes`.
+        freeze_converged: Set to `True` to record the number of new links discovered in each prefix
+            at `previous_round` into the convergence table, and to not send probes anymore
+            to the prefixes where a round did not discover any new link (see `InsertConvergence`).
+            Under a probe budget, the allocation of `previous_round` must have been written
+            with `insert_allocation`, so that the prefixes whose probes were dropped are not frozen.
+            The convergence table must have been created, e.g. with `CreateTables(convergence_table=True)`.
     """
-    # TODO: set filter_partial and filter_virtual to false?
     query = InsertMDAProbes(
         adaptive_eps=adaptive_eps,
         round_leq=previous_round,
-        filter_partial=True,
-        filter_virtual=True,
+        filter_partial=filter_partial,
+        filter_virtual=filter_virtual,
         filter_inter_round=True,
         target_epsilon=target_epsilon,
+        star_ttls_threshold=star_ttls_threshold,
+        star_ttls_thresholds=star_ttls_thresholds,
+        exclude_loops=exclude_loops,
+        skip_converged=freeze_converged,
     )
-    subsets = subsets_for(query, client, measurement_id)
-    query.execute_concurrent(
-        client, measurement_id, subsets=subsets, concurrent_requests=concurrent_requests
-    )
+    with metrics.histogram(
+        "insert_duration_seconds", operation="insert_mda_probe_counts"
+    ).time():
+        subsets = subsets_for(query, client, measurement_id)
+        if freeze_converged:
+            InsertConvergence(
+                incremental_round=previous_round,
+                filter_partial=filter_partial,
+                filter_virtual=filter_virtual,
+                filter_inter_round=True,
+            ).execute_concurrent(
+                client,
+                measurement_id,
+                subsets=subsets,
+                concurrent_requests=concurrent_requests,
+            )
+        query.execute_concurrent(
+            client,
+            measurement_id,
+            subsets=subsets,
+            concurrent_requests=concurrent_requests,
+        )
@@ -6,8 +6,6 @@ We make the flow ID start at 0.
 """
 import random
 
-from pygfc import Permutation
-
 from diamond_miner.defaults import DEFAULT_PREFIX_SIZE_V4
 
 
@@ -124,6 +122,9 @@ class RandomFlowMapper:
     """
 
     def __init__(self, seed: int, prefix_size: int = DEFAULT_PREFIX_SIZE_V4):
+        # pygfc is imported on first use, as the other heavy modules.
+        from pygfc import Permutation
+
         # We can generate a random permutation up to 2^64-1 only.
         assert prefix_size > 0, "prefix_size must be positive."
         self.permutations = []
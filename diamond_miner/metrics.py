@@ -0,0 +1,300 @@
+"""
+Lightweight in-process metrics: counters, gauges and latency histograms.
+
+The metrics are recorded in the global `metrics` registry and can be exported
+as JSON or in the Prometheus text format, for example at the end of a round:
+
+```python
+from diamond_miner.metrics import metrics
+
+Path("metrics.prom").write_text(metrics.to_prometheus())
+```
+"""
+import json
+import time
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600)
+"""Default histogram buckets (in seconds)."""
+
+PROMETHEUS_PREFIX = "diamond_miner_"
+"""Prefix of the metrics names in the Prometheus export."""
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Counter:
+    """A monotonically increasing value."""
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.value: float = 0
+
+    def inc(self, amount: float = 1) -> None:
+        assert amount >= 0, "counters can only be incremented."
+        with self.lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value that can go up and down."""
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.value: float = 0
+
+    def set(self, value: float) -> None:
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value -= amount
+
+
+class Histogram:
+    """
+    A distribution of values (typically latencies, in seconds) over fixed buckets.
+
+    Examples:
+        >>> histogram = Histogram(buckets=(0.1, 1.0))
+        >>> for value in (0.05, 0.5, 5.0):
+        ...     histogram.observe(value)
+        >>> histogram.count, histogram.sum
+        (3, 5.55)
+        >>> histogram.cumulative_counts()
+        [1, 2, 3]
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.lock = Lock()
+        self.buckets = tuple(sorted(buckets))
+        # The last count is for the implicit `+Inf` bucket.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum: float = 0
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.count += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the execution time of a code block, in seconds."""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe((time.perf_counter_ns() - start) / 10**9)
+
+    def cumulative_counts(self) -> list[int]:
+        """Number of observations less or equal to each bucket bound (and `+Inf`)."""
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class MetricsRegistry:
+    """
+    A collection of named metrics.
+    A metric is identified by its name and its labels.
+
+    Examples:
+        >>> registry = MetricsRegistry()
+        >>> registry.counter("probes_total", generator="parallel").inc(10)
+        >>> registry.counter("probes_total", generator="parallel").inc(5)
+        >>> registry.gauge("subsets").set(2)
+        >>> print(registry.to_prometheus())
+        # TYPE diamond_miner_probes_total counter
+        diamond_miner_probes_total{generator="parallel"} 15
+        # TYPE diamond_miner_subsets gauge
+        diamond_miner_subsets 2
+        <BLANKLINE>
+        >>> registry.to_dict()["counters"]
+        [{'name': 'probes_total', 'labels': {'generator': 'parallel'}, 'value': 15}]
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.counters: dict[tuple[str, Labels], Counter] = {}
+        self.gauges: dict[tuple[str, Labels], Gauge] = {}
+        self.histograms: dict[tuple[str, Labels], Histogram] = {}
+
+    def counter(self, name: str, **labels: Any) -> Counter:
+        """Return the counter with the given name and labels, creating it if needed."""
+        key = (name, to_labels(labels))
+        with self.lock:
+            if key not in self.counters:
+                self.counters[key] = Counter()
+            return self.counters[key]
+
+    def gauge(self, name: str, **labels: Any) -> Gauge:
+        """Return the gauge with the given name and labels, creating it if needed."""
+        key = (name, to_labels(labels))
+        with self.lock:
+            if key not in self.gauges:
+                self.gauges[key] = Gauge()
+            return self.gauges[key]
+
+    def histogram(
+        self, name: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **labels: Any
+    ) -> Histogram:
+        """Return the histogram with the given name and labels, creating it if needed."""
+        key = (name, to_labels(labels))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            return self.histograms[key]
+
+    def observe_throughput(
+        self, name: str, count: int, start_ns: int, **labels: Any
+    ) -> None:
+        """
+        Increment the `{name}_total` counter by `count` and set the `{name}_per_second`
+        gauge to the rate since `start_ns` (as returned by `time.perf_counter_ns`).
+
+        Examples:
+            >>> registry = MetricsRegistry()
+            >>> registry.observe_throughput("probes", 10, time.perf_counter_ns(), generator="test")
+            >>> registry.counter("probes_total", generator="test").value
+            10
+            >>> registry.gauge("probes_per_second", generator="test").value > 0
+            True
+        """
+        elapsed = max(time.perf_counter_ns() - start_ns, 1) / 10**9
+        self.counter(f"{name}_total", **labels).inc(count)
+        self.gauge(f"{name}_per_second", **labels).set(count / elapsed)
+
+    def clear(self) -> None:
+        """Remove all the metrics, e.g. at the beginning of a new round."""
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def to_dict(self) -> dict[str, list[dict]]:
+        with self.lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": counter.value}
+                    for (name, labels), counter in sorted(self.counters.items())
+                ],
+                "gauges": [
+                    {"name": name, "labels": dict(labels), "value": gauge.value}
+                    for (name, labels), gauge in sorted(self.gauges.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": dict(
+                            zip(
+                                [*map(str, histogram.buckets), "+Inf"],
+                                histogram.cumulative_counts(),
+                            )
+                        ),
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def to_json(self) -> str:
+        """Export the metrics as a JSON document."""
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self) -> str:
+        """Export the metrics in the Prometheus text-based exposition format."""
+        lines = []
+        with self.lock:
+            collections: tuple[
+                tuple[str, Mapping[tuple[str, Labels], Counter | Gauge]], ...
+            ] = (
+                ("counter", self.counters),
+                ("gauge", self.gauges),
+            )
+            for kind, collection in collections:
+                previous = None
+                for (name, labels), metric in sorted(collection.items()):
+                    if name != previous:
+                        lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+                        previous = name
+                    lines.append(
+                        f"{PROMETHEUS_PREFIX}{name}{format_labels(labels)} {format_value(metric.value)}"
+                    )
+            previous = None
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name != previous:
+                    lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} histogram")
+                    previous = name
+                bounds = [*map(format_value, histogram.buckets), "+Inf"]
+                for bound, count in zip(bounds, histogram.cumulative_counts()):
+                    bucket_labels = format_labels((*labels, ("le", bound)))
+                    lines.append(
+                        f"{PROMETHEUS_PREFIX}{name}_bucket{bucket_labels} {count}"
+                    )
+                lines.append(
+                    f"{PROMETHEUS_PREFIX}{name}_sum{format_labels(labels)} {format_value(histogram.sum)}"
+                )
+                lines.append(
+                    f"{PROMETHEUS_PREFIX}{name}_count{format_labels(labels)} {histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+
+def to_labels(labels: dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels: Labels) -> str:
+    r"""
+    >>> format_labels(())
+    ''
+    >>> format_labels((("query", "GetLinks"), ("le", "0.1")))
+    '{query="GetLinks",le="0.1"}'
+    >>> print(format_labels((("path", 'C:\\"a"\nb'),)))
+    {path="C:\\\"a\"\nb"}
+    """
+    if not labels:
+        return ""
+    return (
+        "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels) + "}"
+    )
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value as required by the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_value(value: float) -> str:
+    """
+    >>> format_value(15.0)
+    '15'
+    >>> format_value(0.25)
+    '0.25'
+    """
+    if float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+metrics = MetricsRegistry()
+"""Global metrics registry."""
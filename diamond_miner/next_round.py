@@ -0,0 +1,231 @@
+"""
+Compute the probes of the next round from columnar links, without ClickHouse.
+
+`next_round_probes` returns the same rows as `GetMDAProbes`, from the links returned by
+`GetLinks(include_metadata=True, include_probe=True).execute_columns(...)` (see `fetch_links`).
+It is a pure function of its inputs, so that the links can be split between worker processes,
+for example by subset, and it can be used to cross-check the SQL implementation:
+
+```python
+from diamond_miner.next_round import fetch_links, next_round_probes
+from diamond_miner.queries import GetMDAProbes
+
+query = GetMDAProbes(round_leq=1, filter_partial=True, filter_virtual=True, filter_inter_round=True)
+rows = next_round_probes(fetch_links(client, measurement_id, query), query)
+```
+
+Only D-Miner lite (`dminer_lite=True`) is supported, without the options that read
+other tables (`cap_max_ttl`, `exclude_loops`, `skip_converged` and the star TTLs trimming).
+
+This module requires NumPy (`pip install diamond-miner[numpy]`).
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable
+from functools import cache
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from diamond_miner.columnar import Columns
+from diamond_miner.defaults import DEFAULT_FAILURE_RATE, UNIVERSE_SUBSET
+from diamond_miner.format import format_ipv6
+from diamond_miner.queries import GetLinks, GetMDAProbes, LinksQuery
+from diamond_miner.typing import IPNetwork
+from diamond_miner.utilities import common_parameters
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
+
+
+def stopping_points(links: np.ndarray, eps: np.ndarray | float) -> np.ndarray:
+    """
+    Vectorized `diamond_miner.mda.stopping_point`: return the number of probes to send
+    to detect one more link than the number of `links` observed, that is `n_{k+1}`.
+    The computation is the same as in `GetMDAProbes`.
+
+    Examples:
+        >>> stopping_points(np.array([0, 1, 2, 10, 100]), 0.05).tolist()
+        [0, 6, 11, 57, 765]
+        >>> from diamond_miner.mda import stopping_point
+        >>> expected = [stopping_point(k + 1, 0.01) for k in range(1000)]
+        >>> stopping_points(np.arange(1000), 0.01).tolist() == expected
+        True
+    """
+    k = np.asarray(links, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        n: np.ndarray = np.ceil(np.log(eps / (k + 1)) / np.log(k / (k + 1)))
+    return n.astype(np.uint32)
+
+
+def adaptive_epsilon(
+    max_links: np.ndarray | int, target_epsilon: float = DEFAULT_FAILURE_RATE
+) -> np.ndarray:
+    """
+    Return the failure rate to use at each TTL of a prefix so that the failure rate of the prefix
+    is `target_epsilon`, given the maximum number of links per TTL (`GetMDAProbes.adaptive_eps`).
+
+    Examples:
+        >>> adaptive_epsilon(np.array([0, 1, 4]), 0.05).round(4).tolist()
+        [0.05, 0.05, 0.0127]
+    """
+    max_links = np.asarray(max_links, dtype=np.float64)
+    with np.errstate(divide="ignore"):
+        eps = 1 - np.exp(np.log(1 - target_epsilon) / max_links)
+    return np.where(max_links == 0, target_epsilon, eps)
+
+
+@cache
+def stopping_point_table(max_links: int, eps: float) -> np.ndarray:
+    """
+    Return the `stopping_points` of `0, ..., max_links` links.
+    The tables are memoized and read-only.
+
+    Examples:
+        >>> stopping_point_table(3, 0.05).tolist()
+        [0, 6, 11, 16]
+    """
+    table = stopping_points(np.arange(max_links + 1), eps)
+    table.flags.writeable = False
+    return table
+
+
+@cache
+def adaptive_stopping_point_table(max_links: int, target_epsilon: float) -> np.ndarray:
+    """
+    Return the `stopping_points` of `0, ..., max_links` links (second index),
+    for a maximum number of links per TTL of `0, ..., max_links` (first index),
+    with the adaptive failure rate.
+    The tables are memoized and read-only.
+
+    Examples:
+        >>> adaptive_stopping_point_table(3, 0.05)[2].tolist()
+        [0, 7, 12, 18]
+    """
+    eps = adaptive_epsilon(np.arange(max_links + 1), target_epsilon)
+    table = stopping_points(np.arange(max_links + 1)[None, :], eps[:, None])
+    table.flags.writeable = False
+    return table
+
+
+def fetch_links(
+    client: ClickHouseClient,
+    measurement_id: str,
+    query: GetMDAProbes,
+    *,
+    subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
+) -> Columns:
+    """
+    Fetch the links used by `query`, in the format expected by `next_round_probes`.
+    """
+    return GetLinks(
+        **common_parameters(query, LinksQuery),
+        include_metadata=True,
+        include_probe=True,
+    ).execute_columns(
+        client,
+        measurement_id,
+        columns=[
+            "probe_protocol",
+            "probe_src_addr",
+            "probe_dst_prefix",
+            "near_ttl",
+            "near_addr",
+            "far_addr",
+        ],
+        subsets=subsets,
+    )
+
+
+def next_round_probes(
+    links: Columns, query: GetMDAProbes = GetMDAProbes()
+) -> list[dict]:
+    """
+    Compute the number of probes to send per prefix and per TTL, as `GetMDAProbes`.
+
+    Args:
+        links: Links of the prefixes (see `fetch_links`); the duplicate links are ignored.
+        query: `GetMDAProbes` query whose parameters to use.
+            The filters must have been applied when fetching the links.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> links = fetch_links(client, "test_nsdi_lite", GetMDAProbes(round_leq=1))
+        >>> next_round_probes(links, GetMDAProbes(round_leq=1))
+        [{'probe_protocol': 1, 'probe_dst_prefix': '::ffff:200.0.0.0', 'cumulative_probes': [12, 12, 12, 12], 'TTLs': [1, 2, 3, 4]}]
+        >>> next_round_probes({})
+        []
+    """
+    assert query.dminer_lite, "only dminer_lite=True is supported"
+    assert not (
+        query.cap_max_ttl
+        or query.exclude_loops
+        or query.skip_converged
+        or query.trim_star_ttls()
+    ), "cap_max_ttl, exclude_loops, skip_converged and star_ttls_threshold are not supported"
+    if not links or not len(links["near_ttl"]):
+        return []
+
+    # 1) Sort and deduplicate the links.
+    #    The columns are (protocol, src_addr, dst_prefix, near_ttl, near_addr, far_addr),
+    #    with the IPv6 addresses split in two.
+    keys = np.column_stack(
+        [
+            links["probe_protocol"].astype(np.uint64),
+            links["probe_src_addr"],
+            links["probe_dst_prefix"],
+            links["near_ttl"].astype(np.uint64),
+            links["near_addr"],
+            links["far_addr"],
+        ]
+    )
+    keys = keys[np.lexsort(keys.T[::-1])]
+    keys = keys[np.r_[True, np.any(keys[1:] != keys[:-1], axis=1)]]
+
+    # 2) Find the prefixes, and their minimum and maximum near TTLs.
+    prefixes = keys[:, :5]
+    ttls = keys[:, 5].astype(np.int64)
+    starts = np.flatnonzero(np.r_[True, np.any(prefixes[1:] != prefixes[:-1], axis=1)])
+    prefix_ids = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(keys)]))
+    min_ttls = ttls[starts]
+    # The TTLs go up to the maximum near TTL + 1, as in `GetMDAProbes`.
+    n_ttls = np.maximum.reduceat(ttls, starts) - min_ttls + 2
+    offsets = np.r_[0, np.cumsum(n_ttls)]
+
+    # 3) Count the links per TTL, in a flat array of all the TTLs of all the prefixes.
+    links_per_ttl = np.bincount(
+        offsets[prefix_ids] + ttls - min_ttls[prefix_ids], minlength=offsets[-1]
+    )
+
+    # 4) Compute the MDA stopping points.
+    max_links = int(links_per_ttl.max())
+    if query.adaptive_eps:
+        # The tables are memoized by powers of two to be reused between calls.
+        table = adaptive_stopping_point_table(
+            1 << max_links.bit_length(), query.target_epsilon
+        )
+        prefix_max_links = np.maximum.reduceat(links_per_ttl, offsets[:-1])
+        mda_flows = table[np.repeat(prefix_max_links, n_ttls), links_per_ttl]
+    else:
+        table = stopping_point_table(1 << max_links.bit_length(), query.target_epsilon)
+        mda_flows = table[links_per_ttl]
+
+    # 5) Send the maximum of the probes of TTL t and t-1.
+    previous_flows = np.r_[0, mda_flows[:-1]]
+    previous_flows[offsets[:-1]] = 0
+    cumulative_probes = np.maximum(mda_flows, previous_flows)
+
+    rows = []
+    for start, probes, min_ttl in zip(
+        starts, np.split(cumulative_probes, offsets[1:-1]), min_ttls.tolist()
+    ):
+        protocol, _, _, prefix_hi, prefix_lo = prefixes[start].tolist()
+        rows.append(
+            {
+                "probe_protocol": protocol,
+                "probe_dst_prefix": format_ipv6((prefix_hi << 64) | prefix_lo),
+                "cumulative_probes": probes.tolist(),
+                "TTLs": list(range(min_ttl, min_ttl + len(probes))),
+            }
+        )
+    return rows
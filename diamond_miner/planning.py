@@ -0,0 +1,195 @@
+"""
+Predict the cost of a round before generating its probes.
+
+The prediction only reads the probe counts of the probes table (see `CountProbesPerTTL`),
+and does not expand any probe, so that it is cheap compared to the generation itself.
+With a probe budget, the probe counts of each prefix are read and shared between the prefixes
+(see `diamond_miner.budget.allocate_budget`), and the resulting allocation is returned,
+to be passed to the generators and recorded with `diamond_miner.insert.insert_allocation`
+once the probes are sent:
+
+```python
+from diamond_miner.planning import plan_round
+
+plan = plan_round(client, measurement_id, round_, probing_rate=100_000)
+if plan.probing_time > window:
+    ...
+```
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+from diamond_miner.budget import Allocation, Key, allocate_budget
+from diamond_miner.defaults import (
+    DEFAULT_MAX_PORT_OFFSET,
+    DEFAULT_PREFIX_SIZE_V4,
+    DEFAULT_PREFIX_SIZE_V6,
+    PROTOCOLS,
+    UNIVERSE_SUBSET,
+)
+from diamond_miner.queries import CountProbesPerTTL, GetProbesDiff
+from diamond_miner.typing import IPNetwork
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
+
+DEFAULT_COMPRESSED_BYTES_PER_PROBE = 8
+"""
+Estimated size of a probe in the files written by `probe_generator_parallel` (Zstd-compressed CSV).
+Measured on shuffled probes: about 7.5 bytes for IPv4 probes and 6 bytes for IPv6 probes.
+"""
+
+
+@dataclass(frozen=True)
+class RoundPlan:
+    probes: int
+    "Number of probes to send."
+    probes_per_protocol: dict[str, int]
+    "Number of probes to send for each protocol."
+    probes_per_ttl: dict[int, int]
+    "Number of probes to send at each TTL."
+    compressed_bytes: int
+    "Predicted size of the probes file."
+    probing_time: float | None
+    "Predicted probing time, in seconds (`None` if the probing rate is not specified)."
+    allocation: Allocation | None = field(default=None, repr=False)
+    """
+    Probes allocated with a probe budget (`None` without a budget), to be passed to the generators
+    and recorded with `diamond_miner.insert.insert_allocation` once the probes are sent.
+    """
+
+
+def plan_round(
+    client: ClickHouseClient,
+    measurement_id: str,
+    round_: int,
+    *,
+    probing_rate: float | None = None,
+    bytes_per_probe: float = DEFAULT_COMPRESSED_BYTES_PER_PROBE,
+    probe_ttl_geq: int | None = None,
+    probe_ttl_leq: int | None = None,
+    cap_max_ttl: bool = False,
+    subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
+    max_port_offset: int | None = DEFAULT_MAX_PORT_OFFSET,
+    prefix_size_v4: int = DEFAULT_PREFIX_SIZE_V4,
+    prefix_size_v6: int = DEFAULT_PREFIX_SIZE_V6,
+    budget: int | None = None,
+    max_probes_per_prefix: int | None = None,
+    rates: Mapping[Key, float] | None = None,
+) -> RoundPlan:
+    """
+    Predict the number of probes, the file size and the probing time of a round,
+    from the probe counts inserted in the probes table (e.g. by `insert_mda_probe_counts`).
+
+    Args:
+        client: ClickHouse client.
+        measurement_id: Measurement id.
+        round_: Number of the round to plan.
+        probing_rate: Probing rate, in packets per second.
+        bytes_per_probe: Size of a probe in the probes file.
+        probe_ttl_geq: Same as the `probe_generator_parallel` parameter.
+        probe_ttl_leq: Same as the `probe_generator_parallel` parameter.
+        cap_max_ttl: Same as the `probe_generator_from_database` parameter.
+        subsets: Subsets of the probes table to read.
+        max_port_offset: Same as the `probe_generator_parallel` parameter.
+        prefix_size_v4: Size of the IPv4 prefixes of the flow mappers, used with `max_port_offset`.
+        prefix_size_v6: Size of the IPv6 prefixes of the flow mappers, used with `max_port_offset`.
+        budget: Maximum number of probes to send, over all the subsets (see `diamond_miner.budget.allocate_budget`).
+        max_probes_per_prefix: Maximum number of probes to send to a single prefix.
+        rates: Discovery rate of each prefix, used to choose the probes to send
+            when the budget is exceeded (see `diamond_miner.budget.discovery_rates`).
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> plan_round(client, "test_nsdi_example", 3, probing_rate=10)
+        RoundPlan(probes=20, probes_per_protocol={'icmp': 20}, probes_per_ttl={2: 2, 3: 9, 4: 9}, compressed_bytes=160, probing_time=2.0)
+        >>> plan = plan_round(client, "test_nsdi_example", 3, budget=10)
+        >>> plan.probes_per_ttl
+        {2: 2, 3: 4, 4: 4}
+        >>> plan.allocation.requested, plan.allocation.allocated
+        (20, 10)
+        >>> plan_round(client, "test_nsdi_example", 3, max_port_offset=0, prefix_size_v4=20).probes_per_ttl
+        {2: 2, 3: 2, 4: 2}
+    """
+    # The flow mappers use the ports once all the addresses of a prefix are used,
+    # so the flows after the first `prefix_size + max_port_offset` flows are not sent.
+    max_flows_v4, max_flows_v6 = None, None
+    if max_port_offset is not None:
+        max_flows_v4 = prefix_size_v4 + max_port_offset
+        max_flows_v6 = prefix_size_v6 + max_port_offset
+    rows: Iterator[dict]
+    allocation = None
+    if budget is not None or max_probes_per_prefix is not None:
+        allocation = allocate_budget(
+            GetProbesDiff(
+                round_eq=round_,
+                probe_ttl_geq=probe_ttl_geq,
+                probe_ttl_leq=probe_ttl_leq,
+                cap_max_ttl=cap_max_ttl,
+            ).execute_iter(client, measurement_id, subsets=subsets),
+            budget=budget,
+            max_probes_per_prefix=max_probes_per_prefix,
+            rates=rates,
+            max_flows_v4=max_flows_v4,
+            max_flows_v6=max_flows_v6,
+        )
+        rows = count_probes_per_ttl(allocation.rows, max_flows_v4, max_flows_v6)
+    else:
+        rows = CountProbesPerTTL(
+            round_eq=round_,
+            probe_ttl_geq=probe_ttl_geq,
+            probe_ttl_leq=probe_ttl_leq,
+            cap_max_ttl=cap_max_ttl,
+            max_flows_v4=max_flows_v4,
+            max_flows_v6=max_flows_v6,
+        ).execute_iter(client, measurement_id, subsets=subsets)
+    probes_per_protocol: dict[str, int] = {}
+    probes_per_ttl: dict[int, int] = {}
+    for row in rows:
+        protocol = str(PROTOCOLS[row["probe_protocol"]])
+        probes_per_protocol[protocol] = (
+            probes_per_protocol.get(protocol, 0) + row["count"]
+        )
+        probes_per_ttl[row["probe_ttl"]] = (
+            probes_per_ttl.get(row["probe_ttl"], 0) + row["count"]
+        )
+    probes = sum(probes_per_ttl.values())
+    return RoundPlan(
+        probes=probes,
+        probes_per_protocol=dict(sorted(probes_per_protocol.items())),
+        probes_per_ttl=dict(sorted(probes_per_ttl.items())),
+        compressed_bytes=round(probes * bytes_per_probe),
+        probing_time=probes / probing_rate if probing_rate else None,
+        allocation=allocation,
+    )
+
+
+def count_probes_per_ttl(
+    rows: Iterable[dict], max_flows_v4: int | None, max_flows_v6: int | None
+) -> Iterator[dict]:
+    """
+    Same as `CountProbesPerTTL`, for rows of `GetProbesDiff` already in memory.
+
+    Examples:
+        >>> rows = [{"probe_protocol": 1, "probe_dst_prefix": "::ffff:8.8.8.0", "probes_per_ttl": [[1, 6, 2], [2, 3, 0]]}]
+        >>> list(count_probes_per_ttl(rows, 4, None))
+        [{'probe_protocol': 1, 'probe_ttl': 1, 'count': 2}, {'probe_protocol': 1, 'probe_ttl': 2, 'count': 3}]
+    """
+    for row in rows:
+        max_flows = (
+            max_flows_v4
+            if row["probe_dst_prefix"].startswith("::ffff:")
+            else max_flows_v6
+        )
+        for ttl, total, sent in row["probes_per_ttl"]:
+            if max_flows is not None:
+                total = min(total, max_flows)
+            if total > sent:
+                yield {
+                    "probe_protocol": row["probe_protocol"],
+                    "probe_ttl": ttl,
+                    "count": total - sent,
+                }
@@ -8,61 +8,114 @@ Refer to the following superclasses for more information:
 [PrefixesQuery][diamond_miner.queries.PrefixesQuery],
 [ProbesQuery][diamond_miner.queries.ProbesQuery],
 [ResultsQuery][diamond_miner.queries.ResultsQuery].
+
+The submodules are imported on first access, so that importing a single query
+does not import all the others.
 """
-from .count import Count
-from .count_rows import CountLinksPerPrefix, CountProbesPerPrefix, CountResultsPerPrefix
-from .create_links_table import CreateLinksTable
-from .create_prefixes_table import CreatePrefixesTable
-from .create_probes_table import CreateProbesTable
-from .create_results_table import CreateResultsTable
-from .create_tables import CreateTables
-from .drop_tables import DropTables
-from .get_invalid_prefixes import (
-    GetInvalidPrefixes,
-    GetPrefixesWithAmplification,
-    GetPrefixesWithLoops,
-)
-from .get_links import GetLinks
-from .get_links_from_results import GetLinksFromResults
-from .get_mda_probes import GetMDAProbes
-from .get_nodes import GetNodes
-from .get_prefixes import GetPrefixes
-from .get_probes import GetProbes, GetProbesDiff
-from .get_results import GetResults
-from .get_sliding_prefixes import GetSlidingPrefixes
-from .insert_links import InsertLinks
-from .insert_mda_probes import InsertMDAProbes
-from .insert_prefixes import InsertPrefixes
-from .insert_results import InsertResults
-from .query import (
-    LinksQuery,
-    PrefixesQuery,
-    ProbesQuery,
-    Query,
-    ResultsQuery,
-    StoragePolicy,
-    links_table,
-    prefixes_table,
-    probes_table,
-    results_table,
-)
+from importlib import import_module
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:  # pragma: no cover
+    from diamond_miner.queries.count import Count
+    from diamond_miner.queries.count_rows import (
+        CountLinksPerPrefix,
+        CountNewLinksPerPrefix,
+        CountProbesPerPrefix,
+        CountProbesPerTTL,
+        CountResultsPerPrefix,
+    )
+    from diamond_miner.queries.create_convergence_table import CreateConvergenceTable
+    from diamond_miner.queries.create_flows_table import CreateFlowsTable
+    from diamond_miner.queries.create_invalid_prefixes_sets import (
+        CreateInvalidPrefixesSets,
+    )
+    from diamond_miner.queries.create_links_summary_table import CreateLinksSummaryTable
+    from diamond_miner.queries.create_links_table import CreateLinksTable
+    from diamond_miner.queries.create_nodes_summary_table import CreateNodesSummaryTable
+    from diamond_miner.queries.create_prefixes_table import CreatePrefixesTable
+    from diamond_miner.queries.create_private_prefixes_dictionary import (
+        CreatePrivatePrefixesDictionary,
+    )
+    from diamond_miner.queries.create_probes_table import CreateProbesTable
+    from diamond_miner.queries.create_results_table import CreateResultsTable
+    from diamond_miner.queries.create_tables import CreateTables
+    from diamond_miner.queries.drop_tables import DropTables
+    from diamond_miner.queries.get_discovery_rates import GetDiscoveryRates
+    from diamond_miner.queries.get_invalid_prefixes import (
+        GetInvalidPrefixes,
+        GetPrefixesWithAmplification,
+        GetPrefixesWithLoops,
+    )
+    from diamond_miner.queries.get_links import GetLinks
+    from diamond_miner.queries.get_links_from_results import GetLinksFromResults
+    from diamond_miner.queries.get_max_ttl import GetMaxTTL
+    from diamond_miner.queries.get_mda_probes import GetMDAProbes
+    from diamond_miner.queries.get_nodes import GetNodes
+    from diamond_miner.queries.get_prefixes import GetPrefixes
+    from diamond_miner.queries.get_prefixes_from_results import GetPrefixesFromResults
+    from diamond_miner.queries.get_probes import GetProbes, GetProbesDiff
+    from diamond_miner.queries.get_results import GetResults
+    from diamond_miner.queries.get_sliding_prefixes import GetSlidingPrefixes
+    from diamond_miner.queries.insert_convergence import InsertConvergence
+    from diamond_miner.queries.insert_invalid_prefixes_sets import (
+        InsertInvalidPrefixesSets,
+    )
+    from diamond_miner.queries.insert_links import InsertLinks
+    from diamond_miner.queries.insert_links_summary import InsertLinksSummary
+    from diamond_miner.queries.insert_mda_probes import InsertMDAProbes
+    from diamond_miner.queries.insert_nodes_summary import InsertNodesSummary
+    from diamond_miner.queries.insert_prefixes import InsertPrefixes
+    from diamond_miner.queries.insert_results import InsertResults
+    from diamond_miner.queries.query import (
+        LinksQuery,
+        PrefixesQuery,
+        ProbesQuery,
+        Query,
+        ResultsQuery,
+        StoragePolicy,
+        amplification_prefixes_set,
+        converged_prefixes_set,
+        convergence_table,
+        flows_table,
+        flows_view,
+        invalid_prefixes_set,
+        links_summary_table,
+        links_table,
+        nodes_summary_table,
+        prefixes_table,
+        private_prefixes_dictionary,
+        private_prefixes_table,
+        probes_table,
+        results_table,
+    )
 
 __all__ = (
     "Count",
     "CountLinksPerPrefix",
+    "CountNewLinksPerPrefix",
     "CountProbesPerPrefix",
+    "CountProbesPerTTL",
     "CountResultsPerPrefix",
+    "CreateConvergenceTable",
+    "CreateFlowsTable",
+    "CreateInvalidPrefixesSets",
+    "CreateLinksSummaryTable",
     "CreateLinksTable",
+    "CreateNodesSummaryTable",
     "CreatePrefixesTable",
+    "CreatePrivatePrefixesDictionary",
     "CreateProbesTable",
     "CreateResultsTable",
     "CreateTables",
     "DropTables",
+    "GetDiscoveryRates",
     "GetLinks",
     "GetLinksFromResults",
+    "GetMaxTTL",
     "GetMDAProbes",
     "GetNodes",
     "GetPrefixes",
+    "GetPrefixesFromResults",
     "GetProbes",
     "GetProbesDiff",
     "GetResults",
@@ -71,7 +124,11 @@ __all__ = (
     "GetPrefixesWithAmplification",
     "GetPrefixesWithLoops",
     "InsertMDAProbes",
+    "InsertConvergence",
+    "InsertInvalidPrefixesSets",
     "InsertLinks",
+    "InsertLinksSummary",
+    "InsertNodesSummary",
     "InsertPrefixes",
     "InsertResults",
     "Query",
@@ -80,8 +137,94 @@ __all__ = (
     "ProbesQuery",
     "ResultsQuery",
     "StoragePolicy",
+    "amplification_prefixes_set",
+    "converged_prefixes_set",
+    "convergence_table",
+    "flows_table",
+    "flows_view",
+    "invalid_prefixes_set",
+    "links_summary_table",
     "links_table",
+    "nodes_summary_table",
     "prefixes_table",
+    "private_prefixes_dictionary",
+    "private_prefixes_table",
     "probes_table",
     "results_table",
 )
+
+LAZY_ATTRIBUTES = {
+    "Count": "count",
+    "CountLinksPerPrefix": "count_rows",
+    "CountNewLinksPerPrefix": "count_rows",
+    "CountProbesPerPrefix": "count_rows",
+    "CountProbesPerTTL": "count_rows",
+    "CountResultsPerPrefix": "count_rows",
+    "CreateConvergenceTable": "create_convergence_table",
+    "CreateFlowsTable": "create_flows_table",
+    "CreateInvalidPrefixesSets": "create_invalid_prefixes_sets",
+    "CreateLinksSummaryTable": "create_links_summary_table",
+    "CreateLinksTable": "create_links_table",
+    "CreateNodesSummaryTable": "create_nodes_summary_table",
+    "CreatePrefixesTable": "create_prefixes_table",
+    "CreatePrivatePrefixesDictionary": "create_private_prefixes_dictionary",
+    "CreateProbesTable": "create_probes_table",
+    "CreateResultsTable": "create_results_table",
+    "CreateTables": "create_tables",
+    "DropTables": "drop_tables",
+    "GetDiscoveryRates": "get_discovery_rates",
+    "GetInvalidPrefixes": "get_invalid_prefixes",
+    "GetPrefixesWithAmplification": "get_invalid_prefixes",
+    "GetPrefixesWithLoops": "get_invalid_prefixes",
+    "GetLinks": "get_links",
+    "GetLinksFromResults": "get_links_from_results",
+    "GetMaxTTL": "get_max_ttl",
+    "GetMDAProbes": "get_mda_probes",
+    "GetNodes": "get_nodes",
+    "GetPrefixes": "get_prefixes",
+    "GetPrefixesFromResults": "get_prefixes_from_results",
+    "GetProbes": "get_probes",
+    "GetProbesDiff": "get_probes",
+    "GetResults": "get_results",
+    "GetSlidingPrefixes": "get_sliding_prefixes",
+    "InsertConvergence": "insert_convergence",
+    "InsertInvalidPrefixesSets": "insert_invalid_prefixes_sets",
+    "InsertLinks": "insert_links",
+    "InsertLinksSummary": "insert_links_summary",
+    "InsertMDAProbes": "insert_mda_probes",
+    "InsertNodesSummary": "insert_nodes_summary",
+    "InsertPrefixes": "insert_prefixes",
+    "InsertResults": "insert_results",
+    "LinksQuery": "query",
+    "PrefixesQuery": "query",
+    "ProbesQuery": "query",
+    "Query": "query",
+    "ResultsQuery": "query",
+    "StoragePolicy": "query",
+    "amplification_prefixes_set": "query",
+    "converged_prefixes_set": "query",
+    "convergence_table": "query",
+    "flows_table": "query",
+    "flows_view": "query",
+    "invalid_prefixes_set": "query",
+    "links_summary_table": "query",
+    "links_table": "query",
+    "nodes_summary_table": "query",
+    "prefixes_table": "query",
+    "private_prefixes_dictionary": "query",
+    "private_prefixes_table": "query",
+    "probes_table": "query",
+    "results_table": "query",
+}
+
+
+def __getattr__(name: str) -> Any:
+    if module := LAZY_ATTRIBUTES.get(name):
+        value = getattr(import_module(f"{__name__}.{module}"), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted({*globals(), *__all__})
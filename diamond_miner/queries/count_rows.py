@@ -1,7 +1,9 @@
 from dataclasses import dataclass
+from ipaddress import ip_network
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
-from diamond_miner.queries.fragments import cut_ipv6
+from diamond_miner.queries.fragments import cut_ipv6, ip_in
+from diamond_miner.queries.get_probes import GetProbesDiff
 from diamond_miner.queries.query import (
     LinksQuery,
     ProbesQuery,
@@ -11,6 +13,7 @@ from diamond_miner.queries.query import (
     results_table,
 )
 from diamond_miner.typing import IPNetwork
+from diamond_miner.utilities import common_parameters
 
 
 @dataclass(frozen=True)
@@ -44,6 +47,53 @@ class CountLinksPerPrefix(LinksQuery):
         """
 
 
+@dataclass(frozen=True)
+class CountNewLinksPerPrefix(LinksQuery):
+    """
+    Count the number of new links discovered in each prefix during `incremental_round`.
+    A link is new if it does not appear in the previous rounds,
+    and the prefixes with links in the previous rounds but none in `incremental_round`
+    are returned with 0 new links.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CountNewLinksPerPrefix
+        >>> for round_ in range(1, 4):
+        ...     rows = CountNewLinksPerPrefix(incremental_round=round_, filter_inter_round=True).execute(client, 'test_nsdi_example')
+        ...     print([(row["probe_dst_prefix"], row["new_links"]) for row in rows])
+        [('::ffff:200.0.0.0', 6)]
+        [('::ffff:200.0.0.0', 2)]
+        [('::ffff:200.0.0.0', 0)]
+    """
+
+    incremental_round: int = 1
+    "Round for which to count the new links."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        return f"""
+        SELECT
+            probe_protocol,
+            probe_src_addr,
+            probe_dst_prefix,
+            countIf(first_round = {self.incremental_round}) AS new_links
+        FROM (
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                min(greatest(near_round, far_round)) AS first_round
+            FROM {links_table(measurement_id)}
+            WHERE {self.filters(subset)}
+            AND near_round <= {self.incremental_round}
+            AND far_round <= {self.incremental_round}
+            GROUP BY (probe_protocol, probe_src_addr, probe_dst_prefix, near_ttl, near_addr, far_addr)
+        )
+        GROUP BY (probe_protocol, probe_src_addr, probe_dst_prefix)
+        """
+
+
 @dataclass(frozen=True)
 class CountProbesPerPrefix(ProbesQuery):
     """
@@ -76,6 +126,56 @@ class CountProbesPerPrefix(ProbesQuery):
         """
 
 
+@dataclass(frozen=True)
+class CountProbesPerTTL(ProbesQuery):
+    """
+    Count the number of probes to send at `round_eq` per protocol and TTL,
+    without the probes already sent at the previous round (see `GetProbesDiff`).
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CountProbesPerTTL
+        >>> rows = CountProbesPerTTL(round_eq=3).execute(client, 'test_nsdi_example')
+        >>> sorted((row["probe_protocol"], row["probe_ttl"], row["count"]) for row in rows)
+        [(1, 2, 2), (1, 3, 9), (1, 4, 9)]
+        >>> rows = CountProbesPerTTL(round_eq=3, max_flows_v4=20).execute(client, 'test_nsdi_example')
+        >>> sorted((row["probe_protocol"], row["probe_ttl"], row["count"]) for row in rows)
+        [(1, 2, 2), (1, 3, 2), (1, 4, 2)]
+    """
+
+    cap_max_ttl: bool = False
+    "See `GetProbesDiff.cap_max_ttl`."
+
+    max_flows_v4: int | None = None
+    "If specified, count only the first `max_flows_v4` flows of each IPv4 prefix at each TTL."
+
+    max_flows_v6: int | None = None
+    "If specified, count only the first `max_flows_v6` flows of each IPv6 prefix at each TTL."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        assert self.round_eq
+        query = GetProbesDiff(**common_parameters(self, GetProbesDiff))
+        max_flows_v4 = (
+            self.max_flows_v4 if self.max_flows_v4 is not None else 2**32 - 1
+        )
+        max_flows_v6 = (
+            self.max_flows_v6 if self.max_flows_v6 is not None else 2**32 - 1
+        )
+        is_ipv4 = ip_in("probe_dst_prefix", ip_network("::ffff:0.0.0.0/96"))
+        return f"""
+        SELECT
+            probe_protocol,
+            ttl_probes.1 AS probe_ttl,
+            sum(total_probes - ttl_probes.3) AS count
+        FROM ({query.statement(measurement_id, subset)})
+        ARRAY JOIN probes_per_ttl AS ttl_probes
+        WHERE (least(ttl_probes.2, if({is_ipv4}, {max_flows_v4}, {max_flows_v6})) AS total_probes) > ttl_probes.3
+        GROUP BY (probe_protocol, probe_ttl)
+        """
+
+
 @dataclass(frozen=True)
 class CountResultsPerPrefix(ResultsQuery):
     """
@@ -0,0 +1,62 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.fragments import date_time
+from diamond_miner.queries.query import (
+    Query,
+    StoragePolicy,
+    converged_prefixes_set,
+    convergence_table,
+)
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class CreateConvergenceTable(Query):
+    """
+    Create the convergence table, containing the number of new links discovered
+    in each prefix at each round.
+    This table is filled with `InsertConvergence`, and a prefix that did not discover
+    new links during a round is skipped by `GetMDAProbes(skip_converged=True)` in the next rounds.
+    Such prefixes are also inserted in an in-memory set (ClickHouse `Set` engine),
+    so that they are not looked up in this table by each statement.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateConvergenceTable
+        >>> CreateConvergenceTable().execute(client, "test")
+        []
+    """
+
+    SORTING_KEY = "probe_protocol, probe_src_addr, probe_dst_prefix, round"
+    "Columns by which the data is ordered."
+
+    storage_policy: StoragePolicy = StoragePolicy()
+    "ClickHouse storage policy to use."
+
+    def statements(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> Sequence[str]:
+        assert subset == UNIVERSE_SUBSET, "subset not allowed for this query"
+        return (
+            f"""
+            CREATE TABLE IF NOT EXISTS {convergence_table(measurement_id)}
+            (
+                probe_protocol   UInt8,
+                probe_src_addr   IPv6,
+                probe_dst_prefix IPv6,
+                round            UInt8,
+                new_links        UInt64
+            )
+            ENGINE ReplacingMergeTree
+            ORDER BY ({self.SORTING_KEY})
+            TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
+            SETTINGS storage_policy = '{self.storage_policy.name}'
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {converged_prefixes_set(measurement_id)}
+            (probe_protocol UInt8, probe_src_addr IPv6, probe_dst_prefix IPv6)
+            ENGINE Set
+            """,
+        )
@@ -0,0 +1,85 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.fragments import date_time
+from diamond_miner.queries.query import (
+    Query,
+    ResultsQuery,
+    StoragePolicy,
+    flows_table,
+    flows_view,
+    results_table,
+)
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class CreateFlowsTable(Query):
+    """
+    Create the flows table, containing the pre-aggregated traceroute of each flow,
+    and the materialized view that fills it when results are inserted.
+
+    The materialized view keeps the replies matching the default `ResultsQuery` filters,
+    and aggregates them per flow into the set of `(round, probe_ttl, reply_src_addr)`
+    and the number of replies. The links and the invalid prefixes can then be computed
+    from this table, instead of the results table, by setting `from_flows=True` on
+    `GetLinksFromResults` and `GetPrefixesFromResults` (and `InsertLinks` and `InsertPrefixes`).
+
+    This table must be created before the results are inserted,
+    for example with `CreateTables(materialized_views=True)`.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateFlowsTable, CreateResultsTable
+        >>> CreateResultsTable().execute(client, "test")
+        []
+        >>> CreateFlowsTable().execute(client, "test")
+        []
+    """
+
+    SORTING_KEY = "probe_protocol, probe_src_addr, probe_dst_prefix, probe_dst_addr, probe_src_port, probe_dst_port"
+    "Columns by which the data is ordered."
+
+    storage_policy: StoragePolicy = StoragePolicy()
+    "ClickHouse storage policy to use."
+
+    def statements(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> Sequence[str]:
+        assert subset == UNIVERSE_SUBSET, "subset not allowed for this query"
+        return (
+            f"""
+            CREATE TABLE IF NOT EXISTS {flows_table(measurement_id)}
+            (
+                probe_protocol    UInt8,
+                probe_src_addr    IPv6,
+                probe_dst_prefix  IPv6,
+                probe_dst_addr    IPv6,
+                probe_src_port    UInt16,
+                probe_dst_port    UInt16,
+                traceroute        AggregateFunction(groupUniqArray, Tuple(UInt8, UInt8, IPv6)),
+                replies           SimpleAggregateFunction(sum, UInt64)
+            )
+            ENGINE AggregatingMergeTree
+            ORDER BY ({self.SORTING_KEY})
+            TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
+            SETTINGS storage_policy = '{self.storage_policy.name}'
+            """,
+            f"""
+            CREATE MATERIALIZED VIEW IF NOT EXISTS {flows_view(measurement_id)}
+            TO {flows_table(measurement_id)}
+            AS SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                probe_dst_addr,
+                probe_src_port,
+                probe_dst_port,
+                groupUniqArrayState((round, probe_ttl, reply_src_addr)) AS traceroute,
+                count() AS replies
+            FROM {results_table(measurement_id)}
+            WHERE {ResultsQuery().filters(UNIVERSE_SUBSET)}
+            GROUP BY ({self.SORTING_KEY})
+            """,
+        )
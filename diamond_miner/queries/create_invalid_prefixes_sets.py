@@ -0,0 +1,44 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.query import (
+    Query,
+    amplification_prefixes_set,
+    invalid_prefixes_set,
+)
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class CreateInvalidPrefixesSets(Query):
+    """
+    Create the in-memory sets (ClickHouse `Set` engine) of invalid prefixes:
+    the prefixes with amplification or loops, and the `(probe_protocol, probe_src_addr, probe_dst_prefix)`
+    tuples with amplification. They are filled after each round with `InsertInvalidPrefixesSets`,
+    and used by the queries with `invalid_prefixes_from_sets=True`, instead of evaluating
+    a subquery on the prefixes table in each statement.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateInvalidPrefixesSets
+        >>> CreateInvalidPrefixesSets().execute(client, "test")
+        []
+    """
+
+    def statements(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> Sequence[str]:
+        assert subset == UNIVERSE_SUBSET, "subset not allowed for this query"
+        return (
+            f"""
+            CREATE TABLE IF NOT EXISTS {invalid_prefixes_set(measurement_id)}
+            (probe_dst_prefix IPv6)
+            ENGINE Set
+            """,
+            f"""
+            CREATE TABLE IF NOT EXISTS {amplification_prefixes_set(measurement_id)}
+            (probe_protocol UInt8, probe_src_addr IPv6, probe_dst_prefix IPv6)
+            ENGINE Set
+            """,
+        )
@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.fragments import date_time
+from diamond_miner.queries.query import Query, StoragePolicy, links_summary_table
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class CreateLinksSummaryTable(Query):
+    """
+    Create the links summary table, containing one line per distinct link,
+    with the minimum TTLs at which it was seen and the round at which it was first seen.
+    This table is filled with `InsertLinksSummary` and read by `GetLinks(summary=True)`.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateLinksSummaryTable
+        >>> CreateLinksSummaryTable().execute(client, "test")
+        []
+    """
+
+    SORTING_KEY = "near_addr, far_addr"
+    "Columns by which the data is ordered."
+
+    storage_policy: StoragePolicy = StoragePolicy()
+    "ClickHouse storage policy to use."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        assert subset == UNIVERSE_SUBSET, "subset not allowed for this query"
+        return f"""
+        CREATE TABLE IF NOT EXISTS {links_summary_table(measurement_id)}
+        (
+            near_addr      IPv6,
+            far_addr       IPv6,
+            min_near_ttl   SimpleAggregateFunction(min, UInt8),
+            min_far_ttl    SimpleAggregateFunction(min, UInt8),
+            first_round    SimpleAggregateFunction(min, UInt8)
+        )
+        ENGINE AggregatingMergeTree
+        ORDER BY ({self.SORTING_KEY})
+        TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
+        SETTINGS storage_policy = '{self.storage_policy.name}'
+        """
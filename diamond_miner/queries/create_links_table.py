@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
-from diamond_miner.queries.fragments import date_time
+from diamond_miner.queries.fragments import bloom_filter_indexes, date_time
 from diamond_miner.queries.query import Query, StoragePolicy, links_table
 from diamond_miner.typing import IPNetwork
 
@@ -18,9 +18,31 @@ class CreateLinksTable(Query):
         []
     """
 
+    SORTING_KEY = "probe_protocol, probe_src_addr, probe_dst_prefix, probe_dst_addr, probe_src_port, probe_dst_port"
+    "Columns by which the data is ordered."
+
+    PARTITION_KEY = "greatest(near_round, far_round)"
+    "Expression by which the data is partitioned, if `partition_by_round` is true."
+
+    SKIP_INDEXES = ("near_addr", "far_addr")
+    "Columns indexed with a bloom filter, if `skip_indexes` is true."
+
     storage_policy: StoragePolicy = StoragePolicy()
     "ClickHouse storage policy to use."
 
+    partition_by_round: bool = False
+    "If true, partition the table by round, see `PARTITION_KEY`."
+
+    skip_indexes: bool = False
+    """
+    If true, add data-skipping indexes on the columns in `SKIP_INDEXES`.
+    They speed up the point lookups on these columns (which are not in the primary key),
+    at the expense of a slower insertion.
+    """
+
+    def partition_by(self) -> str:
+        return f"PARTITION BY {self.PARTITION_KEY}" if self.partition_by_round else ""
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
@@ -45,16 +67,11 @@ class CreateLinksTable(Query):
             is_inter_round    UInt8 MATERIALIZED near_round != far_round,
             is_partial        UInt8 MATERIALIZED near_addr = toIPv6('::') OR far_addr = toIPv6('::'),
             is_virtual        UInt8 MATERIALIZED near_addr = toIPv6('::') AND far_addr = toIPv6('::')
+            {bloom_filter_indexes(self.SKIP_INDEXES if self.skip_indexes else [])}
         )
         ENGINE MergeTree
-        ORDER BY (
-            probe_protocol,
-            probe_src_addr,
-            probe_dst_prefix,
-            probe_dst_addr,
-            probe_src_port,
-            probe_dst_port
-        )
+        ORDER BY ({self.SORTING_KEY})
+        {self.partition_by()}
         TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
         SETTINGS storage_policy = '{self.storage_policy.name}'
         """
@@ -0,0 +1,44 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.fragments import date_time
+from diamond_miner.queries.query import Query, StoragePolicy, nodes_summary_table
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class CreateNodesSummaryTable(Query):
+    """
+    Create the nodes summary table, containing one line per discovered node,
+    with the minimum TTL at which it was seen and the round at which it was first seen.
+    This table is filled with `InsertNodesSummary` and read by `GetNodes(summary=True)`.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateNodesSummaryTable
+        >>> CreateNodesSummaryTable().execute(client, "test")
+        []
+    """
+
+    SORTING_KEY = "reply_src_addr"
+    "Columns by which the data is ordered."
+
+    storage_policy: StoragePolicy = StoragePolicy()
+    "ClickHouse storage policy to use."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        assert subset == UNIVERSE_SUBSET, "subset not allowed for this query"
+        return f"""
+        CREATE TABLE IF NOT EXISTS {nodes_summary_table(measurement_id)}
+        (
+            reply_src_addr IPv6,
+            min_probe_ttl  SimpleAggregateFunction(min, UInt8),
+            first_round    SimpleAggregateFunction(min, UInt8)
+        )
+        ENGINE AggregatingMergeTree
+        ORDER BY ({self.SORTING_KEY})
+        TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
+        SETTINGS storage_policy = '{self.storage_policy.name}'
+        """
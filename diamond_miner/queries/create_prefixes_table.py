@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from dataclasses import dataclass
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
@@ -10,6 +11,7 @@ from diamond_miner.typing import IPNetwork
 class CreatePrefixesTable(Query):
     """
     Create the table containing (invalid) prefixes.
+    The loop columns are added to the tables created before they were introduced.
 
     Examples:
         >>> from diamond_miner.test import client
@@ -24,20 +26,30 @@ class CreatePrefixesTable(Query):
     storage_policy: StoragePolicy = StoragePolicy()
     "ClickHouse storage policy to use."
 
-    def statement(
+    def statements(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
-    ) -> str:
-        return f"""
-        CREATE TABLE IF NOT EXISTS {prefixes_table(measurement_id)}
-        (
-            probe_protocol         UInt8,
-            probe_src_addr         IPv6,
-            probe_dst_prefix       IPv6,
-            has_amplification      UInt8,
-            has_loops              UInt8
+    ) -> Sequence[str]:
+        return (
+            f"""
+            CREATE TABLE IF NOT EXISTS {prefixes_table(measurement_id)}
+            (
+                probe_protocol         UInt8,
+                probe_src_addr         IPv6,
+                probe_dst_prefix       IPv6,
+                has_amplification      UInt8,
+                has_loops              UInt8,
+                -- TTL range where addresses are seen again, 0 if there are no loops.
+                loop_min_ttl           UInt8,
+                loop_max_ttl           UInt8
+            )
+            ENGINE MergeTree
+            ORDER BY ({self.SORTING_KEY})
+            TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
+            SETTINGS storage_policy = '{self.storage_policy.name}'
+            """,
+            f"""
+            ALTER TABLE {prefixes_table(measurement_id)}
+            ADD COLUMN IF NOT EXISTS loop_min_ttl UInt8,
+            ADD COLUMN IF NOT EXISTS loop_max_ttl UInt8
+            """,
         )
-        ENGINE MergeTree
-        ORDER BY ({self.SORTING_KEY})
-        TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
-        SETTINGS storage_policy = '{self.storage_policy.name}'
-        """
@@ -0,0 +1,63 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from diamond_miner.defaults import PRIVATE_PREFIXES, UNIVERSE_SUBSET
+from diamond_miner.queries.query import (
+    Query,
+    private_prefixes_dictionary,
+    private_prefixes_table,
+)
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class CreatePrivatePrefixesDictionary(Query):
+    """
+    Create an `ip_trie` dictionary containing the private prefixes,
+    used by `CreateResultsTable(private_prefixes_from_dictionary=True)`
+    to classify the private addresses with a single lookup.
+
+    The prefixes are stored in a table, and the dictionary is reloaded after each insertion.
+    To exclude more prefixes, execute this query again with `extra_prefixes`:
+    the results inserted afterwards will be classified with the new prefixes.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreatePrivatePrefixesDictionary, private_prefixes_dictionary
+        >>> CreatePrivatePrefixesDictionary(extra_prefixes=("1.1.1.0/24",)).execute(client, "test")
+        []
+        >>> dictionary = private_prefixes_dictionary("test")
+        >>> client.json(f"SELECT dictHas('{dictionary}', tuple(toIPv6('::ffff:1.1.1.1'))) AS private")
+        [{'private': 1}]
+        >>> client.json(f"SELECT dictHas('{dictionary}', tuple(toIPv6('::ffff:8.8.8.8'))) AS private")
+        [{'private': 0}]
+    """
+
+    extra_prefixes: tuple[str, ...] = ()
+    "Prefixes to exclude in addition to `diamond_miner.defaults.PRIVATE_PREFIXES`."
+
+    def statements(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> Sequence[str]:
+        assert subset == UNIVERSE_SUBSET, "subset not allowed for this query"
+        prefixes = ", ".join(
+            f"('{prefix}')" for prefix in (*PRIVATE_PREFIXES, *self.extra_prefixes)
+        )
+        return (
+            f"""
+            CREATE TABLE IF NOT EXISTS {private_prefixes_table(measurement_id)}
+            (prefix String)
+            ENGINE ReplacingMergeTree
+            ORDER BY prefix
+            """,
+            f"INSERT INTO {private_prefixes_table(measurement_id)} VALUES {prefixes}",
+            f"""
+            CREATE DICTIONARY IF NOT EXISTS {private_prefixes_dictionary(measurement_id)}
+            (prefix String)
+            PRIMARY KEY prefix
+            SOURCE(CLICKHOUSE(TABLE '{private_prefixes_table(measurement_id)}'))
+            LAYOUT(IP_TRIE)
+            LIFETIME(0)
+            """,
+            f"SYSTEM RELOAD DICTIONARY {private_prefixes_dictionary(measurement_id)}",
+        )
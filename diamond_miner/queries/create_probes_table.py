@@ -21,9 +21,18 @@ class CreateProbesTable(Query):
     SORTING_KEY = "probe_protocol, probe_dst_prefix, probe_ttl"
     "Columns by which the data is ordered."
 
+    PARTITION_KEY = "round"
+    "Expression by which the data is partitioned, if `partition_by_round` is true."
+
     storage_policy: StoragePolicy = StoragePolicy()
     "ClickHouse storage policy to use."
 
+    partition_by_round: bool = False
+    "If true, partition the table by round, see `PARTITION_KEY`."
+
+    def partition_by(self) -> str:
+        return f"PARTITION BY {self.PARTITION_KEY}" if self.partition_by_round else ""
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
@@ -38,6 +47,7 @@ class CreateProbesTable(Query):
         )
         ENGINE MergeTree
         ORDER BY ({self.SORTING_KEY})
+        {self.partition_by()}
         TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
         SETTINGS storage_policy = '{self.storage_policy.name}'
         """
@@ -1,12 +1,24 @@
 from dataclasses import dataclass
+from ipaddress import ip_network
 
 from diamond_miner.defaults import (
     DEFAULT_PREFIX_LEN_V4,
     DEFAULT_PREFIX_LEN_V6,
+    PRIVATE_PREFIXES,
     UNIVERSE_SUBSET,
 )
-from diamond_miner.queries.fragments import cut_ipv6, date_time
-from diamond_miner.queries.query import Query, StoragePolicy, results_table
+from diamond_miner.queries.fragments import (
+    bloom_filter_indexes,
+    cut_ipv6,
+    date_time,
+    ip_in_any,
+)
+from diamond_miner.queries.query import (
+    Query,
+    StoragePolicy,
+    private_prefixes_dictionary,
+    results_table,
+)
 from diamond_miner.typing import IPNetwork
 
 
@@ -25,6 +37,12 @@ class CreateResultsTable(Query):
     SORTING_KEY = "probe_protocol, probe_src_addr, probe_dst_prefix, probe_dst_addr, probe_src_port, probe_dst_port, probe_ttl"
     "Columns by which the data is ordered."
 
+    PARTITION_KEY = "round"
+    "Expression by which the data is partitioned, if `partition_by_round` is true."
+
+    SKIP_INDEXES = ("reply_src_addr",)
+    "Columns indexed with a bloom filter, if `skip_indexes` is true."
+
     prefix_len_v4: int = DEFAULT_PREFIX_LEN_V4
     "The prefix length used to compute the IPv4 prefix of an IP address."
 
@@ -34,6 +52,33 @@ class CreateResultsTable(Query):
     storage_policy: StoragePolicy = StoragePolicy()
     "ClickHouse storage policy to use."
 
+    partition_by_round: bool = False
+    "If true, partition the table by round, see `PARTITION_KEY`."
+
+    skip_indexes: bool = False
+    """
+    If true, add data-skipping indexes on the columns in `SKIP_INDEXES`.
+    They speed up the point lookups on these columns (which are not in the primary key),
+    at the expense of a slower insertion.
+    """
+
+    private_prefixes_from_dictionary: bool = False
+    """
+    If true, classify the private addresses with a lookup in the dictionary created by
+    `CreatePrivatePrefixesDictionary`, instead of comparing them with each prefix of
+    `diamond_miner.defaults.PRIVATE_PREFIXES`. This allows to exclude more prefixes
+    without changing the schema of the table.
+    """
+
+    def is_private(self, column: str, measurement_id: str) -> str:
+        if self.private_prefixes_from_dictionary:
+            dictionary = private_prefixes_dictionary(measurement_id)
+            return f"dictHas('{dictionary}', tuple({column}))"
+        return ip_in_any(column, map(ip_network, PRIVATE_PREFIXES))
+
+    def partition_by(self) -> str:
+        return f"PARTITION BY {self.PARTITION_KEY}" if self.partition_by_round else ""
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
@@ -67,49 +112,18 @@ class CreateResultsTable(Query):
             -- Materialized columns
             probe_dst_prefix       IPv6 MATERIALIZED {cut_ipv6('probe_dst_addr', self.prefix_len_v4, self.prefix_len_v6)},
             reply_src_prefix       IPv6 MATERIALIZED {cut_ipv6('reply_src_addr', self.prefix_len_v4, self.prefix_len_v6)},
-            -- https://en.wikipedia.org/wiki/Reserved_IP_addresses
-            private_probe_dst_prefix UInt8 MATERIALIZED
-                (probe_dst_prefix >= toIPv6('0.0.0.0')      AND probe_dst_prefix <= toIPv6('0.255.255.255'))   OR
-                (probe_dst_prefix >= toIPv6('10.0.0.0')     AND probe_dst_prefix <= toIPv6('10.255.255.255'))  OR
-                (probe_dst_prefix >= toIPv6('100.64.0.0')   AND probe_dst_prefix <= toIPv6('100.127.255.255')) OR
-                (probe_dst_prefix >= toIPv6('127.0.0.0')    AND probe_dst_prefix <= toIPv6('127.255.255.255')) OR
-                (probe_dst_prefix >= toIPv6('172.16.0.0')   AND probe_dst_prefix <= toIPv6('172.31.255.255'))  OR
-                (probe_dst_prefix >= toIPv6('192.0.0.0')    AND probe_dst_prefix <= toIPv6('192.0.0.255'))     OR
-                (probe_dst_prefix >= toIPv6('192.0.2.0')    AND probe_dst_prefix <= toIPv6('192.0.2.255'))     OR
-                (probe_dst_prefix >= toIPv6('192.88.99.0')  AND probe_dst_prefix <= toIPv6('192.88.99.255'))   OR
-                (probe_dst_prefix >= toIPv6('192.168.0.0')  AND probe_dst_prefix <= toIPv6('192.168.255.255')) OR
-                (probe_dst_prefix >= toIPv6('198.18.0.0')   AND probe_dst_prefix <= toIPv6('198.19.255.255'))  OR
-                (probe_dst_prefix >= toIPv6('198.51.100.0') AND probe_dst_prefix <= toIPv6('198.51.100.255'))  OR
-                (probe_dst_prefix >= toIPv6('203.0.113.0')  AND probe_dst_prefix <= toIPv6('203.0.113.255'))   OR
-                (probe_dst_prefix >= toIPv6('224.0.0.0')    AND probe_dst_prefix <= toIPv6('239.255.255.255')) OR
-                (probe_dst_prefix >= toIPv6('233.252.0.0')  AND probe_dst_prefix <= toIPv6('233.252.0.255'))   OR
-                (probe_dst_prefix >= toIPv6('240.0.0.0')    AND probe_dst_prefix <= toIPv6('255.255.255.255')) OR
-                (probe_dst_prefix >= toIPv6('fd00::')       AND probe_dst_prefix <= toIPv6('fdff:ffff:ffff:ffff:ffff:ffff:ffff:ffff')),
-            private_reply_src_addr UInt8 MATERIALIZED
-                (reply_src_addr >= toIPv6('0.0.0.0')        AND reply_src_addr <= toIPv6('0.255.255.255'))     OR
-                (reply_src_addr >= toIPv6('10.0.0.0')       AND reply_src_addr <= toIPv6('10.255.255.255'))    OR
-                (reply_src_addr >= toIPv6('100.64.0.0')     AND reply_src_addr <= toIPv6('100.127.255.255'))   OR
-                (reply_src_addr >= toIPv6('127.0.0.0')      AND reply_src_addr <= toIPv6('127.255.255.255'))   OR
-                (reply_src_addr >= toIPv6('172.16.0.0')     AND reply_src_addr <= toIPv6('172.31.255.255'))    OR
-                (reply_src_addr >= toIPv6('192.0.0.0')      AND reply_src_addr <= toIPv6('192.0.0.255'))       OR
-                (reply_src_addr >= toIPv6('192.0.2.0')      AND reply_src_addr <= toIPv6('192.0.2.255'))       OR
-                (reply_src_addr >= toIPv6('192.88.99.0')    AND reply_src_addr <= toIPv6('192.88.99.255'))     OR
-                (reply_src_addr >= toIPv6('192.168.0.0')    AND reply_src_addr <= toIPv6('192.168.255.255'))   OR
-                (reply_src_addr >= toIPv6('198.18.0.0')     AND reply_src_addr <= toIPv6('198.19.255.255'))    OR
-                (reply_src_addr >= toIPv6('198.51.100.0')   AND reply_src_addr <= toIPv6('198.51.100.255'))    OR
-                (reply_src_addr >= toIPv6('203.0.113.0')    AND reply_src_addr <= toIPv6('203.0.113.255'))     OR
-                (reply_src_addr >= toIPv6('224.0.0.0')      AND reply_src_addr <= toIPv6('239.255.255.255'))   OR
-                (reply_src_addr >= toIPv6('233.252.0.0')    AND reply_src_addr <= toIPv6('233.252.0.255'))     OR
-                (reply_src_addr >= toIPv6('240.0.0.0')      AND reply_src_addr <= toIPv6('255.255.255.255'))   OR
-                (reply_src_addr >= toIPv6('fd00::')         AND reply_src_addr <= toIPv6('fdff:ffff:ffff:ffff:ffff:ffff:ffff:ffff')),
+            private_probe_dst_prefix UInt8 MATERIALIZED {self.is_private('probe_dst_prefix', measurement_id)},
+            private_reply_src_addr   UInt8 MATERIALIZED {self.is_private('reply_src_addr', measurement_id)},
             destination_host_reply   UInt8 MATERIALIZED probe_dst_addr = reply_src_addr,
             destination_prefix_reply UInt8 MATERIALIZED probe_dst_prefix = reply_src_prefix,
             -- ICMP: protocol 1, UDP: protocol 17, ICMPv6: protocol 58
             valid_probe_protocol   UInt8 MATERIALIZED probe_protocol IN [1, 17, 58],
             time_exceeded_reply    UInt8 MATERIALIZED (reply_protocol = 1 AND reply_icmp_type = 11) OR (reply_protocol = 58 AND reply_icmp_type = 3)
+            {bloom_filter_indexes(self.SKIP_INDEXES if self.skip_indexes else [])}
         )
         ENGINE MergeTree
         ORDER BY ({self.SORTING_KEY})
+        {self.partition_by()}
         TTL {date_time(self.storage_policy.archive_on)} TO VOLUME '{self.storage_policy.archive_to}'
         SETTINGS storage_policy = '{self.storage_policy.name}'
         """
@@ -1,5 +1,5 @@
 from collections.abc import Sequence
-from dataclasses import dataclass, fields
+from dataclasses import dataclass
 
 from diamond_miner.defaults import (
     DEFAULT_PREFIX_LEN_V4,
@@ -7,13 +7,20 @@ from diamond_miner.defaults import (
     UNIVERSE_SUBSET,
 )
 from diamond_miner.queries import (
+    CreateConvergenceTable,
+    CreateFlowsTable,
+    CreateInvalidPrefixesSets,
+    CreateLinksSummaryTable,
     CreateLinksTable,
+    CreateNodesSummaryTable,
     CreatePrefixesTable,
+    CreatePrivatePrefixesDictionary,
     CreateProbesTable,
     CreateResultsTable,
 )
 from diamond_miner.queries.query import Query, StoragePolicy
 from diamond_miner.typing import IPNetwork
+from diamond_miner.utilities import common_parameters
 
 
 @dataclass(frozen=True)
@@ -26,6 +33,8 @@ class CreateTables(Query):
         >>> from diamond_miner.queries import CreateTables
         >>> CreateTables().execute(client, "test")
         []
+        >>> CreateTables(partition_by_round=True, skip_indexes=True, summary_tables=True, invalid_prefixes_sets=True, private_prefixes_from_dictionary=True, convergence_table=True).execute(client, "test_partitioned")
+        []
     """
 
     prefix_len_v4: int = DEFAULT_PREFIX_LEN_V4
@@ -37,19 +46,60 @@ class CreateTables(Query):
     storage_policy: StoragePolicy = StoragePolicy()
     "ClickHouse storage policy to use."
 
+    partition_by_round: bool = False
+    "If true, partition the results, links and probes tables by round."
+
+    skip_indexes: bool = False
+    "If true, add data-skipping indexes on the address columns of the results and links tables."
+
+    materialized_views: bool = False
+    """
+    If true, create the flows table and the materialized view that fills it
+    when results are inserted, see `CreateFlowsTable`.
+    """
+
+    summary_tables: bool = False
+    "If true, create the nodes and links summary tables, see `CreateNodesSummaryTable`."
+
+    invalid_prefixes_sets: bool = False
+    "If true, create the sets of invalid prefixes, see `CreateInvalidPrefixesSets`."
+
+    convergence_table: bool = False
+    "If true, create the convergence table, see `CreateConvergenceTable`."
+
+    private_prefixes_from_dictionary: bool = False
+    """
+    If true, create the private prefixes dictionary and use it to classify
+    the private addresses in the results table, see `CreatePrivatePrefixesDictionary`.
+    """
+
     def statements(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> Sequence[str]:
-        all_params = {field.name: getattr(self, field.name) for field in fields(self)}
-        # Only CreateResultsTable accepts these parameters.
-        params = {
-            x: y
-            for x, y in all_params.items()
-            if x not in ["prefix_len_v4", "prefix_len_v6"]
-        }
-        return (
-            *CreateResultsTable(**all_params).statements(measurement_id, subset),
-            *CreateLinksTable(**params).statements(measurement_id, subset),
-            *CreatePrefixesTable(**params).statements(measurement_id, subset),
-            *CreateProbesTable(**params).statements(measurement_id, subset),
+        queries = [
+            query(**common_parameters(self, query))
+            for query in (
+                *(
+                    [CreatePrivatePrefixesDictionary]
+                    if self.private_prefixes_from_dictionary
+                    else []
+                ),
+                CreateResultsTable,
+                *([CreateFlowsTable] if self.materialized_views else []),
+                CreateLinksTable,
+                CreatePrefixesTable,
+                CreateProbesTable,
+                *(
+                    [CreateNodesSummaryTable, CreateLinksSummaryTable]
+                    if self.summary_tables
+                    else []
+                ),
+                *([CreateInvalidPrefixesSets] if self.invalid_prefixes_sets else []),
+                *([CreateConvergenceTable] if self.convergence_table else []),
+            )
+        ]
+        return tuple(
+            statement
+            for query in queries
+            for statement in query.statements(measurement_id, subset)
         )
@@ -1,14 +1,64 @@
+from dataclasses import dataclass
+
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries import ProbesQuery, probes_table
 from diamond_miner.typing import IPNetwork
 
 
+@dataclass(frozen=True)
 class DeleteProbes(ProbesQuery):
-    """Delete the probes matching the filter."""
+    """
+    Delete the probes matching the filter.
+
+    Examples:
+        >>> from diamond_miner.insert import insert_probe_counts
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CountProbesPerPrefix, CreateProbesTable, DropTables
+        >>> DropTables().execute(client, "test_delete_probes")
+        []
+        >>> CreateProbesTable(partition_by_round=True).execute(client, "test_delete_probes")
+        []
+        >>> for round_ in (1, 2):
+        ...     insert_probe_counts(client, "test_delete_probes", round_, [("8.8.8.0/24", "icmp", [1, 2], 6)])
+        >>> DeleteProbes(round_eq=2, partitioned=True).execute(client, "test_delete_probes")
+        []
+        >>> CountProbesPerPrefix(round_eq=1).execute(client, "test_delete_probes")
+        [{'prefix': '::ffff:8.8.0.0', 'count': 12}]
+        >>> CountProbesPerPrefix(round_eq=2).execute(client, "test_delete_probes")
+        []
+    """
+
+    partitioned: bool = False
+    """
+    If true, delete the probes of `round_eq` by dropping its partition,
+    instead of rewriting the table parts with a mutation.
+    The probes table must have been created with `partition_by_round=True`,
+    and no other filter is allowed.
+    """
 
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
+        if self.partitioned:
+            assert self.round_eq, "round_eq is required to drop a partition"
+            assert (
+                subset == UNIVERSE_SUBSET
+            ), "subset not allowed when dropping a partition"
+            others = (
+                self.probe_protocol,
+                self.probe_ttl_geq,
+                self.probe_ttl_leq,
+                self.round_geq,
+                self.round_leq,
+                self.round_lt,
+            )
+            assert all(
+                x is None for x in others
+            ), "only round_eq is allowed when dropping a partition"
+            return f"""
+            ALTER TABLE {probes_table(measurement_id)}
+            DROP PARTITION {self.round_eq}
+            """
         return f"""
         ALTER TABLE {probes_table(measurement_id)}
         DELETE WHERE {self.filters(subset)}
@@ -4,8 +4,18 @@ from dataclasses import dataclass
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries.query import (
     Query,
+    amplification_prefixes_set,
+    converged_prefixes_set,
+    convergence_table,
+    flows_table,
+    flows_view,
+    invalid_prefixes_set,
+    links_summary_table,
     links_table,
+    nodes_summary_table,
     prefixes_table,
+    private_prefixes_dictionary,
+    private_prefixes_table,
     probes_table,
     results_table,
 )
@@ -28,8 +38,18 @@ class DropTables(Query):
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> Sequence[str]:
         return (
+            f"DROP TABLE IF EXISTS {flows_view(measurement_id)}",
+            f"DROP TABLE IF EXISTS {flows_table(measurement_id)}",
             f"DROP TABLE IF EXISTS {results_table(measurement_id)}",
             f"DROP TABLE IF EXISTS {links_table(measurement_id)}",
             f"DROP TABLE IF EXISTS {prefixes_table(measurement_id)}",
             f"DROP TABLE IF EXISTS {probes_table(measurement_id)}",
+            f"DROP TABLE IF EXISTS {nodes_summary_table(measurement_id)}",
+            f"DROP TABLE IF EXISTS {links_summary_table(measurement_id)}",
+            f"DROP TABLE IF EXISTS {invalid_prefixes_set(measurement_id)}",
+            f"DROP TABLE IF EXISTS {amplification_prefixes_set(measurement_id)}",
+            f"DROP TABLE IF EXISTS {convergence_table(measurement_id)}",
+            f"DROP TABLE IF EXISTS {converged_prefixes_set(measurement_id)}",
+            f"DROP DICTIONARY IF EXISTS {private_prefixes_dictionary(measurement_id)}",
+            f"DROP TABLE IF EXISTS {private_prefixes_table(measurement_id)}",
         )
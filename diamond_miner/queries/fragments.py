@@ -1,10 +1,36 @@
-from collections.abc import Iterable
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
 from datetime import datetime
+from ipaddress import IPv6Network, ip_address
 from typing import Any
 
 from diamond_miner.typing import IPNetwork
 
 
+@dataclass(frozen=True)
+class Parameter:
+    """
+    A ClickHouse query parameter, bound at execution time.
+
+    >>> str(Parameter("subset_min", "IPv6"))
+    '{subset_min:IPv6}'
+    """
+
+    name: str
+    type: str
+
+    def __str__(self) -> str:
+        return f"{{{self.name}:{self.type}}}"
+
+
+SUBSET_PARAMETER = IPv6Network("100::/64")
+"""
+Subset used to render the statements once for all the subsets (see `CompiledQuery`).
+Its bounds are rendered as the `{subset_min:IPv6}` and `{subset_max:IPv6}` query parameters
+by `subset_bounds`. It is a regular network (the discard-only prefix), recognized by identity.
+"""
+
+
 def cut_ipv6(column: str, prefix_len_v4: int, prefix_len_v6: int) -> str:
     """
     >>> cut_ipv6("col", 24, 64)
@@ -99,6 +125,21 @@ def in_(column: str, values: Iterable[Any]) -> str:
     return f"{column} in [{','.join(map(str, values))}]"
 
 
+def bloom_filter_indexes(columns: Iterable[str], granularity: int = 1) -> str:
+    """
+    Data-skipping index declarations, to be appended to the columns of a `CREATE TABLE` query.
+
+    >>> bloom_filter_indexes([])
+    ''
+    >>> bloom_filter_indexes(["near_addr"])
+    ', INDEX near_addr_bloom_filter near_addr TYPE bloom_filter GRANULARITY 1'
+    """
+    return "".join(
+        f", INDEX {column}_bloom_filter {column} TYPE bloom_filter GRANULARITY {granularity}"
+        for column in columns
+    )
+
+
 def date_time(d: datetime) -> str:
     """
     >>> from datetime import timezone
@@ -112,7 +153,11 @@ def ipv6(x: Any) -> str:
     """
     >>> ipv6("8.8.8.8")
     "toIPv6('8.8.8.8')"
+    >>> ipv6(Parameter("addr", "IPv6"))
+    '{addr:IPv6}'
     """
+    if isinstance(x, Parameter):
+        return str(x)
     return f"toIPv6('{x}')"
 
 
@@ -128,6 +173,25 @@ def ip_eq(column: str, value: str | None) -> str:
     return f"{column} = {ipv6(value)}"
 
 
+def subset_bounds(subset: IPNetwork) -> tuple[str, str]:
+    """
+    First and last addresses of `subset`, as SQL expressions.
+
+    >>> from ipaddress import ip_network
+    >>> subset_bounds(ip_network("8.8.8.0/24"))
+    ("toIPv6('8.8.8.0')", "toIPv6('8.8.8.255')")
+    >>> subset_bounds(SUBSET_PARAMETER)
+    ('{subset_min:IPv6}', '{subset_max:IPv6}')
+    >>> subset_bounds(IPv6Network("100::/64"))
+    ("toIPv6('100::')", "toIPv6('100::ffff:ffff:ffff:ffff')")
+    """
+    if subset is SUBSET_PARAMETER:
+        return ipv6(Parameter("subset_min", "IPv6")), ipv6(
+            Parameter("subset_max", "IPv6")
+        )
+    return ipv6(subset[0]), ipv6(subset[-1])
+
+
 def ip_in(column: str, subset: IPNetwork | None) -> str:
     """
     >>> from ipaddress import ip_network
@@ -135,10 +199,27 @@ def ip_in(column: str, subset: IPNetwork | None) -> str:
     '1'
     >>> ip_in("col", ip_network("::/0"))
     "(col >= toIPv6('::') AND col <= toIPv6('ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff'))"
+    >>> ip_in("col", SUBSET_PARAMETER)
+    '(col >= {subset_min:IPv6} AND col <= {subset_max:IPv6})'
     """
     if not subset:
         return "1"
-    return f"({column} >= {ipv6(subset[0])} AND {column} <= {ipv6(subset[-1])})"
+    first, last = subset_bounds(subset)
+    return f"({column} >= {first} AND {column} <= {last})"
+
+
+def ip_in_any(column: str, subsets: Iterable[IPNetwork]) -> str:
+    """
+    >>> from ipaddress import ip_network
+    >>> ip_in_any("col", [])
+    '0'
+    >>> ip_in_any("col", [ip_network("10.0.0.0/8"), ip_network("fd00::/8")])
+    "((col >= toIPv6('10.0.0.0') AND col <= toIPv6('10.255.255.255')) OR (col >= toIPv6('fd00::') AND col <= toIPv6('fdff:ffff:ffff:ffff:ffff:ffff:ffff:ffff')))"
+    """
+    conditions = [ip_in(column, subset) for subset in subsets]
+    if not conditions:
+        return "0"
+    return "(" + " OR ".join(conditions) + ")"
 
 
 def ip_not_in(column: str, subset: IPNetwork | None) -> str:
@@ -151,7 +232,45 @@ def ip_not_in(column: str, subset: IPNetwork | None) -> str:
     """
     if not subset:
         return "1"
-    return f"({column} < {ipv6(subset[0])} OR {column} > {ipv6(subset[-1])})"
+    first, last = subset_bounds(subset)
+    return f"({column} < {first} OR {column} > {last})"
+
+
+def literal(value: Any) -> str:
+    """
+    >>> literal(1)
+    '1'
+    >>> literal("::ffff:8.8.8.8")
+    "toIPv6('::ffff:8.8.8.8')"
+    >>> print(literal("it's"))
+    'it\\'s'
+    """
+    if isinstance(value, str):
+        try:
+            ip_address(value)
+            return ipv6(value)
+        except ValueError:
+            escaped = value.replace("\\", "\\\\").replace("'", "\\'")
+            return f"'{escaped}'"
+    return str(value)
+
+
+def tuple_gt(columns: Sequence[str], values: Sequence[Any]) -> str:
+    """
+    Lexicographic `(columns) > (values)` comparison, expanded so that
+    ClickHouse can use the sorting key to skip the previous rows.
+
+    >>> tuple_gt(["a"], [1])
+    'a > 1'
+    >>> tuple_gt(["a", "b"], [1, "8.8.8.8"])
+    "(a > 1 OR (a = 1 AND b > toIPv6('8.8.8.8')))"
+    """
+    column, value = columns[-1], literal(values[-1])
+    condition = f"{column} > {value}"
+    for column, value in zip(reversed(columns[:-1]), reversed(values[:-1])):
+        value = literal(value)
+        condition = or_(f"{column} > {value}", and_(f"{column} = {value}", condition))
+    return condition
 
 
 def and_(a: str, b: str) -> str:
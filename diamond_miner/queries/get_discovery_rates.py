@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.count_rows import CountNewLinksPerPrefix
+from diamond_miner.queries.get_probes import GetProbesDiff
+from diamond_miner.queries.query import LinksQuery
+from diamond_miner.typing import IPNetwork
+from diamond_miner.utilities import common_parameters
+
+
+@dataclass(frozen=True)
+class GetDiscoveryRates(LinksQuery):
+    """
+    Return, for each prefix probed at `incremental_round`, the number of probes sent
+    at this round (which can be lower than the number of probes requested, see `GetProbesDiff.sent`) and the number of new links that they discovered.
+    A link is new if it does not appear in the previous rounds.
+
+    The ratio of the two is the marginal discovery rate of the prefix,
+    used by `diamond_miner.budget` to choose the probes to send when the budget is limited.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import GetDiscoveryRates
+        >>> for round_ in range(1, 4):
+        ...     rows = GetDiscoveryRates(incremental_round=round_, filter_inter_round=True).execute(client, "test_nsdi_example")
+        ...     print([(row["probe_dst_prefix"], row["probes"], row["new_links"]) for row in rows])
+        [('::ffff:200.0.0.0', 24, 6)]
+        [('::ffff:200.0.0.0', 41, 2)]
+        [('::ffff:200.0.0.0', 20, 0)]
+    """
+
+    incremental_round: int = 1
+    "Round for which to compute the discovery rates."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        probes_query = GetProbesDiff(
+            round_eq=self.incremental_round,
+            probe_protocol=self.probe_protocol,
+            sent=True,
+        )
+        links_query = CountNewLinksPerPrefix(
+            **common_parameters(self, CountNewLinksPerPrefix)
+        )
+        return f"""
+        SELECT
+            probe_protocol,
+            probe_dst_prefix,
+            probes,
+            prefix_new_links AS new_links
+        FROM (
+            SELECT
+                probe_protocol,
+                probe_dst_prefix,
+                -- a TTL whose count decreased does not send any probe
+                toUInt64(arraySum(x -> greatest(x.2 - x.3, 0), probes_per_ttl)) AS probes
+            FROM ({probes_query.statement(measurement_id, subset)})
+        ) AS probes
+        LEFT JOIN (
+            SELECT
+                probe_protocol,
+                probe_dst_prefix,
+                sum(new_links) AS prefix_new_links
+            FROM ({links_query.statement(measurement_id, subset)})
+            GROUP BY (probe_protocol, probe_dst_prefix)
+        ) AS links
+        USING (probe_protocol, probe_dst_prefix)
+        WHERE probes > 0
+        """
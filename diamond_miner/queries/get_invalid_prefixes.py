@@ -22,13 +22,28 @@ class GetInvalidPrefixes(PrefixesQuery):
         >>> rows = GetInvalidPrefixes().execute(client, "test_invalid_prefixes")
         >>> [x["probe_dst_prefix"] for x in rows]
         ['::ffff:201.0.0.0', '::ffff:202.0.0.0']
+        >>> rows = GetInvalidPrefixes(include_probe=True).execute(client, "test_invalid_prefixes")
+        >>> sorted(rows[0])
+        ['probe_dst_prefix', 'probe_protocol', 'probe_src_addr']
     """
 
+    include_probe: bool = False
+    "If true, include the protocol and the source address of the probes."
+
+    def columns(self) -> list[str]:
+        columns = ["probe_dst_prefix"]
+        if self.include_probe:
+            columns = ["probe_protocol", "probe_src_addr", *columns]
+        return columns
+
+    def supports_pagination(self) -> bool:
+        return True
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
         return f"""
-        SELECT probe_dst_prefix
+        SELECT {','.join(self.columns())}
         FROM {prefixes_table(measurement_id)}
         WHERE {self.filters(subset)} AND (has_amplification OR has_loops)
         """
@@ -1,8 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries import GetInvalidPrefixes
-from diamond_miner.queries.query import LinksQuery, links_table
+from diamond_miner.queries.query import (
+    LinksQuery,
+    invalid_prefixes_set,
+    links_summary_table,
+    links_table,
+)
 from diamond_miner.typing import IPNetwork
 from diamond_miner.utilities import common_parameters
 
@@ -27,6 +32,9 @@ class GetLinks(LinksQuery):
         >>> links = GetLinks(include_metadata=True).execute(client, 'test_nsdi_example')
         >>> len(links)
         8
+        >>> links = GetLinks(include_probe=True).execute(client, 'test_nsdi_example')
+        >>> sorted(links[0])
+        ['far_addr', 'near_addr', 'probe_dst_prefix', 'probe_protocol', 'probe_src_addr']
         >>> links = GetLinks(near_or_far_addr="150.0.6.1").execute(client, 'test_nsdi_example')
         >>> len(links)
         3
@@ -35,21 +43,74 @@ class GetLinks(LinksQuery):
     filter_invalid_prefixes: bool = False
     "If true, exclude links from prefixes with amplification or loops."
 
+    invalid_prefixes_from_sets: bool = False
+    """
+    If true, read the invalid prefixes from the sets filled by `InsertInvalidPrefixesSets`
+    (see `CreateInvalidPrefixesSets`), instead of the prefixes table.
+    """
+
     include_metadata: bool = False
-    "If true, include the TTLs at which `near_addr` and `far_addr` were seen."
+    """
+    If true, include the TTLs at which `near_addr` and `far_addr` were seen.
+    With `summary=True`, include the minimum TTLs at which they were seen.
+    """
+
+    include_probe: bool = False
+    "If true, include the protocol, the source address and the destination prefix of the probes."
+
+    include_first_round: bool = False
+    "If true, include the round at which the link was first seen (requires `summary=True`)."
+
+    summary: bool = False
+    """
+    If true, read the links from the links summary table (see `CreateLinksSummaryTable`)
+    instead of scanning the links table. Only the default filters are supported.
+    """
 
     def columns(self) -> list[str]:
         columns = ["near_addr", "far_addr"]
         if self.include_metadata:
             columns = ["near_ttl", "far_ttl", *columns]
+        if self.include_probe:
+            columns = ["probe_protocol", "probe_src_addr", "probe_dst_prefix", *columns]
+        if self.include_first_round:
+            columns.append("first_round")
         return columns
 
+    def supports_pagination(self) -> bool:
+        return not self.summary
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
-        if self.filter_invalid_prefixes:
+        if self.summary:
+            assert subset == UNIVERSE_SUBSET, "subset not allowed with summary=True"
+            assert (
+                replace(
+                    self,
+                    summary=False,
+                    include_metadata=False,
+                    include_first_round=False,
+                )
+                == GetLinks()
+            ), "only the default filters are allowed with summary=True"
+            # The rows of each link are merged with `FINAL`.
+            aliases = {
+                "near_ttl": "min_near_ttl AS near_ttl",
+                "far_ttl": "min_far_ttl AS far_ttl",
+            }
+            return f"""
+            SELECT {','.join(aliases.get(column, column) for column in self.columns())}
+            FROM {links_summary_table(measurement_id)} FINAL
+            """
+        assert not self.include_first_round, "include_first_round requires summary=True"
+        if self.filter_invalid_prefixes and self.invalid_prefixes_from_sets:
+            prefix_filter = (
+                f"probe_dst_prefix NOT IN {invalid_prefixes_set(measurement_id)}"
+            )
+        elif self.filter_invalid_prefixes:
             invalid_prefixes_query = GetInvalidPrefixes(
-                **common_parameters(self, GetInvalidPrefixes)
+                **{**common_parameters(self, GetInvalidPrefixes), "keyset_after": None}
             )
             prefix_filter = f"""
             probe_dst_prefix NOT IN ({invalid_prefixes_query.statement(measurement_id, subset)})
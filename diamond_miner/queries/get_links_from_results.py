@@ -2,7 +2,13 @@ from dataclasses import dataclass
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries.fragments import ip_in
-from diamond_miner.queries.query import ResultsQuery, prefixes_table, results_table
+from diamond_miner.queries.query import (
+    ResultsQuery,
+    amplification_prefixes_set,
+    flows_table,
+    prefixes_table,
+    results_table,
+)
 from diamond_miner.typing import IPNetwork
 
 
@@ -27,21 +33,68 @@ class GetLinksFromResults(ResultsQuery):
     This is useful if you want to update a `links` table round-by-round:
     such a table will contain only intra-round links but can be updated incrementally.
 
+    To update a `links` table round-by-round while keeping the cross-rounds links,
+    use `incremental_round` instead: only the flows seen during this round are considered,
+    and only the links that can be new after this round are returned.
+
     Examples:
         >>> from diamond_miner.test import client
         >>> from diamond_miner.queries import GetLinksFromResults
         >>> links = GetLinksFromResults().execute(client, "test_nsdi_example")
         >>> len(links)
         58
+        >>> links = GetLinksFromResults(incremental_round=3).execute(client, "test_nsdi_example")
+        >>> len(links)
+        11
     """
 
     ignore_invalid_prefixes: bool = True
     "If true, exclude invalid prefixes from links computation."
 
+    invalid_prefixes_from_sets: bool = False
+    """
+    If true, read the prefixes with amplification from the set filled by `InsertInvalidPrefixesSets`
+    (see `CreateInvalidPrefixesSets`), instead of the prefixes table.
+    """
+
+    incremental_round: int | None = None
+    """
+    If specified, compute the links only for the flows that appear in the results of this round,
+    using the results from this round and the previous ones.
+    Return only the links that involve a reply from this round (including cross-rounds links),
+    and the partial and virtual links outside of the TTLs of the replies of the previous rounds,
+    which are new as the traceroute is extended.
+    Running this query after each round produces the same set of links as running
+    the non-incremental query after each round, without emitting a link twice,
+    and the cost of each round depends only on the size of the round.
+    """
+
+    from_flows: bool = False
+    """
+    If true, compute the links from the pre-aggregated traceroutes of the flows table
+    (see `CreateFlowsTable`) instead of the results table.
+    The round filters and `incremental_round` are not supported in this mode.
+    """
+
+    window_functions: bool = False
+    """
+    If true, compute the links from consecutive replies with window functions,
+    instead of building a map from TTL to reply for each flow.
+    The replies are read in the order of the results table, so that the links are emitted
+    flow by flow and the memory usage does not depend on the number of flows in the subset.
+    The links are identical, provided that there is at most one reply per `(flow, TTL)` pair
+    (see `ignore_invalid_prefixes`).
+    """
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
-        if self.ignore_invalid_prefixes:
+        if self.ignore_invalid_prefixes and self.invalid_prefixes_from_sets:
+            invalid_filter = f"""
+            AND (probe_protocol, probe_src_addr, probe_dst_prefix)
+            NOT IN {amplification_prefixes_set(measurement_id)}
+            """
+        elif self.ignore_invalid_prefixes:
             invalid_filter = f"""
             AND (probe_protocol, probe_src_addr, probe_dst_prefix)
             NOT IN (
@@ -51,48 +104,189 @@ class GetLinksFromResults(ResultsQuery):
                 AND has_amplification
             )
             """
-            # TODO: We currently do not drop prefixes with loops as this considerably
-            # reduces the number of discoveries. As such, we send more probe than necessary.
-            # A better way would be to detect the min/max TTL of a loop, and to ignore it
-            # in the next round query.
+            # We do not drop prefixes with loops as this considerably reduces the number
+            # of discoveries. Instead, the TTLs inside the loops can be ignored in the
+            # next round query (see `GetMDAProbes.exclude_loops`).
         else:
             invalid_filter = ""
 
-        return f"""
-        WITH
-            groupUniqArray((round, probe_ttl, reply_src_addr)) AS traceroute,
-            arrayMap(x -> x.2, traceroute) AS ttls,
-            arrayMap(x -> (x.1, x.3), traceroute) AS val,
-            CAST((ttls, val), 'Map(UInt8, Tuple(UInt8, IPv6))') AS map,
-            arrayMin(ttls) AS first_ttl,
-            arrayMax(ttls) AS last_ttl,
-            arrayMap(i -> (toUInt8(i), toUInt8(i + 1), map[toUInt8(i)], map[toUInt8(i + 1)]), range(first_ttl, last_ttl)) AS links,
-            arrayJoin(links) AS link
-        SELECT
-            probe_protocol,
-            probe_src_addr,
-            probe_dst_prefix,
-            probe_dst_addr,
-            probe_src_port,
-            probe_dst_port,
-            -- Set the round number for partial links:
-            -- The link (1, 10, A) -> (null, 11, *) becomes
-            --          (1, 10, A) -> (1,    11, *)
-            if(link.3.1 != 0, link.3.1, link.4.1) AS near_round,
-            if(link.4.1 != 0, link.4.1, link.3.1) AS far_round,
-            link.1 AS near_ttl,
-            link.2 AS far_ttl,
-            link.3.2 AS near_addr,
-            link.4.2 AS far_addr
-        FROM {results_table(measurement_id)}
-        WHERE {self.filters(subset)}
-        {invalid_filter}
-        GROUP BY (
-            probe_protocol,
-            probe_src_addr,
-            probe_dst_prefix,
-            probe_dst_addr,
-            probe_src_port,
-            probe_dst_port
-        )
-        """
+        if self.from_flows:
+            assert not self.incremental_round, "incremental_round is not supported"
+            traceroute = "groupUniqArrayMerge(traceroute)"
+            table = flows_table(measurement_id)
+            filters = self.flows_filters(subset)
+        else:
+            traceroute = "groupUniqArray((round, probe_ttl, reply_src_addr))"
+            table = results_table(measurement_id)
+            filters = self.filters(subset)
+
+        if self.incremental_round:
+            flows_filter = f"""
+            AND round <= {self.incremental_round}
+            AND (probe_protocol, probe_src_addr, probe_dst_prefix, probe_dst_addr, probe_src_port, probe_dst_port)
+            IN (
+                SELECT probe_protocol, probe_src_addr, probe_dst_prefix, probe_dst_addr, probe_src_port, probe_dst_port
+                FROM {results_table(measurement_id)}
+                WHERE {self.filters(subset)}
+                AND round = {self.incremental_round}
+            )
+            """
+        else:
+            flows_filter = ""
+
+        # In incremental mode, we also compute the TTLs of the first and of the last
+        # replies of the flow before this round (see `incremental_round` below).
+        previous_columns = ""
+
+        if self.window_functions:
+            assert (
+                not self.from_flows
+            ), "from_flows is not supported with window functions"
+            # For each reply, emit the links between the previous reply of the flow and this reply:
+            # (prev_ttl, prev_ttl + 1, A, *), ..., (ttl - 1, ttl, *, B)
+            # The window is ordered as the sorting key of the results table,
+            # which allows ClickHouse to compute it while reading the table.
+            previous_ttls = ""
+            if self.incremental_round:
+                previous_columns = ", previous_first_ttl, previous_last_ttl"
+                previous_ttls = f"""
+                , minIf(probe_ttl, round < {self.incremental_round}) OVER traceroute AS previous_first_ttl
+                , maxIf(probe_ttl, round < {self.incremental_round}) OVER traceroute AS previous_last_ttl
+                """
+            statement = f"""
+            WITH
+                arrayJoin(range(prev_ttl, probe_ttl)) AS ttl,
+                ttl = prev_ttl AS has_near,
+                ttl + 1 = probe_ttl AS has_far
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                probe_dst_addr,
+                probe_src_port,
+                probe_dst_port,
+                -- Set the round number for partial links, as below.
+                if(has_near, prev_round, if(has_far, round, 0)) AS near_round,
+                if(has_far, round, if(has_near, prev_round, 0)) AS far_round,
+                toUInt8(ttl) AS near_ttl,
+                toUInt8(ttl + 1) AS far_ttl,
+                if(has_near, prev_addr, toIPv6('::')) AS near_addr,
+                if(has_far, reply_src_addr, toIPv6('::')) AS far_addr
+                {previous_columns}
+            FROM (
+                SELECT
+                    probe_protocol,
+                    probe_src_addr,
+                    probe_dst_prefix,
+                    probe_dst_addr,
+                    probe_src_port,
+                    probe_dst_port,
+                    probe_ttl,
+                    round,
+                    reply_src_addr,
+                    row_number() OVER flow AS n,
+                    lagInFrame(probe_ttl) OVER flow AS prev_ttl,
+                    lagInFrame(round) OVER flow AS prev_round,
+                    lagInFrame(reply_src_addr) OVER flow AS prev_addr
+                    {previous_ttls}
+                FROM {results_table(measurement_id)}
+                WHERE {self.filters(subset)}
+                {invalid_filter}
+                {flows_filter}
+                WINDOW flow AS (
+                    PARTITION BY
+                        probe_protocol,
+                        probe_src_addr,
+                        probe_dst_prefix,
+                        probe_dst_addr,
+                        probe_src_port,
+                        probe_dst_port
+                    ORDER BY probe_ttl
+                    ROWS BETWEEN 1 PRECEDING AND CURRENT ROW
+                ),
+                traceroute AS (
+                    PARTITION BY
+                        probe_protocol,
+                        probe_src_addr,
+                        probe_dst_prefix,
+                        probe_dst_addr,
+                        probe_src_port,
+                        probe_dst_port
+                )
+            )
+            WHERE n > 1
+            """
+        else:
+            if self.incremental_round:
+                previous_columns = f"""
+                , arrayMin(arrayMap(x -> x.2, arrayFilter(x -> x.1 < {self.incremental_round}, traceroute))) AS previous_first_ttl
+                , arrayMax(arrayMap(x -> x.2, arrayFilter(x -> x.1 < {self.incremental_round}, traceroute))) AS previous_last_ttl
+                """
+            statement = f"""
+            WITH
+                {traceroute} AS traceroute,
+                arrayMap(x -> x.2, traceroute) AS ttls,
+                arrayMap(x -> (x.1, x.3), traceroute) AS val,
+                CAST((ttls, val), 'Map(UInt8, Tuple(UInt8, IPv6))') AS map,
+                arrayMin(ttls) AS first_ttl,
+                arrayMax(ttls) AS last_ttl,
+                arrayMap(i -> (toUInt8(i), toUInt8(i + 1), map[toUInt8(i)], map[toUInt8(i + 1)]), range(first_ttl, last_ttl)) AS links,
+                arrayJoin(links) AS link
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                probe_dst_addr,
+                probe_src_port,
+                probe_dst_port,
+                -- Set the round number for partial links:
+                -- The link (1, 10, A) -> (null, 11, *) becomes
+                --          (1, 10, A) -> (1,    11, *)
+                if(link.3.1 != 0, link.3.1, link.4.1) AS near_round,
+                if(link.4.1 != 0, link.4.1, link.3.1) AS far_round,
+                link.1 AS near_ttl,
+                link.2 AS far_ttl,
+                link.3.2 AS near_addr,
+                link.4.2 AS far_addr
+                {previous_columns}
+            FROM {table}
+            WHERE {filters}
+            {invalid_filter}
+            {flows_filter}
+            GROUP BY (
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                probe_dst_addr,
+                probe_src_port,
+                probe_dst_port
+            )
+            """
+
+        if self.incremental_round:
+            # The links between the replies of the previous rounds have already been emitted,
+            # unless they involve a reply from this round. The links outside of these replies
+            # (partial and virtual links) are new since the traceroute got longer.
+            # If the flow had no replies before this round, `previous_last_ttl` is 0
+            # and all its links are new.
+            return f"""
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                probe_dst_addr,
+                probe_src_port,
+                probe_dst_port,
+                near_round,
+                far_round,
+                near_ttl,
+                far_ttl,
+                near_addr,
+                far_addr
+            FROM ({statement})
+            WHERE near_round = {self.incremental_round}
+            OR far_round = {self.incremental_round}
+            OR near_ttl < previous_first_ttl
+            OR near_ttl >= previous_last_ttl
+            """
+        return statement
@@ -0,0 +1,65 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.query import ResultsQuery, results_table
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class GetMaxTTL(ResultsQuery):
+    """
+    Return the maximum useful TTL of each prefix: the probes sent above this TTL
+    can only reach the destination again.
+
+    For each flow, this is the first TTL at which the destination host,
+    or an address in the destination prefix, replied.
+    The maximum is taken over the flows of the prefix, and over the TTLs of the other replies,
+    so that the longer paths of the flows that did not reach the destination are kept.
+    The prefixes for which no replies have been received from the destination are not returned.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import GetMaxTTL
+        >>> GetMaxTTL().execute(client, "test_max_ttl")
+        [{'probe_protocol': 1, 'probe_dst_prefix': '::ffff:200.0.0.0', 'max_ttl': 4}]
+        >>> GetMaxTTL().execute(client, "test_nsdi_example")
+        []
+    """
+
+    filter_destination_host: bool = False
+    "The replies from the destination are required to compute the maximum TTL."
+
+    filter_destination_prefix: bool = False
+    "The replies from the destination prefix are required to compute the maximum TTL."
+
+    time_exceeded_only: bool = False
+    "The replies from the destination are not ICMP time exceeded replies."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        return f"""
+        SELECT
+            probe_protocol,
+            probe_dst_prefix,
+            greatest(max(destination_ttl), max(other_ttl)) AS max_ttl
+        FROM (
+            SELECT
+                probe_protocol,
+                probe_dst_prefix,
+                minIf(probe_ttl, destination_prefix_reply) AS destination_ttl,
+                maxIf(probe_ttl, NOT destination_prefix_reply) AS other_ttl
+            FROM {results_table(measurement_id)}
+            WHERE {self.filters(subset)}
+            GROUP BY (
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                probe_dst_addr,
+                probe_src_port,
+                probe_dst_port
+            )
+        )
+        GROUP BY (probe_protocol, probe_dst_prefix)
+        HAVING max(destination_ttl) > 0
+        """
@@ -1,7 +1,16 @@
 from dataclasses import dataclass
+from ipaddress import ip_network
 
 from diamond_miner.defaults import DEFAULT_FAILURE_RATE, UNIVERSE_SUBSET
-from diamond_miner.queries.query import LinksQuery, links_table
+from diamond_miner.queries.fragments import ip_in
+from diamond_miner.queries.get_max_ttl import GetMaxTTL
+from diamond_miner.queries.query import (
+    LinksQuery,
+    converged_prefixes_set,
+    links_table,
+    prefixes_table,
+    probes_table,
+)
 from diamond_miner.typing import IPNetwork
 
 
@@ -15,12 +24,31 @@ class GetMDAProbes(LinksQuery):
         >>> from diamond_miner.queries import GetMDAProbes
         >>> GetMDAProbes(round_leq=1).execute(client, "test_nsdi_lite")
         [{'probe_protocol': 1, 'probe_dst_prefix': '::ffff:200.0.0.0', 'cumulative_probes': [12, 12, 12, 12], 'TTLs': [1, 2, 3, 4]}]
+        >>> GetMDAProbes(round_leq=1, dminer_lite=False).execute(client, "test_nsdi_lite")
+        [{'probe_protocol': 1, 'probe_dst_prefix': '::ffff:200.0.0.0', 'cumulative_probes': [12, 21, 21, 21], 'TTLs': [1, 2, 3, 4]}]
     """
 
     adaptive_eps: bool = True
 
     dminer_lite: bool = True
-    "If true, use an heuristic that requires less probes to handle nested load-balancers."
+    """
+    If true, use an heuristic that requires less probes to handle nested load-balancers:
+    the stopping point at a given TTL is computed from the total number of links at this TTL.
+    Otherwise, compute the number of probes required to reach each vertex `v` at TTL `h`,
+    `D_h(v) = n_k(v) / P(v)`, where `n_k(v)` is the stopping point for the `k` successors of `v`,
+    and `P(v)` is the fraction of the flows at TTL `h` that went through `v`,
+    and send the maximum of `D_h(v)` at each TTL.
+
+    The full computation guarantees the failure rate for each vertex: the lite heuristic
+    assumes that the flows are spread evenly over the vertices of a TTL, and under-probes
+    the successors of the vertices reached by few flows, for which the full computation
+    sends more probes (e.g. on the unbalanced load balancers of the NSDI example).
+    On the other hand, the stopping point of the lite heuristic grows faster than linearly
+    with the total number of links at a TTL, so that the full computation sends fewer probes
+    on wide nested load balancers, where many vertices each have a few successors:
+    with ε = 0.05 and 32 vertices with one successor reached by the same number of flows,
+    the lite heuristic sends `n_33 = 211` probes and the full computation `32 * n_2 = 192`.
+    """
 
     target_epsilon: float = DEFAULT_FAILURE_RATE
     """
@@ -28,8 +56,129 @@ class GetMDAProbes(LinksQuery):
     all the outgoing edges of a load-balancer for a given prefix and TTL.
     """
 
+    cap_max_ttl: bool = False
+    """
+    If true, do not send probes above the maximum useful TTL of each prefix (see `GetMaxTTL`).
+    The TTLs are already bounded by the links, unless the links were computed with the replies
+    from the destination.
+    """
+
+    exclude_loops: bool = False
+    """
+    If true, do not send probes to the TTLs inside the loops of each prefix,
+    between the `loop_min_ttl` and the `loop_max_ttl` of the prefixes table (see `InsertPrefixes`).
+    The TTLs before and after the loops are still probed, and so are the TTLs
+    that do not loop for every source address.
+    """
+
+    skip_converged: bool = False
+    """
+    If true, skip the prefixes that did not discover new links during one of the rounds
+    inserted in the convergence table (see `InsertConvergence`), according to the set
+    of converged prefixes.
+    With `dminer_lite=True`, the probes computed for such prefixes are the same
+    as in the previous round, so no new probes would be sent.
+    """
+
+    star_ttls_threshold: int | None = None
+    """
+    If specified, do not send new probes to the TTLs of a prefix where at least this number of flows
+    have been observed, and where no replies have been received (only `('::', node)` and `('::', '::')` links):
+    the number of probes of such TTLs is kept to the number of probes sent during `round_leq`.
+    Such TTLs are only counted when partial and virtual links are kept (`filter_partial=False`).
+    """
+
+    star_ttls_thresholds: tuple[tuple[str, int], ...] = ()
+    """
+    Per-prefix thresholds, as `(network, threshold)` pairs, which override `star_ttls_threshold`
+    for the prefixes inside `network` (the first matching network is used).
+    A threshold of 0 disables the trimming for these prefixes.
+    """
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        joins, conditions = [], []
+        probes, star_ttls = "probes", ""
+        if self.trim_star_ttls():
+            assert self.round_leq, "round_leq is required to trim the star TTLs"
+            joins.append(
+                f"""
+                LEFT JOIN (
+                    SELECT
+                        probe_protocol,
+                        probe_dst_prefix,
+                        CAST(
+                            (groupArray(probe_ttl), groupArray(sent_probes)),
+                            'Map(UInt8, UInt32)'
+                        ) AS previous_probes
+                    FROM (
+                        -- the lowest count of the round is the number of probes actually sent
+                        SELECT probe_protocol, probe_dst_prefix, probe_ttl, min(cumulative_probes) AS sent_probes
+                        FROM {probes_table(measurement_id)}
+                        WHERE {ip_in("probe_dst_prefix", subset)}
+                        AND round = {self.round_leq}
+                        GROUP BY (probe_protocol, probe_dst_prefix, probe_ttl)
+                    )
+                    GROUP BY (probe_protocol, probe_dst_prefix)
+                ) AS previous_probes
+                USING (probe_protocol, probe_dst_prefix)
+                """
+            )
+            probes = "arrayMap((n, t, star) -> if(star, previous_probes[t], n), probes, ttls, star_ttls)"
+            star_ttls = ", star_ttls"
+        if self.cap_max_ttl:
+            joins.append(
+                f"""
+                LEFT JOIN ({GetMaxTTL(round_leq=self.round_leq).statement(measurement_id, subset)}) AS max_ttls
+                USING (probe_protocol, probe_dst_prefix)
+                """
+            )
+            conditions.append("(max_ttl = 0 OR t <= max_ttl)")
+        if self.exclude_loops:
+            joins.append(
+                f"""
+                LEFT JOIN (
+                    SELECT
+                        probe_protocol,
+                        probe_dst_prefix,
+                        max(loop_min_ttl) AS first_loop_ttl,
+                        min(loop_max_ttl) AS last_loop_ttl
+                    FROM {prefixes_table(measurement_id)}
+                    WHERE {ip_in("probe_dst_prefix", subset)}
+                    GROUP BY (probe_protocol, probe_dst_prefix)
+                    HAVING min(loop_min_ttl) > 0
+                ) AS loops
+                USING (probe_protocol, probe_dst_prefix)
+                """
+            )
+            conditions.append(
+                "(first_loop_ttl = 0 OR t < first_loop_ttl OR t > last_loop_ttl)"
+            )
+        if joins:
+            keep = " AND ".join(conditions) or "1"
+            return f"""
+            SELECT
+                probe_protocol,
+                probe_dst_prefix,
+                arrayFilter((n, t) -> {keep}, {probes}, ttls) AS cumulative_probes,
+                arrayFilter(t -> {keep}, ttls) AS TTLs
+            FROM (
+                SELECT
+                    probe_protocol,
+                    probe_dst_prefix,
+                    cumulative_probes AS probes,
+                    TTLs AS ttls
+                    {star_ttls}
+                FROM ({self.mda_probes_statement(measurement_id, subset)})
+            ) AS mda_probes
+            {"".join(joins)}
+            WHERE notEmpty(TTLs)
+            """
+        return self.mda_probes_statement(measurement_id, subset)
+
+    def mda_probes_statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
         if self.adaptive_eps:
             eps_fragment = """
@@ -43,45 +192,132 @@ class GetMDAProbes(LinksQuery):
             """
 
         if self.dminer_lite:
-            dm_fragment = """
-            arrayMap(k -> toUInt32(ceil(ln(epsilon / (k + 1)) / ln((k + 1 - 1) / (k + 1)))), links_per_ttl) AS mda_flows,
+            return f"""
+            WITH
+                {self.target_epsilon} AS target_epsilon,
+                -- 1) Compute the links
+                --  x.1       x.2        x.3
+                -- (near_ttl, near_addr, far_addr)
+                groupUniqArray((near_ttl, near_addr, far_addr)) AS links,
+                -- 2) Count the number of links per TTL
+                -- extract only the TTLs, this greatly speeds-up arrayCount
+                arrayMap(x -> x.1, links) AS links_ttls,
+                -- find the min/max TTLs
+                -- we add +2 since range() is exclusive and that we compute the max over the *near* TTL
+                range(arrayMin(links_ttls), arrayMax(links_ttls) + 2) AS TTLs,
+                -- count distinct links per TTL
+                arrayMap(t -> countEqual(links_ttls, t), TTLs) AS links_per_ttl,
+                {self.star_ttls_fragment(count_flows=True)}
+                -- 3) Compute MDA stopping points
+                {eps_fragment}
+                -- 4) Compute the number of probes to send during the next round
+                arrayMap(k -> toUInt32(ceil(ln(epsilon / (k + 1)) / ln((k + 1 - 1) / (k + 1)))), links_per_ttl) AS mda_flows,
+                {self.cumulative_probes_fragment()}
+            SELECT
+                probe_protocol,
+                probe_dst_prefix,
+                cumulative_probes,
+                TTLs
+                {", star_ttls" if self.trim_star_ttls() else ""}
+            FROM {links_table(measurement_id)} AS links_table
+            WHERE {self.mda_filters(measurement_id, subset)}
+            GROUP BY (probe_protocol, probe_src_addr, probe_dst_prefix)
             """
-        else:
-            # TODO: Implement by computing Dh(v)
-            raise NotImplementedError
 
         return f"""
         WITH
             {self.target_epsilon} AS target_epsilon,
-            -- 1) Compute the links
-            --  x.1       x.2        x.3
-            -- (near_ttl, near_addr, far_addr)
-            groupUniqArray((near_ttl, near_addr, far_addr)) AS links,
-            -- 2) Count the number of links per TTL
-            -- extract only the TTLs, this greatly speeds-up arrayCount
-            arrayMap(x -> x.1, links) AS links_ttls,
-            -- find the min/max TTLs
-            -- we add +2 since range() is exclusive and that we compute the max over the *near* TTL
-            range(arrayMin(links_ttls), arrayMax(links_ttls) + 2) AS TTLs,
-            -- count distinct links per TTL
-            arrayMap(t -> countEqual(links_ttls, t), TTLs) AS links_per_ttl,
+            -- 1) Collect the vertices
+            --  x.1       x.2         x.3
+            -- (near_ttl, successors, flows)
+            groupArray((near_ttl, successors, flows)) AS vertices,
+            arrayMap(x -> x.1, vertices) AS vertices_ttls,
+            range(arrayMin(vertices_ttls), arrayMax(vertices_ttls) + 2) AS TTLs,
+            -- 2) Count the number of links and of flows per TTL
+            arrayMap(t -> arraySum(arrayMap(x -> if(x.1 = t, x.2, 0), vertices)), TTLs) AS links_per_ttl,
+            arrayMap(t -> arraySum(arrayMap(x -> if(x.1 = t, x.3, 0), vertices)), TTLs) AS flows_per_ttl,
+            {self.star_ttls_fragment(count_flows=False)}
             -- 3) Compute MDA stopping points
             {eps_fragment}
             -- 4) Compute the number of probes to send during the next round
-            {dm_fragment}
-            -- compute the number of probes to send during the next round
-            -- => max of probes to send over TTL t and t-1
-            arrayMap(i -> arrayMax([mda_flows[i], mda_flows[i - 1]]), arrayEnumerate(TTLs)) AS cumulative_probes
-            -- TODO: Cleanup/optimize/rewrite/... below
-            -- do not send probes to TTLs where no replies have been received
-            -- it is unlikely that we will discover more at this TTL if the first 6 flows have seen nothing
-            -- (see GetNextRoundStateless)
+            -- D_h(v) = n_k(v) / P(v), with P(v) the fraction of the flows at TTL h that went through v
+            arrayMap(
+                x -> ceil(ln(epsilon / (x.2 + 1)) / ln(x.2 / (x.2 + 1)))
+                    * flows_per_ttl[x.1 - TTLs[1] + 1] / x.3,
+                vertices
+            ) AS vertices_flows,
+            -- the number of probes to send at TTL h is the maximum of D_h(v) over the vertices at TTL h
+            arrayMap(
+                t -> toUInt32(ceil(arrayMax(arrayMap((x, n) -> if(x.1 = t, n, 0), vertices, vertices_flows)))),
+                TTLs
+            ) AS mda_flows,
+            {self.cumulative_probes_fragment()}
         SELECT
             probe_protocol,
             probe_dst_prefix,
             cumulative_probes,
             TTLs
-        FROM {links_table(measurement_id)} AS links_table
-        WHERE {self.filters(subset)}
+            {", star_ttls" if self.trim_star_ttls() else ""}
+        FROM (
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                near_ttl,
+                near_addr,
+                uniqExact(far_addr) AS successors,
+                uniqExact(probe_dst_addr, probe_src_port, probe_dst_port) AS flows
+            FROM {links_table(measurement_id)} AS links_table
+            WHERE {self.mda_filters(measurement_id, subset)}
+            GROUP BY (probe_protocol, probe_src_addr, probe_dst_prefix, near_ttl, near_addr)
+        )
         GROUP BY (probe_protocol, probe_src_addr, probe_dst_prefix)
         """
+
+    def mda_filters(self, measurement_id: str, subset: IPNetwork) -> str:
+        if not self.skip_converged:
+            return self.filters(subset)
+        return f"""
+        {self.filters(subset)}
+        AND (probe_protocol, probe_src_addr, probe_dst_prefix)
+            NOT IN {converged_prefixes_set(measurement_id)}
+        """
+
+    def trim_star_ttls(self) -> bool:
+        return bool(self.star_ttls_threshold) or bool(self.star_ttls_thresholds)
+
+    def star_ttls_fragment(self, count_flows: bool) -> str:
+        if not self.trim_star_ttls():
+            return ""
+        flows_per_ttl = ""
+        if count_flows:
+            flows_per_ttl = """
+            -- count the distinct flows per near TTL
+            arrayMap(x -> x.1, groupUniqArray((near_ttl, probe_dst_addr, probe_src_port, probe_dst_port))) AS flows_ttls,
+            arrayMap(t -> countEqual(flows_ttls, t), TTLs) AS flows_per_ttl,
+            """
+        threshold = str(self.star_ttls_threshold or 0)
+        if self.star_ttls_thresholds:
+            cases = [
+                f"{ip_in('probe_dst_prefix', ip_network(network))}, {network_threshold}"
+                for network, network_threshold in self.star_ttls_thresholds
+            ]
+            threshold = f"multiIf({', '.join(cases)}, {threshold})"
+        return f"""
+            {flows_per_ttl}
+            {threshold} AS star_ttls_threshold,
+            -- TTLs with at least one reply
+            groupUniqArrayIf(near_ttl, near_addr != toIPv6('::')) AS replied_ttls,
+            arrayMap(
+                (t, n) -> star_ttls_threshold > 0 AND n >= star_ttls_threshold AND NOT has(replied_ttls, t),
+                TTLs,
+                flows_per_ttl
+            ) AS star_ttls,
+        """
+
+    def cumulative_probes_fragment(self) -> str:
+        return """
+            -- compute the number of probes to send during the next round
+            -- => max of probes to send over TTL t and t-1
+            arrayMap(i -> arrayMax([mda_flows[i], mda_flows[i - 1]]), arrayEnumerate(TTLs)) AS cumulative_probes
+        """
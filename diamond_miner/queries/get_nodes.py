@@ -1,8 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries import GetInvalidPrefixes
-from diamond_miner.queries.query import ResultsQuery, results_table
+from diamond_miner.queries.query import (
+    ResultsQuery,
+    invalid_prefixes_set,
+    nodes_summary_table,
+    results_table,
+)
 from diamond_miner.typing import IPNetwork
 from diamond_miner.utilities import common_parameters
 
@@ -29,21 +34,66 @@ class GetNodes(ResultsQuery):
     filter_invalid_prefixes: bool = False
     "If true, exclude nodes from prefixes with amplification or loops."
 
+    invalid_prefixes_from_sets: bool = False
+    """
+    If true, read the invalid prefixes from the sets filled by `InsertInvalidPrefixesSets`
+    (see `CreateInvalidPrefixesSets`), instead of the prefixes table.
+    """
+
     include_probe_ttl: bool = False
-    "If true, include the TTL at which `reply_src_addr` was seen."
+    """
+    If true, include the TTL at which `reply_src_addr` was seen.
+    With `summary=True`, include the minimum TTL at which `reply_src_addr` was seen.
+    """
+
+    include_first_round: bool = False
+    "If true, include the round at which `reply_src_addr` was first seen (requires `summary=True`)."
+
+    summary: bool = False
+    """
+    If true, read the nodes from the nodes summary table (see `CreateNodesSummaryTable`)
+    instead of scanning the results table. Only the default filters are supported.
+    """
 
     def columns(self) -> list[str]:
         columns = ["reply_src_addr"]
         if self.include_probe_ttl:
             columns.insert(0, "probe_ttl")
+        if self.include_first_round:
+            columns.append("first_round")
         return columns
 
+    def supports_pagination(self) -> bool:
+        return not self.summary
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
-        if self.filter_invalid_prefixes:
+        if self.summary:
+            assert subset == UNIVERSE_SUBSET, "subset not allowed with summary=True"
+            assert (
+                replace(
+                    self,
+                    summary=False,
+                    include_probe_ttl=False,
+                    include_first_round=False,
+                )
+                == GetNodes()
+            ), "only the default filters are allowed with summary=True"
+            # The rows of each node are merged with `FINAL`.
+            aliases = {"probe_ttl": "min_probe_ttl AS probe_ttl"}
+            return f"""
+            SELECT {','.join(aliases.get(column, column) for column in self.columns())}
+            FROM {nodes_summary_table(measurement_id)} FINAL
+            """
+        assert not self.include_first_round, "include_first_round requires summary=True"
+        if self.filter_invalid_prefixes and self.invalid_prefixes_from_sets:
+            prefix_filter = (
+                f"probe_dst_prefix NOT IN {invalid_prefixes_set(measurement_id)}"
+            )
+        elif self.filter_invalid_prefixes:
             invalid_prefixes_query = GetInvalidPrefixes(
-                **common_parameters(self, GetInvalidPrefixes)
+                **{**common_parameters(self, GetInvalidPrefixes), "keyset_after": None}
             )
             prefix_filter = f"""
                     probe_dst_prefix NOT IN ({invalid_prefixes_query.statement(measurement_id, subset)})
@@ -0,0 +1,106 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.query import ResultsQuery, flows_table, results_table
+from diamond_miner.typing import IPNetwork
+
+FLOW_COLUMNS = "probe_protocol, probe_src_addr, probe_dst_prefix, probe_dst_addr, probe_src_port, probe_dst_port"
+
+# TTLs at which an address already seen at a lower TTL replies again, given the `hops` of a flow:
+# for the loop A -> B -> C -> B -> C, this is the TTLs of the second B and C.
+# The hops are sorted by TTL, so that an address replies again from its second occurrence,
+# which `arrayEnumerateUniq` finds in a single pass (0 if there are no loops).
+FLOW_LOOP_TTLS = """
+arraySort(arrayDistinct(hops)) AS sorted_hops,
+arrayFilter(
+    (x, n) -> n > 1, sorted_hops, arrayEnumerateUniq(arrayMap(x -> x.2, sorted_hops))
+) AS loop_hops,
+if(empty(loop_hops), 0, loop_hops[1].1) AS flow_loop_min_ttl,
+if(empty(loop_hops), 0, loop_hops[-1].1) AS flow_loop_max_ttl
+"""
+
+
+@dataclass(frozen=True)
+class GetPrefixesFromResults(ResultsQuery):
+    """
+    Compute the prefixes from the results table, in a single pass.
+    This returns one line per prefix with the `has_amplification` and `has_loops` flags
+    (see `GetPrefixesWithAmplification` and `GetPrefixesWithLoops`),
+    and the `loop_min_ttl` and `loop_max_ttl` range of the TTLs inside loops.
+
+    The results are first grouped per flow:
+    a flow has amplification if it has more replies than distinct TTLs,
+    and it has loops if it has more replies than distinct reply addresses.
+    A prefix is flagged if one of its flows is flagged.
+    The loop range of a flow starts at the first TTL at which an address replies again,
+    so that the discoveries made before the loop are kept, and the range of a prefix
+    is the intersection of the ranges of its flows, that is the TTLs that loop in every flow
+    (0 if there are no such TTLs).
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import GetPrefixesFromResults
+        >>> rows = GetPrefixesFromResults().execute(client, "test_invalid_prefixes")
+        >>> sorted((x["probe_dst_prefix"], x["has_amplification"], x["has_loops"]) for x in rows)
+        [('::ffff:200.0.0.0', 0, 0), ('::ffff:201.0.0.0', 0, 1), ('::ffff:202.0.0.0', 1, 0)]
+        >>> sorted((x["probe_dst_prefix"], x["loop_min_ttl"], x["loop_max_ttl"]) for x in rows)
+        [('::ffff:200.0.0.0', 0, 0), ('::ffff:201.0.0.0', 3, 3), ('::ffff:202.0.0.0', 0, 0)]
+    """
+
+    from_flows: bool = False
+    """
+    If true, compute the prefixes from the pre-aggregated traceroutes of the flows table
+    (see `CreateFlowsTable`) instead of the results table.
+    The round filters are not supported in this mode.
+    """
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        if self.from_flows:
+            # The traceroute contains the distinct (round, TTL, reply address) tuples,
+            # and `replies` the total number of replies.
+            flows = f"""
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                groupUniqArrayMerge(traceroute) AS traceroute,
+                length(arrayDistinct(arrayMap(x -> x.2, traceroute))) < sum(replies) AS flow_has_amplification,
+                length(arrayDistinct(arrayMap(x -> x.3, traceroute))) < sum(replies) AS flow_has_loops,
+                arrayMap(x -> (x.2, x.3), traceroute) AS hops,
+                {FLOW_LOOP_TTLS}
+            FROM {flows_table(measurement_id)}
+            WHERE {self.flows_filters(subset)} AND probe_dst_prefix != toIPv6('::')
+            GROUP BY ({FLOW_COLUMNS})
+            """
+        else:
+            flows = f"""
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                uniqExact(probe_ttl) < count() AS flow_has_amplification,
+                uniqExact(reply_src_addr) < count() AS flow_has_loops,
+                groupArray((probe_ttl, reply_src_addr)) AS hops,
+                {FLOW_LOOP_TTLS}
+            FROM {results_table(measurement_id)}
+            WHERE {self.filters(subset)} AND probe_dst_prefix != toIPv6('::')
+            GROUP BY ({FLOW_COLUMNS})
+            """
+        return f"""
+        SELECT
+            probe_protocol,
+            probe_src_addr,
+            probe_dst_prefix,
+            max(flow_has_amplification) AS has_amplification,
+            max(flow_has_loops) AS has_loops,
+            max(flow_loop_min_ttl) AS common_loop_min_ttl,
+            min(flow_loop_max_ttl) AS common_loop_max_ttl,
+            min(flow_loop_min_ttl) > 0 AND common_loop_min_ttl <= common_loop_max_ttl
+                AS has_common_loop,
+            if(has_common_loop, common_loop_min_ttl, 0) AS loop_min_ttl,
+            if(has_common_loop, common_loop_max_ttl, 0) AS loop_max_ttl
+        FROM ({flows})
+        GROUP BY (probe_protocol, probe_src_addr, probe_dst_prefix)
+        """
@@ -1,5 +1,8 @@
+from dataclasses import dataclass
+
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries.fragments import ip_in
+from diamond_miner.queries.get_max_ttl import GetMaxTTL
 from diamond_miner.queries.query import ProbesQuery, probes_table
 from diamond_miner.typing import IPNetwork
 
@@ -46,6 +49,7 @@ class GetProbes(ProbesQuery):
         """
 
 
+@dataclass(frozen=True)
 class GetProbesDiff(ProbesQuery):
     """
     Return the number of probes sent at a specific round and at the previous round.
@@ -68,30 +72,59 @@ class GetProbesDiff(ProbesQuery):
         [[1, 11, 11], [2, 20, 18], [3, 27, 18], [4, 27, 18]]
         >>> GetProbesDiff(round_eq=4).execute(client, 'test_nsdi_example')
         []
+        >>> rows = GetProbesDiff(round_eq=2, cap_max_ttl=True).execute(client, 'test_max_ttl')
+        >>> sorted((row["probe_dst_prefix"], row["probes_per_ttl"]) for row in rows)
+        [('::ffff:200.0.0.0', [[1, 2, 1], [2, 2, 1], [3, 2, 1], [4, 2, 1]]), ('::ffff:201.0.0.0', [[1, 2, 1], [2, 2, 1], [3, 2, 0]])]
+    """
+
+    cap_max_ttl: bool = False
+    """
+    If true, ignore the TTLs above the maximum useful TTL of each prefix,
+    computed from the results of the previous rounds (see `GetMaxTTL`).
+    """
+
+    sent: bool = False
+    """
+    If true, return the number of probes sent at `round_eq` instead of the number of probes requested,
+    when they differ because of a probe budget (see `diamond_miner.insert.insert_allocation`).
     """
 
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
         assert self.round_eq
+        max_ttl_fragment = ""
+        if self.cap_max_ttl and self.round_eq > 1:
+            max_ttl_fragment = f"""
+            LEFT JOIN ({GetMaxTTL(round_leq=self.round_eq - 1).statement(measurement_id, subset)}) AS max_ttls
+            USING (probe_protocol, probe_dst_prefix)
+            WHERE max_ttl = 0 OR probe_ttl <= max_ttl
+            """
+        # Instead of joining the probes table with itself, we read the rows of both rounds
+        # and aggregate them per (protocol, prefix, TTL): this requires a single scan and
+        # no hash table for the right-hand side of the join.
+        # When the probes of a round did not fit in the budget, a second row records
+        # the number of probes sent, which is lower than the number of probes requested.
+        current = "minIf" if self.sent else "maxIf"
         return f"""
         SELECT
-            current.probe_protocol,
-            current.probe_dst_prefix,
-            groupArray((current.probe_ttl, current.cumulative_probes, previous.cumulative_probes)) AS probes_per_ttl
-        FROM {probes_table(measurement_id)} AS current
-        LEFT JOIN (
+            probe_protocol,
+            probe_dst_prefix,
+            arraySort(groupArray((probe_ttl, current_probes, previous_probes))) AS probes_per_ttl
+        FROM (
             SELECT
                 probe_protocol,
                 probe_dst_prefix,
                 probe_ttl,
-                cumulative_probes
+                {current}(cumulative_probes, round = {self.round_eq}) AS current_probes,
+                minIf(cumulative_probes, round = {self.round_eq - 1}) AS previous_probes
             FROM {probes_table(measurement_id)}
-            WHERE {ip_in("probe_dst_prefix", subset)} AND round = {self.round_eq - 1}
-        ) AS previous
-        ON current.probe_protocol = previous.probe_protocol
-        AND current.probe_dst_prefix = previous.probe_dst_prefix
-        AND current.probe_ttl = previous.probe_ttl
-        WHERE {self.filters(subset)}
-        GROUP BY (current.probe_protocol, current.probe_dst_prefix)
+            WHERE {self.filters(subset)}
+            OR ({ip_in("probe_dst_prefix", subset)} AND round = {self.round_eq - 1})
+            GROUP BY (probe_protocol, probe_dst_prefix, probe_ttl)
+            -- Keep only the TTLs probed at the current round.
+            HAVING countIf(round = {self.round_eq}) > 0
+        ) AS probes
+        {max_ttl_fragment}
+        GROUP BY (probe_protocol, probe_dst_prefix)
         """
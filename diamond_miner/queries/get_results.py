@@ -18,6 +18,9 @@ class GetResults(ResultsQuery):
         85
     """
 
+    def supports_pagination(self) -> bool:
+        return True
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
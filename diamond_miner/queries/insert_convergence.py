@@ -0,0 +1,93 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.count_rows import CountNewLinksPerPrefix
+from diamond_miner.queries.fragments import ip_in
+from diamond_miner.queries.query import (
+    LinksQuery,
+    converged_prefixes_set,
+    convergence_table,
+    probes_table,
+)
+from diamond_miner.typing import IPNetwork
+from diamond_miner.utilities import common_parameters
+
+
+@dataclass(frozen=True)
+class InsertConvergence(LinksQuery):
+    """
+    Insert the number of new links discovered in each prefix during `incremental_round`
+    into the convergence table (see `CountNewLinksPerPrefix`), and the prefixes
+    that did not discover any new link into the set of converged prefixes.
+    Run this query after the links of `incremental_round` have been inserted, once per round.
+
+    A prefix is only considered as converged if new probes were sent to it during `incremental_round`,
+    and if all of them were sent: the prefixes that were not probed during this round,
+    or whose probes were partially dropped by a probe budget (see `diamond_miner.insert.insert_allocation`),
+    can still discover new links.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateConvergenceTable, InsertConvergence, converged_prefixes_set, convergence_table
+        >>> for table in (convergence_table, converged_prefixes_set):
+        ...     _ = client.text(f"DROP TABLE IF EXISTS {table('test_nsdi_example')}")
+        >>> CreateConvergenceTable().execute(client, 'test_nsdi_example')
+        []
+        >>> InsertConvergence(incremental_round=1, filter_inter_round=True).execute(client, 'test_nsdi_example')
+        []
+        >>> rows = client.json(f"SELECT probe_dst_prefix, round, new_links FROM {convergence_table('test_nsdi_example')}")
+        >>> [tuple(row.values()) for row in rows]
+        [('::ffff:200.0.0.0', 1, 6)]
+    """
+
+    incremental_round: int = 1
+    "Round for which to count the new links."
+
+    def statements(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> Sequence[str]:
+        query = CountNewLinksPerPrefix(
+            **common_parameters(self, CountNewLinksPerPrefix)
+        )
+        return (
+            f"""
+            INSERT INTO {convergence_table(measurement_id)}
+            SELECT
+                probe_protocol,
+                probe_src_addr,
+                probe_dst_prefix,
+                {self.incremental_round} AS round,
+                new_links
+            FROM ({query.statement(measurement_id, subset)})
+            """,
+            f"""
+            INSERT INTO {converged_prefixes_set(measurement_id)}
+            SELECT probe_protocol, probe_src_addr, probe_dst_prefix
+            FROM {convergence_table(measurement_id)}
+            WHERE {ip_in("probe_dst_prefix", subset)}
+            AND round = {self.incremental_round}
+            AND new_links = 0
+            AND (probe_protocol, probe_dst_prefix) IN (
+                SELECT probe_protocol, probe_dst_prefix
+                FROM (
+                    -- the lowest count of a round is the number of probes actually sent,
+                    -- and the highest is the number of probes requested
+                    SELECT
+                        probe_protocol,
+                        probe_dst_prefix,
+                        probe_ttl,
+                        minIf(cumulative_probes, round = {self.incremental_round}) AS sent_probes,
+                        maxIf(cumulative_probes, round = {self.incremental_round}) AS requested_probes,
+                        minIf(cumulative_probes, round = {self.incremental_round - 1}) AS previous_probes
+                    FROM {probes_table(measurement_id)}
+                    WHERE {ip_in("probe_dst_prefix", subset)}
+                    AND round IN ({self.incremental_round - 1}, {self.incremental_round})
+                    GROUP BY (probe_protocol, probe_dst_prefix, probe_ttl)
+                )
+                GROUP BY (probe_protocol, probe_dst_prefix)
+                HAVING countIf(sent_probes > previous_probes) > 0
+                AND countIf(sent_probes < requested_probes) = 0
+            )
+            """,
+        )
@@ -0,0 +1,38 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.query import (
+    PrefixesQuery,
+    amplification_prefixes_set,
+    invalid_prefixes_set,
+    prefixes_table,
+)
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class InsertInvalidPrefixesSets(PrefixesQuery):
+    """
+    Insert the invalid prefixes of the prefixes table into the sets created by `CreateInvalidPrefixesSets`.
+    Execute this query after `InsertPrefixes`, once per round:
+    since the sets ignore duplicates, the prefixes already inserted are not duplicated.
+    """
+
+    def statements(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> Sequence[str]:
+        return (
+            f"""
+            INSERT INTO {invalid_prefixes_set(measurement_id)}
+            SELECT probe_dst_prefix
+            FROM {prefixes_table(measurement_id)}
+            WHERE {self.filters(subset)} AND (has_amplification OR has_loops)
+            """,
+            f"""
+            INSERT INTO {amplification_prefixes_set(measurement_id)}
+            SELECT probe_protocol, probe_src_addr, probe_dst_prefix
+            FROM {prefixes_table(measurement_id)}
+            WHERE {self.filters(subset)} AND has_amplification
+            """,
+        )
@@ -1,24 +1,22 @@
-from dataclasses import asdict, dataclass
+from dataclasses import dataclass
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries import GetLinksFromResults
-from diamond_miner.queries.query import ResultsQuery, links_table
+from diamond_miner.queries.query import links_table
 from diamond_miner.typing import IPNetwork
 
 
 @dataclass(frozen=True)
-class InsertLinks(ResultsQuery):
+class InsertLinks(GetLinksFromResults):
     """
     Insert the results of the `GetLinksFromResults` query into the links table.
+    Set `incremental_round` to the round that has just been inserted to update the table incrementally.
     """
 
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
-        links_query = GetLinksFromResults(**asdict(self)).statement(
-            measurement_id, subset
-        )
         return f"""
         INSERT INTO {links_table(measurement_id)}
-        SELECT * FROM ({links_query})
+        SELECT * FROM ({super().statement(measurement_id, subset)})
         """
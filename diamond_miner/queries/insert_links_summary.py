@@ -0,0 +1,46 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.query import LinksQuery, links_summary_table, links_table
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class InsertLinksSummary(LinksQuery):
+    """
+    Insert the links of the links table into the links summary table.
+    Set `incremental_round` to the round that has just been inserted to update the table incrementally.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateLinksSummaryTable, GetLinks, InsertLinksSummary, links_summary_table
+        >>> _ = client.text(f"DROP TABLE IF EXISTS {links_summary_table('test_nsdi_example')}")
+        >>> CreateLinksSummaryTable().execute(client, 'test_nsdi_example')
+        []
+        >>> for round_ in range(1, 4):
+        ...     _ = InsertLinksSummary(incremental_round=round_).execute(client, 'test_nsdi_example')
+        >>> links = GetLinks(summary=True, include_metadata=True, include_first_round=True).execute(client, 'test_nsdi_example')
+        >>> len(links)
+        8
+        >>> sorted(links, key=lambda link: (link["near_ttl"], link["near_addr"], link["far_addr"]))[0]
+        {'near_ttl': 1, 'far_ttl': 2, 'near_addr': '::ffff:150.0.1.1', 'far_addr': '::ffff:150.0.2.1', 'first_round': 1}
+        >>> sorted(link["first_round"] for link in links)
+        [1, 1, 1, 1, 1, 1, 2, 2]
+    """
+
+    incremental_round: int | None = None
+    "If specified, insert only the links with a near or a far reply from this round."
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        round_filter = "1"
+        if self.incremental_round:
+            round_filter = f"(near_round = {self.incremental_round} OR far_round = {self.incremental_round})"
+        return f"""
+        INSERT INTO {links_summary_table(measurement_id)}
+        SELECT near_addr, far_addr, min(near_ttl), min(far_ttl), min(greatest(near_round, far_round))
+        FROM {links_table(measurement_id)}
+        WHERE {self.filters(subset)} AND {round_filter}
+        GROUP BY (near_addr, far_addr)
+        """
@@ -0,0 +1,36 @@
+from dataclasses import dataclass
+
+from diamond_miner.defaults import UNIVERSE_SUBSET
+from diamond_miner.queries.query import ResultsQuery, nodes_summary_table, results_table
+from diamond_miner.typing import IPNetwork
+
+
+@dataclass(frozen=True)
+class InsertNodesSummary(ResultsQuery):
+    """
+    Insert the nodes discovered in the results table into the nodes summary table.
+    Set `round_eq` to the round that has just been inserted to update the table incrementally.
+
+    Examples:
+        >>> from diamond_miner.test import client
+        >>> from diamond_miner.queries import CreateNodesSummaryTable, GetNodes, InsertNodesSummary, nodes_summary_table
+        >>> _ = client.text(f"DROP TABLE IF EXISTS {nodes_summary_table('test_nsdi_example')}")
+        >>> CreateNodesSummaryTable().execute(client, 'test_nsdi_example')
+        []
+        >>> for round_ in range(1, 4):
+        ...     _ = InsertNodesSummary(round_eq=round_).execute(client, 'test_nsdi_example')
+        >>> nodes = GetNodes(summary=True, include_probe_ttl=True, include_first_round=True).execute(client, 'test_nsdi_example')
+        >>> sorted((node["probe_ttl"], node["reply_src_addr"], node["first_round"]) for node in nodes)
+        [(1, '::ffff:150.0.1.1', 1), (2, '::ffff:150.0.2.1', 1), (2, '::ffff:150.0.3.1', 1), (3, '::ffff:150.0.4.1', 1), (3, '::ffff:150.0.5.1', 1), (3, '::ffff:150.0.7.1', 2), (4, '::ffff:150.0.6.1', 1)]
+    """
+
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        return f"""
+        INSERT INTO {nodes_summary_table(measurement_id)}
+        SELECT reply_src_addr, min(probe_ttl), min(round)
+        FROM {results_table(measurement_id)}
+        WHERE {self.filters(subset)}
+        GROUP BY reply_src_addr
+        """
@@ -1,15 +1,18 @@
+from __future__ import annotations
+
 from collections.abc import Iterable, Iterator, Sequence
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
-from functools import reduce
-from typing import Any
-
-from pych_client import ClickHouseClient
+from functools import cached_property, lru_cache, reduce
+from ipaddress import IPv4Network, IPv6Address
+from typing import TYPE_CHECKING, Any
 
+from diamond_miner.autotune import autotune
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.logger import logger
+from diamond_miner.metrics import metrics
 from diamond_miner.queries.fragments import (
+    SUBSET_PARAMETER,
     and_,
     eq,
     geq,
@@ -19,9 +22,58 @@ from diamond_miner.queries.fragments import (
     lt,
     not_,
     or_,
+    tuple_gt,
 )
 from diamond_miner.typing import IPNetwork
-from diamond_miner.utilities import LoggingTimer, available_cpus
+from diamond_miner.utilities import LoggingTimer
+
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
+
+    from diamond_miner.columnar import Columns
+
+
+def subset_parameters(subset: IPNetwork) -> dict[str, str]:
+    """
+    Values of the subset query parameters.
+
+    >>> from ipaddress import ip_network
+    >>> subset_parameters(ip_network("8.8.8.0/24"))
+    {'subset_min': '::ffff:8.8.8.0', 'subset_max': '::ffff:8.8.8.255'}
+    >>> subset_parameters(ip_network("2001:db8::/64"))
+    {'subset_min': '2001:db8::', 'subset_max': '2001:db8::ffff:ffff:ffff:ffff'}
+    """
+    if isinstance(subset, IPv4Network):
+        first = IPv6Address(f"::ffff:{subset[0]}")
+        last = IPv6Address(f"::ffff:{subset[-1]}")
+    else:
+        first, last = subset[0], subset[-1]
+    return {"subset_min": str(first), "subset_max": str(last)}
+
+
+def amplification_prefixes_set(measurement_id: str) -> str:
+    """Returns the name of the set of prefixes with amplification, see `CreateInvalidPrefixesSets`."""
+    return f"amplification_prefixes__{measurement_id}".replace("-", "_")
+
+
+def convergence_table(measurement_id: str) -> str:
+    """Returns the name of the convergence table, see `CreateConvergenceTable`."""
+    return f"convergence__{measurement_id}".replace("-", "_")
+
+
+def converged_prefixes_set(measurement_id: str) -> str:
+    """Returns the name of the set of converged prefixes, see `CreateConvergenceTable`."""
+    return f"converged_prefixes__{measurement_id}".replace("-", "_")
+
+
+def flows_table(measurement_id: str) -> str:
+    """Returns the name of the flows table, see `CreateFlowsTable`."""
+    return f"flows__{measurement_id}".replace("-", "_")
+
+
+def flows_view(measurement_id: str) -> str:
+    """Returns the name of the materialized view that fills the flows table."""
+    return f"flows_mv__{measurement_id}".replace("-", "_")
 
 
 def links_table(measurement_id: str) -> str:
@@ -29,11 +81,36 @@ def links_table(measurement_id: str) -> str:
     return f"links__{measurement_id}".replace("-", "_")
 
 
+def invalid_prefixes_set(measurement_id: str) -> str:
+    """Returns the name of the set of invalid prefixes, see `CreateInvalidPrefixesSets`."""
+    return f"invalid_prefixes__{measurement_id}".replace("-", "_")
+
+
+def links_summary_table(measurement_id: str) -> str:
+    """Returns the name of the links summary table, see `CreateLinksSummaryTable`."""
+    return f"links_summary__{measurement_id}".replace("-", "_")
+
+
+def nodes_summary_table(measurement_id: str) -> str:
+    """Returns the name of the nodes summary table, see `CreateNodesSummaryTable`."""
+    return f"nodes_summary__{measurement_id}".replace("-", "_")
+
+
 def prefixes_table(measurement_id: str) -> str:
     """Returns the name of the prefixes table."""
     return f"prefixes__{measurement_id}".replace("-", "_")
 
 
+def private_prefixes_dictionary(measurement_id: str) -> str:
+    """Returns the name of the private prefixes dictionary, see `CreatePrivatePrefixesDictionary`."""
+    return f"private_prefixes_dict__{measurement_id}".replace("-", "_")
+
+
+def private_prefixes_table(measurement_id: str) -> str:
+    """Returns the name of the table containing the source of the private prefixes dictionary."""
+    return f"private_prefixes__{measurement_id}".replace("-", "_")
+
+
 def probes_table(measurement_id: str) -> str:
     """Returns the name of the probes table."""
     return f"probes__{measurement_id}".replace("-", "_")
@@ -67,6 +144,13 @@ class Query:
     def name(self) -> str:
         return self.__class__.__name__
 
+    def supports_pagination(self) -> bool:
+        """
+        Whether the query can be executed with `execute_pages`: it must have a `keyset_after` field
+        and a single `SELECT` statement, without aggregation, that ends with its `WHERE` clause.
+        """
+        return False
+
     def statement(
         self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
     ) -> str:
@@ -80,6 +164,14 @@ class Query:
         # Override this method if you want your query to return multiple statements.
         return (self.statement(measurement_id, subset),)
 
+    def compile(self, measurement_id: str) -> CompiledQuery:
+        """
+        Render the statements once, with the subset bounds as query parameters.
+        The compiled query is cached, so that it can be reused for each subset:
+        the fields of the query must be hashable (e.g. tuples instead of lists).
+        """
+        return compile_query(self, measurement_id)
+
     def execute(
         self,
         client: ClickHouseClient,
@@ -98,18 +190,26 @@ class Query:
             limit: (limit, offset) tuple.
             subsets: Iterable of IP networks on which to execute the query independently.
         """
+        compiled = self.compile(measurement_id)
         rows = []
         for subset in subsets:
-            for i, statement in enumerate(self.statements(measurement_id, subset)):
+            for i, (statement, params) in enumerate(compiled.statements(subset)):
                 with LoggingTimer(
                     logger,
                     f"query={self.name}#{i} measurement_id={measurement_id} subset={subset} limit={limit}",
+                    metrics.histogram("query_duration_seconds", query=self.name),
                 ):
                     settings = dict(
                         limit=limit[0] if limit else 0,
                         offset=limit[1] if limit else 0,
                     )
-                    rows += client.json(statement, data=data, settings=settings)
+                    result = client.json(
+                        statement, params=params, data=data, settings=settings
+                    )
+                    metrics.counter("query_rows_total", query=self.name).inc(
+                        len(result)
+                    )
+                    rows += result
         return rows
 
     def execute_iter(
@@ -124,17 +224,170 @@ class Query:
         """
         Execute the query and return each row as a dict, as they are received from the database.
         """
+        compiled = self.compile(measurement_id)
         for subset in subsets:
-            for i, statement in enumerate(self.statements(measurement_id, subset)):
+            for i, (statement, params) in enumerate(compiled.statements(subset)):
                 with LoggingTimer(
                     logger,
                     f"query={self.name}#{i} measurement_id={measurement_id} subset={subset} limit={limit}",
+                    metrics.histogram("query_duration_seconds", query=self.name),
                 ):
                     settings = dict(
                         limit=limit[0] if limit else 0,
                         offset=limit[1] if limit else 0,
                     )
-                    yield from client.iter_json(statement, data=data, settings=settings)
+                    n_rows = 0
+                    try:
+                        for row in client.iter_json(
+                            statement, params=params, data=data, settings=settings
+                        ):
+                            n_rows += 1
+                            yield row
+                    finally:
+                        metrics.counter("query_rows_total", query=self.name).inc(n_rows)
+
+    def execute_pages(
+        self,
+        client: ClickHouseClient,
+        measurement_id: str,
+        *,
+        key: str | Sequence[str],
+        page_size: int,
+        after: Sequence[Any] | None = None,
+        subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
+    ) -> Iterator[list[dict]]:
+        """
+        Execute the query and return the rows page by page, ordered by `key`.
+        Instead of an offset, each page starts after the key of the last row of the
+        previous page, so that the cost of a page does not depend on its position.
+        The rows sharing the key of the last row are returned in the same page,
+        which can thus contain more than `page_size` rows.
+
+        The key columns must be returned by the query. For example, `GetResults` does not
+        return the materialized `probe_dst_prefix` column, but it can be omitted from
+        `CreateResultsTable.SORTING_KEY` since it is derived from `probe_dst_addr`.
+
+        The condition on the key is added to the `WHERE` clause of the query (see `keyset_after`),
+        and the `ORDER BY` and `LIMIT` clauses are appended to its statement, so that ClickHouse
+        can use the sorting key of the table. This is supported by the queries that opt in with
+        `supports_pagination`: `GetInvalidPrefixes`, `GetLinks`, `GetNodes` and `GetResults`,
+        without `summary=True`.
+
+        Args:
+            client: ClickHouse client.
+            measurement_id: Measurement id.
+            key: Columns by which to order the rows, typically the sorting key of the table.
+            page_size: Number of rows per page.
+            after: If specified, resume after this key, e.g. the key of the last row returned.
+            subsets: Iterable of IP networks on which to execute the query independently.
+
+        Examples:
+            >>> from diamond_miner.test import client
+            >>> from diamond_miner.queries import CreateResultsTable, GetResults
+            >>> key = CreateResultsTable.SORTING_KEY.replace("probe_dst_prefix, ", "")
+            >>> pages = GetResults().execute_pages(client, "test_nsdi_example", key=key, page_size=50)
+            >>> [len(page) for page in pages]
+            [50, 35]
+        """
+        assert (
+            self.supports_pagination()
+        ), f"execute_pages is not supported by {self.name}, see `supports_pagination`"
+        if isinstance(key, str):
+            key = [column.strip() for column in key.split(",")]
+        order_by = f"ORDER BY {','.join(key)} LIMIT {page_size} WITH TIES"
+        for subset in subsets:
+            last = after
+            while True:
+                # The keyset changes at each page, so the compiled query is not cached.
+                query = replace(
+                    self,
+                    keyset_after=(tuple(key), tuple(last)) if last else None,  # type: ignore
+                )
+                [(statement, params)] = CompiledQuery(query, measurement_id).statements(
+                    subset
+                )
+                with LoggingTimer(
+                    logger,
+                    f"query={self.name} measurement_id={measurement_id} subset={subset} after={last}",
+                    metrics.histogram("query_duration_seconds", query=self.name),
+                ):
+                    rows = client.json(f"{statement} {order_by}", params=params)
+                metrics.counter("query_rows_total", query=self.name).inc(len(rows))
+                if not rows:
+                    break
+                yield rows
+                if len(rows) < page_size:
+                    break
+                last = [rows[-1][column] for column in key]
+
+    def execute_columns(
+        self,
+        client: ClickHouseClient,
+        measurement_id: str,
+        *,
+        columns: Sequence[str] | None = None,
+        subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
+    ) -> Columns:
+        """
+        Execute the query and return one NumPy array per column.
+        This requires NumPy, see `diamond_miner.columnar` for the supported types.
+
+        Args:
+            client: ClickHouse client.
+            measurement_id: Measurement id.
+            columns: If specified, return only these columns
+                (e.g. to exclude the variable-width columns).
+            subsets: Iterable of IP networks on which to execute the query independently.
+
+        Examples:
+            >>> from diamond_miner.test import client
+            >>> from diamond_miner.queries import GetLinks
+            >>> links = GetLinks(include_metadata=True).execute_columns(client, "test_nsdi_example")
+            >>> links["near_addr"].shape, links["near_addr"].dtype, links["near_ttl"].dtype
+            ((8, 2), dtype('uint64'), dtype('uint8'))
+        """
+        from diamond_miner.columnar import concatenate
+
+        return concatenate(
+            list(
+                self.execute_iter_columns(
+                    client, measurement_id, columns=columns, subsets=subsets
+                )
+            )
+        )
+
+    def execute_iter_columns(
+        self,
+        client: ClickHouseClient,
+        measurement_id: str,
+        *,
+        columns: Sequence[str] | None = None,
+        subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
+    ) -> Iterator[Columns]:
+        """
+        Execute the query and return one batch of NumPy arrays per subset (and per statement).
+        """
+        from diamond_miner.columnar import ROW_BINARY_FORMAT, decode_row_binary
+
+        compiled = self.compile(measurement_id)
+        for subset in subsets:
+            for i, (statement, params) in enumerate(compiled.statements(subset)):
+                if columns:
+                    statement = f"SELECT {','.join(columns)} FROM ({statement})"
+                with LoggingTimer(
+                    logger,
+                    f"query={self.name}#{i} measurement_id={measurement_id} subset={subset} format=columns",
+                    metrics.histogram("query_duration_seconds", query=self.name),
+                ):
+                    data = client.bytes(
+                        statement,
+                        params=params,
+                        settings=dict(default_format=ROW_BINARY_FORMAT),
+                    )
+                    batch = decode_row_binary(data)
+                n_rows = len(next(iter(batch.values()))) if batch else 0
+                metrics.counter("query_rows_total", query=self.name).inc(n_rows)
+                yield batch
 
     def execute_concurrent(
         self,
@@ -143,11 +396,16 @@ class Query:
         *,
         subsets: Iterable[IPNetwork] = (UNIVERSE_SUBSET,),
         limit: tuple[int, int] | None = None,
-        concurrent_requests: int = max(available_cpus() // 8, 1),
+        concurrent_requests: int | None = None,
     ) -> None:
         """
         Execute the query concurrently on the specified subsets.
+        If `concurrent_requests` is not specified, it is chosen by `diamond_miner.autotune`.
         """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        if concurrent_requests is None:
+            concurrent_requests = autotune().concurrent_requests
         logger.info("query=%s concurrent_requests=%s", self.name, concurrent_requests)
         with ThreadPoolExecutor(concurrent_requests) as executor:
             futures = [
@@ -164,6 +422,52 @@ class Query:
                 future.result()
 
 
+@dataclass(frozen=True)
+class CompiledQuery:
+    """
+    The statements of a query rendered once for the whole universe
+    and once with the subset bounds as query parameters.
+
+    Examples:
+        >>> from ipaddress import ip_network
+        >>> from diamond_miner.queries import GetProbes
+        >>> compiled = GetProbes(round_eq=1).compile("test")
+        >>> [(statement, params)] = compiled.statements(ip_network("8.8.8.0/24"))
+        >>> "{subset_min:IPv6}" in statement
+        True
+        >>> params
+        {'subset_min': '::ffff:8.8.8.0', 'subset_max': '::ffff:8.8.8.255'}
+        >>> compiled.statements(UNIVERSE_SUBSET)[0][1]
+        {}
+    """
+
+    query: Query
+    measurement_id: str
+
+    @cached_property
+    def universe_statements(self) -> Sequence[str]:
+        return self.query.statements(self.measurement_id, UNIVERSE_SUBSET)
+
+    @cached_property
+    def subset_statements(self) -> Sequence[str]:
+        return self.query.statements(self.measurement_id, SUBSET_PARAMETER)
+
+    def statements(self, subset: IPNetwork) -> list[tuple[str, dict[str, str]]]:
+        """Statements and query parameters for the specified subset."""
+        if subset == UNIVERSE_SUBSET:
+            return [(statement, {}) for statement in self.universe_statements]
+        params = subset_parameters(subset)
+        return [
+            (statement, params if "{subset_" in statement else {})
+            for statement in self.subset_statements
+        ]
+
+
+@lru_cache(maxsize=1024)
+def compile_query(query: Query, measurement_id: str) -> CompiledQuery:
+    return CompiledQuery(query, measurement_id)
+
+
 @dataclass(frozen=True)
 class LinksQuery(Query):
     """Base class for queries on the links table."""
@@ -195,6 +499,12 @@ class LinksQuery(Query):
     round_leq: int | None = None
     "If specified, keep only the links from this round or before."
 
+    keyset_after: tuple[tuple[str, ...], tuple[Any, ...]] | None = None
+    """
+    If specified, `(key, values)`: keep only the rows whose `key` columns are greater
+    than `values`, in lexicographic order. This is set by `execute_pages`.
+    """
+
     def filters(self, subset: IPNetwork) -> str:
         """`WHERE` clause common to all queries on the links table."""
         s = []
@@ -221,6 +531,8 @@ class LinksQuery(Query):
             s += [not_("is_partial")]
         if self.filter_virtual:
             s += [not_("is_virtual")]
+        if self.keyset_after:
+            s += [tuple_gt(*self.keyset_after)]
         return reduce(and_, s or ["1"])
 
 
@@ -237,6 +549,12 @@ class PrefixesQuery(Query):
     This filter is relatively costly (IPv6 comparison on each row).
     """
 
+    keyset_after: tuple[tuple[str, ...], tuple[Any, ...]] | None = None
+    """
+    If specified, `(key, values)`: keep only the rows whose `key` columns are greater
+    than `values`, in lexicographic order. This is set by `execute_pages`.
+    """
+
     def filters(self, subset: IPNetwork) -> str:
         """`WHERE` clause common to all queries on the prefixes table."""
         s = []
@@ -246,6 +564,8 @@ class PrefixesQuery(Query):
             s += [eq("probe_protocol", self.probe_protocol)]
         if self.probe_src_addr:
             s += [ip_eq("probe_src_addr", self.probe_src_addr)]
+        if self.keyset_after:
+            s += [tuple_gt(*self.keyset_after)]
         return reduce(and_, s or ["1"])
 
 
@@ -330,6 +650,12 @@ class ResultsQuery(Query):
     round_leq: int | None = None
     "If specified, keep only the replies from this round or before."
 
+    keyset_after: tuple[tuple[str, ...], tuple[Any, ...]] | None = None
+    """
+    If specified, `(key, values)`: keep only the rows whose `key` columns are greater
+    than `values`, in lexicographic order. This is set by `execute_pages`.
+    """
+
     def filters(self, subset: IPNetwork) -> str:
         """`WHERE` clause common to all queries on the results table."""
         s = []
@@ -353,4 +679,39 @@ class ResultsQuery(Query):
             s += ["time_exceeded_reply"]
         if self.filter_invalid_probe_protocol:
             s += ["valid_probe_protocol"]
+        if self.keyset_after:
+            s += [tuple_gt(*self.keyset_after)]
         return reduce(and_, s or ["1"])
+
+    def flows_filters(self, subset: IPNetwork) -> str:
+        """
+        `WHERE` clause common to all queries on the flows table.
+        The results are aggregated over all the rounds with the default filters
+        of this class when they are inserted in the flows table,
+        so only the filters on the sorting key are supported.
+        """
+        assert (
+            self.round_eq is None and self.round_leq is None
+        ), "round filters are not supported on the flows table"
+        for name in FLOWS_RESULTS_FILTERS:
+            assert getattr(self, name) == getattr(
+                ResultsQuery, name
+            ), f"{name} cannot be changed on the flows table"
+        s = []
+        if subset != UNIVERSE_SUBSET:
+            s += [ip_in("probe_dst_prefix", subset)]
+        if self.probe_protocol:
+            s += [eq("probe_protocol", self.probe_protocol)]
+        if self.probe_src_addr:
+            s += [ip_eq("probe_src_addr", self.probe_src_addr)]
+        return reduce(and_, s or ["1"])
+
+
+FLOWS_RESULTS_FILTERS = (
+    "filter_destination_host",
+    "filter_destination_prefix",
+    "filter_private",
+    "filter_invalid_probe_protocol",
+    "time_exceeded_only",
+)
+"""Filters of `ResultsQuery` applied with their default value when filling the flows table."""
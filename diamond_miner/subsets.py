@@ -1,7 +1,9 @@
-from ipaddress import IPv6Network
+from __future__ import annotations
 
-from pych_client import ClickHouseClient
+from ipaddress import IPv6Network
+from typing import TYPE_CHECKING
 
+from diamond_miner.metrics import metrics
 from diamond_miner.queries import (
     CountLinksPerPrefix,
     CountProbesPerPrefix,
@@ -12,6 +14,9 @@ from diamond_miner.queries import (
 )
 from diamond_miner.utilities import common_parameters
 
+if TYPE_CHECKING:  # pragma: no cover
+    from pych_client import ClickHouseClient
+
 ALL_ONES_V6 = (2**128) - 1
 Counts = dict[IPv6Network, int]
 
@@ -42,13 +47,16 @@ def subsets_for(
         count_query = CountResultsPerPrefix(**common_parameters(query, ResultsQuery))  # type: ignore
     else:
         raise NotImplementedError
-    counts = {
-        addr_to_network(
-            row["prefix"], count_query.prefix_len_v4, count_query.prefix_len_v6
-        ): row["count"]
-        for row in count_query.execute_iter(client, measurement_id)
-    }
-    return split(counts, max_items_per_subset)
+    with metrics.histogram("subsets_duration_seconds", query=query.name).time():
+        counts = {
+            addr_to_network(
+                row["prefix"], count_query.prefix_len_v4, count_query.prefix_len_v6
+            ): row["count"]
+            for row in count_query.execute_iter(client, measurement_id)
+        }
+        subsets = split(counts, max_items_per_subset)
+    metrics.gauge("subsets", query=query.name).set(len(subsets))
+    return subsets
 
 
 def split(counts: Counts, max_items_per_subset: int) -> list[IPv6Network]:
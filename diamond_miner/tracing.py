@@ -0,0 +1,126 @@
+"""
+Span-based tracing, exported in the [Trace Event Format](https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU)
+understood by `chrome://tracing` and [Perfetto](https://ui.perfetto.dev).
+
+Spans are timed with `time.perf_counter_ns`, which is backed by a system-wide
+monotonic clock on Linux, so that spans recorded in different processes
+can be stitched into a single trace.
+"""
+import json
+import os
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+
+@dataclass(frozen=True)
+class Span:
+    name: str
+    start_ns: int
+    end_ns: int
+    pid: int
+    tid: int
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+    def to_chrome_event(self) -> dict[str, Any]:
+        """Convert the span to a complete (`X`) event, with timestamps in microseconds."""
+        return {
+            "name": self.name,
+            "ph": "X",
+            "ts": self.start_ns / 10**3,
+            "dur": self.duration_ns / 10**3,
+            "pid": self.pid,
+            "tid": self.tid,
+            "args": self.args,
+        }
+
+
+class Tracer:
+    """
+    Record (possibly nested) spans.
+    Spans are picklable and can be sent back from worker processes
+    and merged in the parent tracer with `extend`.
+
+    Examples:
+        >>> tracer = Tracer()
+        >>> with tracer.span("merge", n_files=2):
+        ...     with tracer.span("copy"):
+        ...         pass
+        >>> [span.name for span in tracer.spans]
+        ['copy', 'merge']
+        >>> tracer.spans[1].args
+        {'n_files': 2}
+        >>> [event["ph"] for event in tracer.to_chrome_trace()["traceEvents"]]
+        ['X', 'X']
+    """
+
+    def __init__(self, process_name: str | None = None) -> None:
+        self.lock = threading.Lock()
+        self.spans: list[Span] = []
+        self.process_names: dict[int, str] = {}
+        if process_name:
+            self.process_names[os.getpid()] = process_name
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """
+        Record the execution time of a code block.
+        The yielded dictionary can be used to add arguments to the span
+        once the block has started, e.g. the number of probes processed.
+        """
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            self.add(
+                Span(
+                    name=name,
+                    start_ns=start,
+                    end_ns=time.perf_counter_ns(),
+                    pid=os.getpid(),
+                    tid=threading.get_native_id(),
+                    args=args,
+                )
+            )
+
+    def add(self, span: Span) -> None:
+        with self.lock:
+            self.spans.append(span)
+
+    def extend(self, spans: Iterable[Span], process_name: str | None = None) -> None:
+        """Add spans recorded by another tracer, typically in a worker process."""
+        spans = list(spans)
+        with self.lock:
+            self.spans.extend(spans)
+            if process_name:
+                for pid in {span.pid for span in spans}:
+                    self.process_names.setdefault(pid, process_name)
+
+    def to_chrome_trace(self) -> dict[str, Any]:
+        with self.lock:
+            metadata = [
+                {
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": name},
+                }
+                for pid, name in sorted(self.process_names.items())
+            ]
+            events = [
+                span.to_chrome_event()
+                for span in sorted(self.spans, key=lambda span: span.start_ns)
+            ]
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, filepath: Path) -> None:
+        """Write the spans to a JSON file that can be opened in Chrome tracing or Perfetto."""
+        filepath.write_text(json.dumps(self.to_chrome_trace()))
@@ -1,18 +1,198 @@
+import math
 import os
 import time
 from dataclasses import fields
 from logging import Logger
+from pathlib import Path
 from types import TracebackType
 from typing import Any, Type
 
+from diamond_miner.metrics import Histogram
 
-def available_cpus() -> int:
-    try:
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+PROC_SELF_CGROUP = Path("/proc/self/cgroup")
+
+
+def available_cpus(
+    cgroup_root: Path = CGROUP_ROOT, proc_cgroup: Path = PROC_SELF_CGROUP
+) -> int:
+    """
+    Number of CPUs available to the current process,
+    taking into account the CPU affinity and the cgroup CPU quota.
+    """
+    if hasattr(os, "sched_getaffinity"):
         # Number of CPUs available to the current process, if available.
-        return len(os.sched_getaffinity(0))  # type: ignore
-    except AttributeError:
+        cpus = len(os.sched_getaffinity(0))
+    else:
         # Fallback on the total number of CPUs in the system.
-        return os.cpu_count() or 1
+        cpus = os.cpu_count() or 1
+    if (quota := cgroup_cpu_limit(cgroup_root, proc_cgroup)) is not None:
+        cpus = min(cpus, max(math.ceil(quota), 1))
+    return cpus
+
+
+def available_memory(
+    cgroup_root: Path = CGROUP_ROOT, proc_cgroup: Path = PROC_SELF_CGROUP
+) -> int | None:
+    """
+    Memory available to the current process (in bytes),
+    taking into account the cgroup memory limit.
+    """
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, OSError, ValueError):
+        memory = None
+    if (limit := cgroup_memory_limit(cgroup_root, proc_cgroup)) is not None:
+        memory = min(memory, limit) if memory else limit
+    return memory
+
+
+def cgroup_paths(proc_cgroup: Path = PROC_SELF_CGROUP) -> dict[str, str]:
+    """
+    Paths of the cgroups of the current process, relative to the root of their hierarchy,
+    for each controller (`""` for the cgroup v2 unified hierarchy).
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as root:
+    ...     _ = (Path(root) / "cgroup").write_text("4:memory:/docker/abc\\n2:cpu,cpuacct:/\\n0::/user.slice\\n")
+    ...     cgroup_paths(Path(root) / "cgroup")
+    {'memory': '/docker/abc', 'cpu': '/', 'cpuacct': '/', '': '/user.slice'}
+    """
+    try:
+        lines = proc_cgroup.read_text().splitlines()
+    except OSError:
+        return {}
+    paths = {}
+    for line in lines:
+        _, controllers, path = line.split(":", 2)
+        for controller in controllers.split(","):
+            paths[controller] = path
+    return paths
+
+
+def cgroup_directories(hierarchy: Path, path: str) -> list[Path]:
+    """
+    Directory of the cgroup `path` in `hierarchy`, followed by the directories of its ancestors,
+    whose limits also apply to the cgroup.
+
+    >>> [str(directory) for directory in cgroup_directories(Path("/sys/fs/cgroup"), "/user.slice/app")]
+    ['/sys/fs/cgroup/user.slice/app', '/sys/fs/cgroup/user.slice', '/sys/fs/cgroup']
+    """
+    directories = [hierarchy]
+    for part in path.strip("/").split("/"):
+        if part:
+            directories.append(directories[-1] / part)
+    return directories[::-1]
+
+
+def cgroup_cpu_limit(
+    cgroup_root: Path = CGROUP_ROOT, proc_cgroup: Path = PROC_SELF_CGROUP
+) -> float | None:
+    """
+    CPU quota of the cgroup of the current process (as found in `proc_cgroup`)
+    and of its ancestors, in number of CPUs, or `None` if unlimited.
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as root:
+    ...     _ = (Path(root) / "cpu.max").write_text("150000 100000\\n")
+    ...     cgroup_cpu_limit(Path(root), Path(root) / "cgroup")
+    1.5
+    """
+    paths = cgroup_paths(proc_cgroup)
+    limits = [
+        # cgroup v2
+        *map(
+            cgroup_v2_cpu_limit,
+            cgroup_directories(cgroup_root, paths.get("", "/")),
+        ),
+        # cgroup v1
+        *map(
+            cgroup_v1_cpu_limit,
+            cgroup_directories(cgroup_root / "cpu", paths.get("cpu", "/")),
+        ),
+    ]
+    return min((limit for limit in limits if limit is not None), default=None)
+
+
+def cgroup_v2_cpu_limit(directory: Path) -> float | None:
+    try:
+        quota, period = read_cgroup_file(directory / "cpu.max").split()
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_v1_cpu_limit(directory: Path) -> float | None:
+    try:
+        quota = read_cgroup_file(directory / "cpu.cfs_quota_us")
+        period = read_cgroup_file(directory / "cpu.cfs_period_us")
+        if int(quota) <= 0:
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        return None
+
+
+def cgroup_memory_limit(
+    cgroup_root: Path = CGROUP_ROOT, proc_cgroup: Path = PROC_SELF_CGROUP
+) -> int | None:
+    """
+    Memory limit of the cgroup of the current process (as found in `proc_cgroup`)
+    and of its ancestors, in bytes, or `None` if unlimited.
+
+    >>> from tempfile import TemporaryDirectory
+    >>> with TemporaryDirectory() as root:
+    ...     _ = (Path(root) / "memory.max").write_text("max\\n")
+    ...     cgroup_memory_limit(Path(root), Path(root) / "cgroup")
+    """
+    paths = cgroup_paths(proc_cgroup)
+    limits = [
+        # cgroup v2
+        *(
+            cgroup_memory_file_limit(directory / "memory.max")
+            for directory in cgroup_directories(cgroup_root, paths.get("", "/"))
+        ),
+        # cgroup v1
+        *(
+            cgroup_memory_file_limit(directory / "memory.limit_in_bytes")
+            for directory in cgroup_directories(
+                cgroup_root / "memory", paths.get("memory", "/")
+            )
+        ),
+    ]
+    return min((limit for limit in limits if limit is not None), default=None)
+
+
+def cgroup_memory_file_limit(path: Path) -> int | None:
+    try:
+        value = read_cgroup_file(path)
+    except OSError:
+        return None
+    if value == "max":
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        return None
+    # cgroup v1 reports "unlimited" as a very large number (PAGE_COUNTER_MAX).
+    return limit if limit < 2**60 else None
+
+
+def open_files_limit() -> int | None:
+    """Soft limit on the number of open file descriptors, or `None` if unknown or unlimited."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def read_cgroup_file(path: Path) -> str:
+    return path.read_text().strip()
 
 
 def common_parameters(from_dataclass: Any, to_dataclass: Any) -> dict[str, Any]:
@@ -31,11 +211,11 @@ class Timer:
     total_time = 0
 
     def start(self) -> None:
-        self.start_time = time.time_ns()
+        self.start_time = time.perf_counter_ns()
 
     def stop(self) -> None:
         if self.start_time:
-            self.total_time += time.time_ns() - self.start_time
+            self.total_time += time.perf_counter_ns() - self.start_time
             self.start_time = None
 
     def clear(self) -> None:
@@ -48,11 +228,17 @@ class Timer:
 
 
 class LoggingTimer:
-    """A very simple timer for logging the execution time of code blocks."""
+    """
+    A very simple timer for logging the execution time of code blocks.
+    If `histogram` is specified, the execution time is also recorded in it.
+    """
 
-    def __init__(self, logger: Logger, prefix: str = ""):
+    def __init__(
+        self, logger: Logger, prefix: str = "", histogram: Histogram | None = None
+    ):
         self.logger = logger
         self.prefix = prefix
+        self.histogram = histogram
         self.timer = Timer()
 
     def __enter__(self) -> None:
@@ -68,3 +254,5 @@ class LoggingTimer:
     ) -> None:
         self.timer.stop()
         self.logger.info("%s time_ms=%s", self.prefix, self.timer.total_ms)
+        if self.histogram is not None:
+            self.histogram.observe(self.timer.total_ms / 10**3)
@@ -49,7 +49,9 @@ if __name__ == "__main__":
                     client, measurement_id, data=results_filepath.read_bytes()
                 )
                 InsertPrefixes().execute(client, measurement_id)
-                InsertLinks().execute(client, measurement_id)
+                InsertLinks(incremental_round=round_ - 1).execute(
+                    client, measurement_id
+                )
                 # Compute subsequent probes
                 insert_mda_probe_counts(
                     client=client,
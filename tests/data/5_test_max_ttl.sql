@@ -1,15 +1,27 @@
--- 100.0.0.1 - 200.0.0.1 => max(ttl) = 3
+-- 100.0.0.1 - 200.0.0.1 => max(ttl) = 3, the destination replies at TTL 4 and 5
 -- 100.0.0.1 - 201.0.0.1 => max(ttl) = 2
 INSERT INTO probes__test_max_ttl
 VALUES (1, '::ffff:200.0.0.0', 1, 1, 1),
        (1, '::ffff:200.0.0.0', 2, 1, 1),
        (1, '::ffff:200.0.0.0', 3, 1, 1),
+       (1, '::ffff:200.0.0.0', 4, 1, 1),
+       (1, '::ffff:200.0.0.0', 5, 1, 1),
        (1, '::ffff:201.0.0.0', 1, 1, 1),
-       (1, '::ffff:201.0.0.0', 2, 1, 1);
+       (1, '::ffff:201.0.0.0', 2, 1, 1),
+       (1, '::ffff:200.0.0.0', 1, 2, 2),
+       (1, '::ffff:200.0.0.0', 2, 2, 2),
+       (1, '::ffff:200.0.0.0', 3, 2, 2),
+       (1, '::ffff:200.0.0.0', 4, 2, 2),
+       (1, '::ffff:200.0.0.0', 5, 2, 2),
+       (1, '::ffff:201.0.0.0', 1, 2, 2),
+       (1, '::ffff:201.0.0.0', 2, 2, 2),
+       (1, '::ffff:201.0.0.0', 3, 2, 2);
 
 INSERT INTO results__test_max_ttl
 VALUES (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.0', 24000, 33434, 1, 1, '::ffff:150.0.0.1', 1, 11, 0, 250, 0, [], 0.0, 1),
        (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.0', 24000, 33434, 2, 2, '::ffff:150.0.1.1', 1, 11, 0, 250, 0, [], 0.0, 1),
        (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.0', 24000, 33434, 3, 3, '::ffff:150.0.2.1', 1, 11, 0, 250, 0, [], 0.0, 1),
+       (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.0', 24000, 33434, 4, 0, '::ffff:200.0.0.0', 1, 0, 0, 250, 0, [], 0.0, 1),
+       (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.0', 24000, 33434, 5, 0, '::ffff:200.0.0.0', 1, 0, 0, 250, 0, [], 0.0, 1),
        (0, 1, '::ffff:100.0.0.1', '::ffff:201.0.0.0', 24000, 33434, 1, 1, '::ffff:150.0.3.1', 1, 11, 0, 250, 0, [], 0.0, 1),
        (0, 1, '::ffff:100.0.0.1', '::ffff:201.0.0.0', 24000, 33434, 2, 2, '::ffff:150.0.4.1', 1, 11, 0, 250, 0, [], 0.0, 1);
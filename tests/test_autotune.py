@@ -0,0 +1,10 @@
+from diamond_miner.autotune import CALIBRATE_ENV, autotune, tune_process
+
+
+def test_autotune_calibrate_env(monkeypatch):
+    monkeypatch.setenv(CALIBRATE_ENV, "1")
+    assert autotune() is tune_process(True)
+    monkeypatch.setenv(CALIBRATE_ENV, "0")
+    assert autotune() is tune_process(False)
+    monkeypatch.delenv(CALIBRATE_ENV)
+    assert autotune() is tune_process(False)
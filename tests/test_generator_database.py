@@ -2,15 +2,21 @@ from ipaddress import ip_address
 
 from diamond_miner.defaults import DEFAULT_PREFIX_SIZE_V4, DEFAULT_PREFIX_SIZE_V6
 from diamond_miner.generators import probe_generator_from_database
-from diamond_miner.insert import insert_mda_probe_counts
+from diamond_miner.insert import (
+    insert_allocation,
+    insert_mda_probe_counts,
+    insert_probe_counts,
+)
 from diamond_miner.mappers import (
     IntervalFlowMapper,
     RandomFlowMapper,
     ReverseByteFlowMapper,
     SequentialFlowMapper,
 )
+from diamond_miner.planning import plan_round
+from diamond_miner.queries import GetProbesDiff
 from diamond_miner.queries.delete_probes import DeleteProbes
-from diamond_miner.test import client
+from diamond_miner.test import client, create_tables
 
 
 def test_mda_probes_lite():
@@ -182,3 +188,79 @@ def test_next_round_probes_multi_protocol():
             )
 
     assert sorted(probes_for_round(1)) == sorted(target_specs)
+
+
+def test_budget_dropped_probes_next_round():
+    measurement_id = "test_budget_next_round"
+    probe_dst_prefix = int(ip_address("::ffff:8.8.8.0"))
+    create_tables(client, measurement_id)
+    insert_probe_counts(client, measurement_id, 1, [("8.8.8.0/24", "icmp", [1, 2], 6)])
+    plan = plan_round(client, measurement_id, 1, budget=4)
+    probes = list(
+        probe_generator_from_database(
+            client, measurement_id, 1, allocation=plan.allocation
+        )
+    )
+    assert sorted((probe[0], probe[3]) for probe in probes) == [
+        (probe_dst_prefix + flow_id, ttl) for flow_id in range(2) for ttl in range(1, 3)
+    ]
+    # The generator does not write to the database, the allocation is recorded once the probes are sent.
+    (row,) = GetProbesDiff(round_eq=1, sent=True).execute(client, measurement_id)
+    assert row["probes_per_ttl"] == [[1, 6, 0], [2, 6, 0]]
+    insert_allocation(client, measurement_id, 1, plan.allocation)
+    (row,) = GetProbesDiff(round_eq=1, sent=True).execute(client, measurement_id)
+    assert row["probes_per_ttl"] == [[1, 2, 0], [2, 2, 0]]
+    # No new links are discovered, so the same number of probes is requested at round 2:
+    # the probes dropped at round 1 are sent.
+    insert_probe_counts(client, measurement_id, 2, [("8.8.8.0/24", "icmp", [1, 2], 6)])
+    probes = list(probe_generator_from_database(client, measurement_id, 2))
+    assert sorted((probe[0], probe[3]) for probe in probes) == [
+        (probe_dst_prefix + flow_id, ttl)
+        for flow_id in range(2, 6)
+        for ttl in range(1, 3)
+    ]
+
+
+def test_plan_round():
+    measurement_id = "test_nsdi_lite"
+    DeleteProbes(round_eq=2).execute(client, measurement_id)
+    insert_mda_probe_counts(
+        client=client,
+        measurement_id=measurement_id,
+        previous_round=1,
+        adaptive_eps=False,
+    )
+    plan = plan_round(client, measurement_id, 2)
+    probes = list(probe_generator_from_database(client, measurement_id, 2))
+    assert plan.probes == len(probes) == 20
+    assert plan.probes_per_protocol == {"icmp": 20}
+    assert plan.probes_per_ttl == {
+        ttl: sum(probe[3] == ttl for probe in probes) for ttl in range(1, 5)
+    }
+    # The plan takes into account the same limits as the generators:
+    # 9 probes are allocated, but at most 8 flows can be sent per TTL.
+    mapper = SequentialFlowMapper(prefix_size=4)
+    plan = plan_round(
+        client, measurement_id, 2, max_port_offset=4, prefix_size_v4=4, budget=9
+    )
+    probes = list(
+        probe_generator_from_database(
+            client,
+            measurement_id,
+            2,
+            mapper_v4=mapper,
+            max_port_offset=4,
+            allocation=plan.allocation,
+        )
+    )
+    assert plan.probes == len(probes) == 8
+    assert plan.probes_per_ttl == {
+        ttl: sum(probe[3] == ttl for probe in probes) for ttl in range(1, 5)
+    }
+    DeleteProbes(round_eq=2).execute(client, measurement_id)
+    insert_mda_probe_counts(
+        client=client,
+        measurement_id=measurement_id,
+        previous_round=1,
+        adaptive_eps=False,
+    )
@@ -1,12 +1,18 @@
+import json
 from io import TextIOWrapper
 from ipaddress import ip_address
 
 from zstandard import ZstdDecompressor
 
 from diamond_miner.defaults import DEFAULT_PREFIX_SIZE_V4, DEFAULT_PREFIX_SIZE_V6
-from diamond_miner.generators import probe_generator_parallel
-from diamond_miner.insert import insert_mda_probe_counts
+from diamond_miner.generators import (
+    probe_generator_from_database,
+    probe_generator_parallel,
+)
+from diamond_miner.insert import insert_allocation, insert_mda_probe_counts
 from diamond_miner.mappers import SequentialFlowMapper
+from diamond_miner.planning import plan_round
+from diamond_miner.queries import GetProbesDiff
 from diamond_miner.queries.delete_probes import DeleteProbes
 from diamond_miner.test import client
 
@@ -38,6 +44,7 @@ def test_mda_probes_parallel(tmp_path):
             probe_ttl_geq=1,
             probe_ttl_leq=32,
             n_workers=4,
+            trace_filepath=tmp_path / f"trace-{round_}.json",
         )
         probes = []
         with filepath.open("rb") as f:
@@ -91,3 +98,111 @@ def test_mda_probes_parallel(tmp_path):
 
     # Round 3 -> 4, 0 probes
     assert probes_for_round(3) == []
+
+
+def test_mda_probes_parallel_trace(tmp_path):
+    measurement_id = "test_nsdi_lite"
+    DeleteProbes(round_eq=2).execute(client, measurement_id)
+    insert_mda_probe_counts(
+        client=client,
+        measurement_id=measurement_id,
+        previous_round=1,
+        adaptive_eps=False,
+    )
+    trace_filepath = tmp_path / "trace.json"
+    probe_generator_parallel(
+        filepath=tmp_path / "probes.csv.zst",
+        client=client,
+        measurement_id=measurement_id,
+        round_=2,
+        n_workers=2,
+        trace_filepath=trace_filepath,
+    )
+    events = json.loads(trace_filepath.read_text())["traceEvents"]
+    names = {event["name"] for event in events if event["ph"] == "X"}
+    assert names >= {
+        "subsets",
+        "workers",
+        "worker",
+        "query",
+        "expansion",
+        "shuffle",
+        "compress",
+        "merge",
+    }
+    processes = {event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert processes == {"probe_generator_parallel", "worker"}
+
+
+def test_mda_probes_parallel_budget(tmp_path):
+    measurement_id = "test_nsdi_lite"
+    probe_dst_prefix = int(ip_address("::ffff:200.0.0.0"))
+    DeleteProbes(round_eq=2).execute(client, measurement_id)
+    insert_mda_probe_counts(
+        client=client,
+        measurement_id=measurement_id,
+        previous_round=1,
+        adaptive_eps=False,
+    )
+    filepath = tmp_path / "probes.csv.zst"
+    # 5 probes are requested at TTL 1-4, the budget is shared between the TTLs.
+    plan = plan_round(client, measurement_id, 2, budget=8)
+    n_probes = probe_generator_parallel(
+        filepath=filepath,
+        client=client,
+        measurement_id=measurement_id,
+        round_=2,
+        n_workers=2,
+        allocation=plan.allocation,
+    )
+    assert n_probes == 8
+    with filepath.open("rb") as f:
+        text = TextIOWrapper(ZstdDecompressor().stream_reader(f), encoding="utf-8")
+        probes = sorted(
+            (int(ip_address(line.split(",")[0])), int(line.split(",")[3]))
+            for line in text
+        )
+    assert probes == [
+        (probe_dst_prefix + flow_id, ttl)
+        for flow_id in range(6, 8)
+        for ttl in range(1, 5)
+    ]
+    # The number of probes sent is recorded for the next round.
+    insert_allocation(client, measurement_id, 2, plan.allocation)
+    (row,) = GetProbesDiff(round_eq=2, sent=True).execute(client, measurement_id)
+    assert sorted(row["probes_per_ttl"]) == [[ttl, 8, 6] for ttl in range(1, 5)]
+    DeleteProbes(round_eq=2).execute(client, measurement_id)
+    insert_mda_probe_counts(
+        client=client,
+        measurement_id=measurement_id,
+        previous_round=1,
+        adaptive_eps=False,
+    )
+
+
+def test_mda_probes_parallel_cap_max_ttl(tmp_path):
+    filepath = tmp_path / "probes.csv.zst"
+    expected = list(
+        probe_generator_from_database(client, "test_max_ttl", 2, cap_max_ttl=True)
+    )
+    for budget in (None, 100):
+        plan = plan_round(client, "test_max_ttl", 2, cap_max_ttl=True, budget=budget)
+        n_probes = probe_generator_parallel(
+            filepath=filepath,
+            client=client,
+            measurement_id="test_max_ttl",
+            round_=2,
+            n_workers=2,
+            cap_max_ttl=True,
+            allocation=plan.allocation,
+        )
+        with filepath.open("rb") as f:
+            text = TextIOWrapper(ZstdDecompressor().stream_reader(f), encoding="utf-8")
+            ttls = {}
+            for line in text:
+                dst_addr, _, _, ttl, _ = line.strip().split(",")
+                prefix = str(ip_address(dst_addr)).rsplit(".", 1)[0]
+                ttls.setdefault(prefix, set()).add(int(ttl))
+        assert n_probes == len(expected)
+        # The destination replied at TTL 4 in 200.0.0.0/24, the last reply is at TTL 2 in 201.0.0.0/24.
+        assert ttls == {"::ffff:200.0.0": {1, 2, 3, 4}, "::ffff:201.0.0": {1, 2, 3}}
@@ -0,0 +1,108 @@
+import json
+import subprocess
+import sys
+
+import diamond_miner.generators
+import diamond_miner.queries
+
+# Modules that must not be imported by `from diamond_miner.generators import probe_generator`.
+HEAVY_MODULES = (
+    "concurrent.futures",
+    "httpx",
+    "pych_client",
+    "pygfc",
+    "zstandard",
+    "diamond_miner.queries.query",
+)
+
+# Modules that must not be imported by `import diamond_miner`.
+PACKAGE_HEAVY_MODULES = (
+    "diamond_miner.queries",
+    "numpy",
+    "pych_client",
+)
+
+SCRIPT = """
+import json, sys
+{}
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+# Import `pych_client` after `statement`, with `-X importtime`.
+# The markers delimit the imports of each statement in the output.
+TIME_SCRIPT = """
+import sys
+print("diamond_miner", file=sys.stderr, flush=True)
+{}
+print("pych_client", file=sys.stderr, flush=True)
+import pych_client
+"""
+
+
+def import_times(statement: str) -> dict[str, int]:
+    """
+    Total import time of `statement` and of `import pych_client` executed after it
+    in the same process, in microseconds, as reported by `python -X importtime`.
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", TIME_SCRIPT.format(statement)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    times: dict[str, int] = {}
+    section = None
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:"):
+            section = line.strip()
+            times[section] = 0
+            continue
+        _, cumulative, name = line.split("|")
+        # Only count the top-level imports, which include their dependencies.
+        if section and cumulative.strip().isdigit() and not name.startswith("  "):
+            times[section] += int(cumulative)
+    return times
+
+
+def imported_modules(statement: str) -> list[str]:
+    output = subprocess.run(
+        [sys.executable, "-c", SCRIPT.format(statement)],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    return json.loads(output.stdout)
+
+
+def test_lazy_attributes():
+    for module in (diamond_miner.generators, diamond_miner.queries):
+        for name in module.__all__:
+            assert getattr(module, name).__name__ == name
+        assert set(module.__all__) <= set(dir(module))
+
+
+def test_import_heavy_modules():
+    modules = imported_modules("from diamond_miner.generators import probe_generator")
+    for module in HEAVY_MODULES:
+        assert module not in modules
+
+
+def test_import_package():
+    modules = imported_modules("import diamond_miner")
+    for module in PACKAGE_HEAVY_MODULES:
+        assert module not in modules
+
+
+def test_import_time():
+    # The absolute import time depends on the machine, so it is compared with
+    # the import time of the ClickHouse client, which is what the lazy imports avoid.
+    # It is currently about a quarter of it.
+    ratio = min(
+        times["diamond_miner"] / max(times["pych_client"], 1)
+        for times in (
+            import_times("from diamond_miner.generators import probe_generator")
+            for _ in range(3)
+        )
+    )
+    assert ratio < 1
@@ -0,0 +1,69 @@
+import json
+
+from diamond_miner.generators import (
+    probe_generator,
+    probe_generator_by_flow,
+    probe_generator_from_rows,
+)
+from diamond_miner.metrics import MetricsRegistry, metrics
+
+
+def test_histogram_prometheus():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("duration_seconds", buckets=(1,), query="Test")
+    histogram.observe(0.5)
+    histogram.observe(2)
+    assert registry.to_prometheus().splitlines() == [
+        "# TYPE diamond_miner_duration_seconds histogram",
+        'diamond_miner_duration_seconds_bucket{query="Test",le="1"} 1',
+        'diamond_miner_duration_seconds_bucket{query="Test",le="+Inf"} 2',
+        'diamond_miner_duration_seconds_sum{query="Test"} 2.5',
+        'diamond_miner_duration_seconds_count{query="Test"} 2',
+    ]
+    assert json.loads(registry.to_json())["histograms"] == [
+        {
+            "name": "duration_seconds",
+            "labels": {"query": "Test"},
+            "buckets": {"1": 1, "+Inf": 2},
+            "count": 2,
+            "sum": 2.5,
+        }
+    ]
+
+
+def test_probe_generator_metrics():
+    counter = metrics.counter("probes_total", generator="probe_generator")
+    before = counter.value
+    probes = list(
+        probe_generator(
+            prefixes=[("8.8.8.0/24", "icmp")], flow_ids=range(6), ttls=range(2, 4)
+        )
+    )
+    assert counter.value - before == len(probes) == 12
+    assert metrics.gauge("probes_per_second", generator="probe_generator").value > 0
+
+
+def test_probe_generator_by_flow_metrics():
+    counter = metrics.counter("probes_total", generator="probe_generator_by_flow")
+    before = counter.value
+    probes = list(
+        probe_generator_by_flow(
+            prefixes=[("8.8.8.0/24", "icmp", range(2, 5))], flow_ids=range(6)
+        )
+    )
+    assert counter.value - before == len(probes) == 18
+
+
+def test_probe_generator_from_rows_metrics():
+    counter = metrics.counter("probes_total", generator="probe_generator_from_rows")
+    before = counter.value
+    rows = [
+        {
+            "probe_protocol": 1,
+            "probe_dst_prefix": "::ffff:8.8.8.0",
+            "probes_per_ttl": [[1, 258, 250], [2, 6, 0]],
+        }
+    ]
+    # The flows whose port offset exceeds `max_port_offset` are not counted.
+    probes = list(probe_generator_from_rows(rows, max_port_offset=0))
+    assert counter.value - before == len(probes) == 12
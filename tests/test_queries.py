@@ -87,6 +87,74 @@ def test_get_mda_probes_stateful_nsdi():
     """
 
 
+def test_get_mda_probes_full_nsdi():
+    """
+    Check the full Diamond-Miner computation by hand on the unbalanced nested
+    load balancer of `test_nsdi_lite` after round 2, with ε = 0.05.
+    The vertices, their number of successors k and their number of flows are:
+
+    - TTL 1: 150.0.1.1 (k=2, 11 flows)
+    - TTL 2: 150.0.2.1 (k=1, 7 flows), 150.0.3.1 (k=2, 4 flows)
+    - TTL 3: 150.0.4.1 (k=1, 7 flows), 150.0.5.1 (k=1, 3 flows), 150.0.7.1 (k=1, 1 flow)
+
+    so that 11 flows reached each TTL, and with n_2 = 6 and n_3 = 11
+    (the stopping points to discover a second and a third successor),
+    D_h(v) = n_{k+1} * 11 / flows(v):
+
+    - TTL 1: D(150.0.1.1) = 11 * 11 / 11 = 11
+    - TTL 2: D(150.0.2.1) = 6 * 11 / 7 ≈ 9.4, D(150.0.3.1) = 11 * 11 / 4 = 30.25
+    - TTL 3: D(150.0.4.1) = 6 * 11 / 7 ≈ 9.4, D(150.0.5.1) = 6 * 11 / 3 = 22, D(150.0.7.1) = 6 * 11 / 1 = 66
+
+    The number of probes at TTL h is the maximum of ⌈D_h(v)⌉ at TTL h and TTL h-1,
+    since the probes at TTL h also discover the successors of the vertices at TTL h-1.
+
+    >>> from diamond_miner.mda import stopping_point
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import GetMDAProbes
+    >>> stopping_point(2, 0.05), stopping_point(3, 0.05)
+    (6, 11)
+    >>> query = GetMDAProbes(round_leq=2, adaptive_eps=False, dminer_lite=False)
+    >>> row = query.execute(client, 'test_nsdi_lite')[0]
+    >>> row["TTLs"]
+    [1, 2, 3, 4]
+    >>> row["cumulative_probes"]
+    [11, 31, 66, 66]
+    """
+
+
+def test_get_mda_probes_full_nested():
+    """
+    On a wide nested load balancer, where 64 flows go through a vertex with 4 successors,
+    each of them with 8 successors (32 vertices), each of them with a single successor,
+    the full Diamond-Miner computation sends fewer probes than the lite heuristic:
+    at TTL 2, `D = n_9 * 4 = 180` instead of `n_33 = 211`, and at TTL 3 `D = n_2 * 32 = 192`.
+
+    >>> from diamond_miner.mda import stopping_point
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import CreateTables, DropTables, GetMDAProbes, links_table
+    >>> stopping_point(2, 0.05), stopping_point(9, 0.05), stopping_point(33, 0.05)
+    (6, 45, 211)
+    >>> measurement_id = "test_nested_load_balancer"
+    >>> _ = DropTables().execute(client, measurement_id)
+    >>> _ = CreateTables().execute(client, measurement_id)
+    >>> links = []
+    >>> for flow in range(64):
+    ...     nodes = ["150.0.0.1", f"150.0.1.{flow % 4}", f"150.0.2.{flow % 32}", "150.0.3.1"]
+    ...     for ttl in range(1, 4):
+    ...         links.append(
+    ...             f"(1, '::ffff:100.0.0.1', '::ffff:200.0.0.0', '::ffff:200.0.0.1', {24000 + flow}, 33434, "
+    ...             f"1, 1, {ttl}, {ttl + 1}, '::ffff:{nodes[ttl - 1]}', '::ffff:{nodes[ttl]}')"
+    ...         )
+    >>> _ = client.text(f"INSERT INTO {links_table(measurement_id)} VALUES {','.join(links)}")
+    >>> for dminer_lite in (True, False):
+    ...     query = GetMDAProbes(round_leq=1, adaptive_eps=False, dminer_lite=dminer_lite)
+    ...     [row] = query.execute(client, measurement_id)
+    ...     print(row["cumulative_probes"], sum(row["cumulative_probes"]))
+    [21, 211, 211, 211] 654
+    [21, 180, 192, 192] 585
+    """
+
+
 # TODO: Make this test pass
 #  def test_get_mda_probes_star():
 #  """
@@ -108,3 +176,480 @@ def test_get_mda_probes_stateful_nsdi():
 #  >>> GetMDAProbes(round_leq=2, adaptive_eps=False).execute(client, 'test_star_node_star')
 #  []
 #      """
+
+
+def test_get_mda_probes_star_ttls():
+    """
+    In this measurement, no replies are received at TTL 2 by the 6 flows sent at round 1.
+    The number of probes of this TTL is kept to the number of probes sent at round 1.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import GetMDAProbes
+    >>> for dminer_lite in (True, False):
+    ...     for star_ttls_threshold in (None, 6, 7):
+    ...         query = GetMDAProbes(
+    ...             round_leq=1,
+    ...             dminer_lite=dminer_lite,
+    ...             filter_partial=False,
+    ...             star_ttls_threshold=star_ttls_threshold,
+    ...         )
+    ...         row = query.execute(client, 'test_star_node_star')[0]
+    ...         print(dminer_lite, star_ttls_threshold, row["TTLs"], row["cumulative_probes"])
+    True None [1, 2, 3] [7, 12, 12]
+    True 6 [1, 2, 3] [7, 6, 12]
+    True 7 [1, 2, 3] [7, 12, 12]
+    False None [1, 2, 3] [7, 12, 12]
+    False 6 [1, 2, 3] [7, 6, 12]
+    False 7 [1, 2, 3] [7, 12, 12]
+
+    The threshold can be overridden per prefix:
+    >>> for star_ttls_threshold, star_ttls_thresholds in (
+    ...     (None, (("200.0.0.0/24", 6),)),
+    ...     (None, (("201.0.0.0/24", 6),)),
+    ...     (6, (("200.0.0.0/24", 0),)),
+    ... ):
+    ...     query = GetMDAProbes(
+    ...         round_leq=1,
+    ...         filter_partial=False,
+    ...         star_ttls_threshold=star_ttls_threshold,
+    ...         star_ttls_thresholds=star_ttls_thresholds,
+    ...     )
+    ...     row = query.execute(client, 'test_star_node_star')[0]
+    ...     print(star_ttls_threshold, star_ttls_thresholds, row["cumulative_probes"])
+    None (('200.0.0.0/24', 6),) [7, 6, 12]
+    None (('201.0.0.0/24', 6),) [7, 12, 12]
+    6 (('200.0.0.0/24', 0),) [7, 12, 12]
+    """
+
+
+def test_get_mda_probes_exclude_loops():
+    """
+    In this measurement, the prefix 201.0.0.0 has a loop at TTL 3.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import GetMDAProbes
+    >>> def probes(query):
+    ...     rows = query.execute(client, 'test_invalid_prefixes')
+    ...     return sorted((row["probe_dst_prefix"], row["TTLs"], row["cumulative_probes"]) for row in rows)
+    >>> probes(GetMDAProbes(round_leq=1))
+    [('::ffff:200.0.0.0', [1, 2], [6, 6]), ('::ffff:201.0.0.0', [1, 2, 3], [6, 6, 6])]
+    >>> probes(GetMDAProbes(round_leq=1, exclude_loops=True))
+    [('::ffff:200.0.0.0', [1, 2], [6, 6]), ('::ffff:201.0.0.0', [1, 2], [6, 6])]
+    """
+
+
+def test_loops_every_flow():
+    """
+    Only the TTLs that loop in every flow of a prefix are excluded:
+    in 200.0.0.0/24, the first flow loops at TTL 3-4 and the second at TTL 4-5,
+    and in 201.0.0.0/24, the second flow does not loop.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateTables,
+    ...     DropTables,
+    ...     GetPrefixesFromResults,
+    ...     results_table,
+    ... )
+    >>> measurement_id = "test_loops"
+    >>> _ = DropTables().execute(client, measurement_id)
+    >>> _ = CreateTables(materialized_views=True).execute(client, measurement_id)
+    >>> hops = {
+    ...     ("200.0.0.1", 24000): ["150.0.0.1", "150.0.0.2", "150.0.0.1", "150.0.0.2"],
+    ...     ("200.0.0.1", 24001): ["150.0.0.1", "150.0.0.2", "150.0.0.3", "150.0.0.2", "150.0.0.3"],
+    ...     ("201.0.0.1", 24000): ["150.0.0.1", "150.0.0.2", "150.0.0.1"],
+    ...     ("201.0.0.1", 24001): ["150.0.0.1", "150.0.0.2", "150.0.0.3"],
+    ... }
+    >>> values = ", ".join(
+    ...     f"(0, 1, '::ffff:100.0.0.1', '::ffff:{dst}', {port}, 33434, {ttl}, {ttl}, '::ffff:{addr}', 1, 11, 0, 250, 0, [], 0.0, 1)"
+    ...     for (dst, port), addrs in hops.items()
+    ...     for ttl, addr in enumerate(addrs, start=1)
+    ... )
+    >>> _ = client.text(f"INSERT INTO {results_table(measurement_id)} VALUES {values}")
+    >>> for from_flows in (False, True):
+    ...     rows = GetPrefixesFromResults(from_flows=from_flows).execute(client, measurement_id)
+    ...     print(sorted((x["probe_dst_prefix"], x["has_loops"], x["loop_min_ttl"], x["loop_max_ttl"]) for x in rows))
+    [('::ffff:200.0.0.0', 1, 4, 4), ('::ffff:201.0.0.0', 1, 0, 0)]
+    [('::ffff:200.0.0.0', 1, 4, 4), ('::ffff:201.0.0.0', 1, 0, 0)]
+    """
+
+
+def test_create_prefixes_table_migration():
+    """
+    The loop columns are added to the prefixes tables created without them.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import CreatePrefixesTable, prefixes_table
+    >>> table = prefixes_table("test_prefixes_migration")
+    >>> _ = client.text(f"DROP TABLE IF EXISTS {table}")
+    >>> _ = client.text(f'''
+    ... CREATE TABLE {table}
+    ... (probe_protocol UInt8, probe_src_addr IPv6, probe_dst_prefix IPv6, has_amplification UInt8, has_loops UInt8)
+    ... ENGINE MergeTree ORDER BY (probe_protocol, probe_src_addr, probe_dst_prefix)
+    ... ''')
+    >>> CreatePrefixesTable().execute(client, "test_prefixes_migration")
+    []
+    >>> [row["name"] for row in client.json(f"DESCRIBE TABLE {table}")][-2:]
+    ['loop_min_ttl', 'loop_max_ttl']
+    """
+
+
+def test_get_links_from_results_incremental():
+    """
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import GetLinksFromResults
+    >>> def links(query):
+    ...     return {tuple(row.values()) for row in query.execute(client, 'test_nsdi_example')}
+    >>> full = set.union(*(links(GetLinksFromResults(round_leq=r)) for r in range(1, 4)))
+    >>> incremental = set.union(*(links(GetLinksFromResults(incremental_round=r)) for r in range(1, 4)))
+    >>> len(full), incremental == full
+    (58, True)
+
+    Each link is emitted during a single round:
+    >>> sum(len(GetLinksFromResults(incremental_round=r).execute(client, 'test_nsdi_example')) for r in range(1, 4))
+    58
+    >>> sum(len(GetLinksFromResults(incremental_round=r, window_functions=True).execute(client, 'test_nsdi_example')) for r in range(1, 4))
+    58
+    >>> incremental == set.union(*(links(GetLinksFromResults(incremental_round=r, window_functions=True)) for r in range(1, 4)))
+    True
+    """
+
+
+def test_get_prefixes_from_results():
+    """
+    Compare the single-pass query with the amplification and loops queries.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     GetPrefixesFromResults,
+    ...     GetPrefixesWithAmplification,
+    ...     GetPrefixesWithLoops,
+    ... )
+    >>> def prefixes(query, measurement_id, column):
+    ...     rows = query.execute(client, measurement_id)
+    ...     return {row["probe_dst_prefix"] for row in rows if row[column]}
+    >>> for measurement_id in ("test_invalid_prefixes", "test_nsdi_example", "test_count_replies"):
+    ...     for query, column in (
+    ...         (GetPrefixesWithAmplification(), "has_amplification"),
+    ...         (GetPrefixesWithLoops(), "has_loops"),
+    ...     ):
+    ...         expected = prefixes(query, measurement_id, column) - {"::"}
+    ...         actual = prefixes(GetPrefixesFromResults(), measurement_id, column)
+    ...         assert actual == expected, (measurement_id, column)
+    """
+
+
+def test_materialized_views():
+    """
+    Compare the links and prefixes computed from the flows table with the ones
+    computed from the results table.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateTables,
+    ...     DropTables,
+    ...     GetLinksFromResults,
+    ...     GetPrefixesFromResults,
+    ...     InsertPrefixes,
+    ...     results_table,
+    ... )
+    >>> def rows(query, measurement_id):
+    ...     return {tuple(row.values()) for row in query.execute(client, measurement_id)}
+    >>> for measurement_id in ("test_invalid_prefixes", "test_nsdi_example", "test_count_replies"):
+    ...     _ = DropTables().execute(client, "test_flows")
+    ...     _ = CreateTables(materialized_views=True).execute(client, "test_flows")
+    ...     # Insert the results in two batches to check that the flows are merged.
+    ...     for round_filter in ("round = 1", "round > 1"):
+    ...         _ = client.text(f"INSERT INTO {results_table('test_flows')} SELECT * FROM {results_table(measurement_id)} WHERE {round_filter}")
+    ...     _ = InsertPrefixes(from_flows=True).execute(client, "test_flows")
+    ...     for query in (GetPrefixesFromResults, GetLinksFromResults):
+    ...         expected = rows(query(), measurement_id)
+    ...         actual = rows(query(from_flows=True), "test_flows")
+    ...         assert actual == expected, (measurement_id, query)
+    """
+
+
+def test_summary_tables():
+    """
+    Compare the nodes and links read from the summary tables, filled round by round,
+    with the ones read from the results and links tables.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateLinksSummaryTable,
+    ...     CreateNodesSummaryTable,
+    ...     GetLinks,
+    ...     GetNodes,
+    ...     InsertLinksSummary,
+    ...     InsertNodesSummary,
+    ...     links_summary_table,
+    ...     nodes_summary_table,
+    ... )
+    >>> def rows(query, measurement_id):
+    ...     return {tuple(row.values()) for row in query.execute(client, measurement_id)}
+    >>> for measurement_id in ("test_invalid_prefixes", "test_nsdi_example"):
+    ...     for table in (nodes_summary_table, links_summary_table):
+    ...         _ = client.text(f"DROP TABLE IF EXISTS {table(measurement_id)}")
+    ...     _ = CreateNodesSummaryTable().execute(client, measurement_id)
+    ...     _ = CreateLinksSummaryTable().execute(client, measurement_id)
+    ...     for round_ in range(1, 4):
+    ...         _ = InsertNodesSummary(round_eq=round_).execute(client, measurement_id)
+    ...         _ = InsertLinksSummary(incremental_round=round_).execute(client, measurement_id)
+    ...     for query in (GetNodes, GetLinks):
+    ...         expected = rows(query(), measurement_id)
+    ...         actual = rows(query(summary=True), measurement_id)
+    ...         assert expected and actual == expected, (measurement_id, query)
+
+    The summary tables store the minimum TTLs:
+    >>> def min_ttls(rows, key, ttls):
+    ...     result = {}
+    ...     for row in rows:
+    ...         result[key(row)] = min(result.get(key(row), ttls(row)), ttls(row))
+    ...     return result
+    >>> link_key = lambda row: (row["near_addr"], row["far_addr"])
+    >>> link_ttls = lambda row: (row["near_ttl"], row["far_ttl"])
+    >>> links = GetLinks(include_metadata=True).execute(client, "test_nsdi_example")
+    >>> summary = GetLinks(include_metadata=True, summary=True).execute(client, "test_nsdi_example")
+    >>> min_ttls(summary, link_key, link_ttls) == min_ttls(links, link_key, link_ttls)
+    True
+    >>> GetNodes(include_first_round=True).execute(client, "test_nsdi_example")
+    Traceback (most recent call last):
+    ...
+    AssertionError: include_first_round requires summary=True
+    """
+
+
+def test_links_summary_first_round():
+    """
+    A link is first seen at the round of its most recent end.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateLinksSummaryTable,
+    ...     CreateTables,
+    ...     DropTables,
+    ...     InsertLinks,
+    ...     InsertLinksSummary,
+    ...     links_summary_table,
+    ...     results_table,
+    ... )
+    >>> measurement_id = "test_summary_rounds"
+    >>> _ = DropTables().execute(client, measurement_id)
+    >>> _ = client.text(f"DROP TABLE IF EXISTS {links_summary_table(measurement_id)}")
+    >>> _ = CreateTables().execute(client, measurement_id)
+    >>> _ = CreateLinksSummaryTable().execute(client, measurement_id)
+    >>> _ = client.text(f'''
+    ... INSERT INTO {results_table(measurement_id)}
+    ... VALUES (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.1', 24000, 33434, 1, 1, '::ffff:150.0.0.1', 1, 11, 0, 250, 0, [], 0.0, 1),
+    ...        (0, 1, '::ffff:100.0.0.1', '::ffff:200.0.0.1', 24000, 33434, 2, 2, '::ffff:150.0.1.1', 1, 11, 0, 250, 0, [], 0.0, 2)
+    ... ''')
+    >>> _ = InsertLinks().execute(client, measurement_id)
+    >>> for round_ in range(1, 3):
+    ...     _ = InsertLinksSummary(incremental_round=round_).execute(client, measurement_id)
+    >>> client.json(f'''
+    ... SELECT min(first_round) AS first_round FROM {links_summary_table(measurement_id)}
+    ... WHERE near_addr = toIPv6('::ffff:150.0.0.1') AND far_addr = toIPv6('::ffff:150.0.1.1')
+    ... ''')
+    [{'first_round': 2}]
+    """
+
+
+def test_convergence():
+    """
+    Count the new links discovered in each round, and check that the prefixes
+    where a round did not discover any new link are not probed anymore.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateConvergenceTable,
+    ...     GetMDAProbes,
+    ...     InsertConvergence,
+    ...     converged_prefixes_set,
+    ...     convergence_table,
+    ... )
+    >>> measurement_id = "test_nsdi_example"
+    >>> for table in (convergence_table, converged_prefixes_set):
+    ...     _ = client.text(f"DROP TABLE IF EXISTS {table(measurement_id)}")
+    >>> _ = CreateConvergenceTable().execute(client, measurement_id)
+    >>> for round_ in range(1, 4):
+    ...     _ = InsertConvergence(incremental_round=round_, filter_inter_round=True).execute(client, measurement_id)
+    ...     expected = GetMDAProbes(round_leq=round_).execute(client, measurement_id)
+    ...     actual = GetMDAProbes(round_leq=round_, skip_converged=True).execute(client, measurement_id)
+    ...     print(round_, len(expected), len(actual), actual == expected)
+    1 1 1 True
+    2 1 1 True
+    3 1 0 False
+    >>> rows = client.json(f"SELECT round, new_links FROM {convergence_table(measurement_id)} ORDER BY round")
+    >>> [tuple(row.values()) for row in rows]
+    [(1, 6), (2, 2), (3, 0)]
+    """
+
+
+def test_discovery_rates_decreasing_counts():
+    """
+    The TTLs whose number of probes decreased from a round to the next do not send probes.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import CreateTables, DropTables, GetDiscoveryRates, probes_table
+    >>> measurement_id = "test_discovery_rates_decreasing_counts"
+    >>> _ = DropTables().execute(client, measurement_id)
+    >>> _ = CreateTables().execute(client, measurement_id)
+    >>> _ = client.text(f'''
+    ... INSERT INTO {probes_table(measurement_id)} VALUES
+    ... (1, '::ffff:200.0.0.0', 1, 6, 1), (1, '::ffff:200.0.0.0', 2, 2, 1),
+    ... (1, '::ffff:200.0.0.0', 1, 0, 2), (1, '::ffff:200.0.0.0', 2, 10, 2)
+    ... ''')
+    >>> [row["probes"] for row in GetDiscoveryRates(incremental_round=2).execute(client, measurement_id)]
+    [8]
+    """
+
+
+def test_convergence_budget():
+    """
+    A prefix that did not discover new links is not frozen if it was not probed during the round,
+    or if some of its probes were dropped by a probe budget.
+
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateTables,
+    ...     DropTables,
+    ...     GetMDAProbes,
+    ...     InsertConvergence,
+    ...     links_table,
+    ...     probes_table,
+    ... )
+    >>> measurement_id = "test_convergence_budget"
+    >>> def converged(probes_filter, extra_probes=""):
+    ...     _ = DropTables().execute(client, measurement_id)
+    ...     _ = CreateTables(convergence_table=True).execute(client, measurement_id)
+    ...     _ = client.text(f"INSERT INTO {links_table(measurement_id)} SELECT * FROM {links_table('test_nsdi_example')}")
+    ...     _ = client.text(f"INSERT INTO {probes_table(measurement_id)} SELECT * FROM {probes_table('test_nsdi_example')} WHERE {probes_filter}")
+    ...     if extra_probes:
+    ...         _ = client.text(f"INSERT INTO {probes_table(measurement_id)} VALUES {extra_probes}")
+    ...     _ = InsertConvergence(incremental_round=3, filter_inter_round=True).execute(client, measurement_id)
+    ...     return not GetMDAProbes(round_leq=3, skip_converged=True).execute(client, measurement_id)
+    >>> converged("1")
+    True
+
+    At round 3, only 20 probes out of 27 were sent at TTL 3:
+    >>> converged("1", "(1, '::ffff:200.0.0.0', 3, 20, 3)")
+    False
+
+    No probes were sent at round 3:
+    >>> converged("round < 3")
+    False
+    """
+
+
+def test_private_prefixes_dictionary():
+    """
+    Compare the classification of the private addresses with and without the dictionary,
+    around the bounds of each private prefix.
+
+    >>> from ipaddress import ip_network
+    >>> from diamond_miner.defaults import PRIVATE_PREFIXES
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import CreateTables, DropTables, results_table
+    >>> addrs = set()
+    >>> for prefix in map(ip_network, PRIVATE_PREFIXES):
+    ...     first, last = int(prefix[0]), int(prefix[-1])
+    ...     for addr in (first - 1, first, last, last + 1):
+    ...         if 0 <= addr < 2**prefix.max_prefixlen:
+    ...             addr = type(prefix[0])(addr)
+    ...             addrs.add(f"::ffff:{addr}" if addr.version == 4 else str(addr))
+    >>> values = ", ".join(f"('{addr}', '{addr}')" for addr in addrs)
+    >>> def private(measurement_id, **kwargs):
+    ...     _ = DropTables().execute(client, measurement_id)
+    ...     _ = CreateTables(**kwargs).execute(client, measurement_id)
+    ...     table = results_table(measurement_id)
+    ...     _ = client.text(f"INSERT INTO {table} (probe_dst_addr, reply_src_addr) VALUES {values}")
+    ...     rows = client.json(f"SELECT reply_src_addr, private_probe_dst_prefix, private_reply_src_addr FROM {table}")
+    ...     return {tuple(row.values()) for row in rows}
+    >>> expected = private("test_private_ranges")
+    >>> actual = private("test_private_dictionary", private_prefixes_from_dictionary=True)
+    >>> actual == expected, len({row[0] for row in expected if row[2]})
+    (True, 34)
+    """
+
+
+def test_invalid_prefixes_sets():
+    """
+    Compare the queries filtering the invalid prefixes with the sets,
+    and with the subqueries on the prefixes table.
+
+    >>> from dataclasses import replace
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import (
+    ...     CreateInvalidPrefixesSets,
+    ...     GetLinks,
+    ...     GetLinksFromResults,
+    ...     GetNodes,
+    ...     InsertInvalidPrefixesSets,
+    ... )
+    >>> def rows(query, measurement_id):
+    ...     return {tuple(row.values()) for row in query.execute(client, measurement_id)}
+    >>> for measurement_id in ("test_invalid_prefixes", "test_nsdi_example"):
+    ...     _ = CreateInvalidPrefixesSets().execute(client, measurement_id)
+    ...     _ = InsertInvalidPrefixesSets().execute(client, measurement_id)
+    ...     for query in (
+    ...         GetLinks(filter_invalid_prefixes=True),
+    ...         GetNodes(filter_invalid_prefixes=True),
+    ...         GetLinksFromResults(ignore_invalid_prefixes=True),
+    ...     ):
+    ...         expected = rows(query, measurement_id)
+    ...         actual = rows(replace(query, invalid_prefixes_from_sets=True), measurement_id)
+    ...         assert expected and actual == expected, (measurement_id, query)
+    >>> len(rows(GetNodes(filter_invalid_prefixes=True, invalid_prefixes_from_sets=True), "test_invalid_prefixes"))
+    3
+    """
+
+
+def test_get_links_from_results_window_functions():
+    """
+    >>> from dataclasses import replace
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import GetLinksFromResults
+    >>> def links(query, measurement_id):
+    ...     return sorted(tuple(row.values()) for row in query.execute(client, measurement_id))
+    >>> for measurement_id in ("test_invalid_prefixes", "test_nsdi_example", "test_nsdi_lite", "test_star_node_star"):
+    ...     for query in (
+    ...         GetLinksFromResults(),
+    ...         GetLinksFromResults(round_leq=1),
+    ...         GetLinksFromResults(incremental_round=2),
+    ...     ):
+    ...         expected = links(query, measurement_id)
+    ...         actual = links(replace(query, window_functions=True), measurement_id)
+    ...         assert actual == expected, (measurement_id, query)
+    >>> len(links(GetLinksFromResults(window_functions=True), "test_nsdi_example"))
+    58
+    """
+
+
+def test_next_round_probes():
+    """
+    Compare the probes computed from the columnar links with the ones computed by `GetMDAProbes`.
+
+    >>> from itertools import product
+    >>> from diamond_miner.next_round import fetch_links, next_round_probes
+    >>> from diamond_miner.test import client
+    >>> from diamond_miner.queries import GetMDAProbes
+    >>> def rows(rows):
+    ...     return sorted((row["probe_protocol"], row["probe_dst_prefix"], row["TTLs"], row["cumulative_probes"]) for row in rows)
+    >>> n_rows = 0
+    >>> for measurement_id in ("test_invalid_prefixes", "test_multi_protocol", "test_nsdi_example", "test_nsdi_lite", "test_star_node_star"):
+    ...     for round_leq, adaptive_eps, filter_partial, target_epsilon in product((1, 2, 3), (False, True), (False, True), (0.05, 0.01)):
+    ...         query = GetMDAProbes(
+    ...             round_leq=round_leq,
+    ...             adaptive_eps=adaptive_eps,
+    ...             filter_partial=filter_partial,
+    ...             filter_virtual=filter_partial,
+    ...             filter_inter_round=True,
+    ...             target_epsilon=target_epsilon,
+    ...         )
+    ...         expected = rows(query.execute(client, measurement_id))
+    ...         actual = rows(next_round_probes(fetch_links(client, measurement_id, query), query))
+    ...         assert actual == expected, (measurement_id, query, actual, expected)
+    ...         n_rows += len(actual)
+    >>> n_rows > 0
+    True
+    """
@@ -1,12 +1,13 @@
 from collections.abc import Sequence
 from dataclasses import dataclass
-from ipaddress import ip_network
+from ipaddress import ip_address, ip_network
 
 import pytest
 from pych_client.exceptions import ClickHouseException
 
 from diamond_miner.defaults import UNIVERSE_SUBSET
 from diamond_miner.queries import Query
+from diamond_miner.queries.fragments import SUBSET_PARAMETER, ip_in
 from diamond_miner.test import client
 from diamond_miner.typing import IPNetwork
 
@@ -39,3 +40,163 @@ def test_execute_concurrent():
     assert ValidQuery().execute_concurrent(client, "", subsets=subsets) is None
     with pytest.raises(ClickHouseException):
         InvalidQuery().execute_concurrent(client, "", subsets=subsets)
+
+
+@dataclass(frozen=True)
+class SubsetQuery(Query):
+    def statement(
+        self, measurement_id: str, subset: IPNetwork = UNIVERSE_SUBSET
+    ) -> str:
+        return f"""
+        SELECT toString(addr) AS addr_str
+        FROM (SELECT arrayJoin([toIPv6('::ffff:8.8.8.8'), toIPv6('::ffff:9.9.9.9')]) AS addr)
+        WHERE {ip_in("addr", subset)}
+        ORDER BY addr
+        """
+
+
+def test_execute_compiled():
+    query = SubsetQuery()
+    assert query.compile("") is query.compile("")
+    rows = query.execute(
+        client,
+        "",
+        subsets=[ip_network("8.8.8.0/24"), ip_network("9.0.0.0/8"), UNIVERSE_SUBSET],
+    )
+    assert [row["addr_str"] for row in rows] == [
+        "::ffff:8.8.8.8",
+        "::ffff:9.9.9.9",
+        "::ffff:8.8.8.8",
+        "::ffff:9.9.9.9",
+    ]
+
+
+def test_subset_parameter():
+    # The subset used to compile the statements is a regular network.
+    assert SUBSET_PARAMETER == ip_network("100::/64")
+    assert SUBSET_PARAMETER[1] == ip_address("100::1")
+    assert SUBSET_PARAMETER != UNIVERSE_SUBSET
+    # An equal network is rendered with its own bounds.
+    rows = SubsetQuery().execute(client, "", subsets=[ip_network("100::/64")])
+    assert rows == []
+    rows = SubsetQuery().execute(client, "", subsets=[ip_network("8.0.0.0/7")])
+    assert [row["addr_str"] for row in rows] == ["::ffff:8.8.8.8", "::ffff:9.9.9.9"]
+
+
+def test_execute_columns():
+    from diamond_miner.format import format_ipv6
+    from diamond_miner.queries import GetNodes, GetResults
+
+    nodes = GetNodes().execute(client, "test_nsdi_example")
+    columns = GetNodes().execute_columns(client, "test_nsdi_example")
+    addrs = [
+        format_ipv6((int(hi) << 64) + int(lo)) for hi, lo in columns["reply_src_addr"]
+    ]
+    assert sorted(addrs) == sorted(node["reply_src_addr"] for node in nodes)
+
+    with pytest.raises(ValueError):
+        GetResults().execute_columns(client, "test_nsdi_example")
+    subsets = list(ip_network("::/0").subnets(prefixlen_diff=1))
+    batches = list(
+        GetResults().execute_iter_columns(
+            client,
+            "test_nsdi_example",
+            columns=["capture_timestamp", "probe_ttl", "reply_src_addr"],
+            subsets=subsets,
+        )
+    )
+    assert len(batches) == 2
+    assert sum(len(batch["probe_ttl"]) for batch in batches if batch) == 85
+
+
+def test_execute_pages():
+    from diamond_miner.queries import CreateResultsTable, GetResults
+
+    key = [
+        column.strip()
+        for column in CreateResultsTable.SORTING_KEY.split(",")
+        if column.strip() != "probe_dst_prefix"
+    ]
+    rows = GetResults().execute(client, "test_nsdi_example")
+    pages = list(
+        GetResults().execute_pages(client, "test_nsdi_example", key=key, page_size=7)
+    )
+    assert all(len(page) >= 7 for page in pages[:-1])
+    paged_rows = [row for page in pages for row in page]
+    assert len(paged_rows) == len(rows)
+    assert paged_rows == sorted(
+        paged_rows,
+        key=lambda row: [
+            ip_address(row[k]) if isinstance(row[k], str) else row[k] for k in key
+        ],
+    )
+
+    # Resume after the second page.
+    after = [pages[1][-1][k] for k in key]
+    resumed = GetResults().execute_pages(
+        client, "test_nsdi_example", key=key, page_size=7, after=after
+    )
+    assert [row for page in resumed for row in page] == [
+        row for page in pages[2:] for row in page
+    ]
+
+
+def test_execute_pages_links():
+    from diamond_miner.queries import GetLinks
+
+    key = [
+        "probe_protocol",
+        "probe_src_addr",
+        "probe_dst_prefix",
+        "near_addr",
+        "far_addr",
+    ]
+    query = GetLinks(include_probe=True)
+    rows = query.execute(client, "test_nsdi_example")
+    pages = list(query.execute_pages(client, "test_nsdi_example", key=key, page_size=3))
+    assert [len(page) for page in pages] == [3, 3, 2]
+    paged_rows = [row for page in pages for row in page]
+    assert sorted(map(str, paged_rows)) == sorted(map(str, rows))
+    assert paged_rows == sorted(
+        paged_rows,
+        key=lambda row: [
+            ip_address(row[k]) if isinstance(row[k], str) else row[k] for k in key
+        ],
+    )
+
+
+def test_execute_pages_prefixes():
+    from diamond_miner.queries import CreatePrefixesTable, GetInvalidPrefixes
+
+    query = GetInvalidPrefixes(include_probe=True)
+    pages = list(
+        query.execute_pages(
+            client,
+            "test_invalid_prefixes",
+            key=CreatePrefixesTable.SORTING_KEY,
+            page_size=1,
+        )
+    )
+    assert [len(page) for page in pages] == [1, 1]
+    assert [page[0]["probe_dst_prefix"] for page in pages] == [
+        "::ffff:201.0.0.0",
+        "::ffff:202.0.0.0",
+    ]
+
+
+def test_execute_pages_unsupported():
+    from diamond_miner.queries import (
+        CountLinksPerPrefix,
+        GetLinks,
+        GetMDAProbes,
+        InsertLinks,
+    )
+
+    for query in (
+        CountLinksPerPrefix(),
+        GetLinks(summary=True),
+        GetMDAProbes(),
+        InsertLinks(),
+    ):
+        with pytest.raises(AssertionError):
+            next(query.execute_pages(client, "test_nsdi_example", key="a", page_size=1))
@@ -1,10 +1,56 @@
 from dataclasses import dataclass
 
-from diamond_miner.utilities import available_cpus, common_parameters
+from diamond_miner.utilities import (
+    available_cpus,
+    cgroup_cpu_limit,
+    cgroup_memory_limit,
+    cgroup_paths,
+    common_parameters,
+    open_files_limit,
+)
 
 
-def test_available_cpus():
+def test_available_cpus(tmp_path):
     assert available_cpus() >= 1
+    (tmp_path / "cpu.max").write_text("50000 100000\n")
+    assert available_cpus(tmp_path) == 1
+
+
+def test_cgroup_v1(tmp_path):
+    (tmp_path / "cpu").mkdir()
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("400000\n")
+    (tmp_path / "cpu" / "cpu.cfs_period_us").write_text("100000\n")
+    (tmp_path / "memory").mkdir()
+    (tmp_path / "memory" / "memory.limit_in_bytes").write_text("1073741824\n")
+    assert cgroup_cpu_limit(tmp_path) == 4
+    assert cgroup_memory_limit(tmp_path) == 2**30
+    (tmp_path / "cpu" / "cpu.cfs_quota_us").write_text("-1\n")
+    (tmp_path / "memory" / "memory.limit_in_bytes").write_text("9223372036854771712\n")
+    assert cgroup_cpu_limit(tmp_path) is None
+    assert cgroup_memory_limit(tmp_path) is None
+
+
+def test_cgroup_nested(tmp_path):
+    # The limits of the cgroup of the process and of its ancestors apply.
+    proc_cgroup = tmp_path / "proc_cgroup"
+    proc_cgroup.write_text("0::/system.slice/app.service\n")
+    assert cgroup_paths(proc_cgroup) == {"": "/system.slice/app.service"}
+    (tmp_path / "system.slice" / "app.service").mkdir(parents=True)
+    (tmp_path / "system.slice" / "cpu.max").write_text("200000 100000\n")
+    (tmp_path / "system.slice" / "app.service" / "cpu.max").write_text("max 100000\n")
+    (tmp_path / "system.slice" / "app.service" / "memory.max").write_text(
+        "1073741824\n"
+    )
+    (tmp_path / "system.slice" / "memory.max").write_text("2147483648\n")
+    assert cgroup_cpu_limit(tmp_path, proc_cgroup) == 2
+    assert cgroup_memory_limit(tmp_path, proc_cgroup) == 2**30
+    # Without /proc/self/cgroup, only the root of the hierarchy is read.
+    assert cgroup_cpu_limit(tmp_path, tmp_path / "missing") is None
+
+
+def test_open_files_limit():
+    limit = open_files_limit()
+    assert limit is None or limit > 0
 
 
 def test_common_parameters():